@@ -1,8 +1,87 @@
-
-from fastapi import APIRouter
+import hmac
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.crud.ai_checks import finish_ai_check, get_ai_check_by_task
+from app.crud.jobs import enqueue_tender_jobs
+from app.crud.ai_result_cache import delete_cached_results, get_ai_cache_stats
+from app.db.database import get_db
+from app.models.tenders import Tender
+from app.schemas.ai import AICallback, AICacheStats, AICacheInvalidateResponse
+from app.services.ai_cache import ai_result_cache
+from app.services.ai_poller import TERMINAL_STATUSES
+from app.core.config import settings
+from app.core.logging_config import logger
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/status")
 async def ai_status():
-    return {"message": "AI endpoint is working"}
\ No newline at end of file
+    return {"message": "AI endpoint is working"}
+
+@router.post(
+    "/callback",
+    summary="Результат задачи AI",
+    description="Вызывается AI-сервисом, когда задача разбора документов завершена. Результат записывается в "
+                "ai_checks по task_id, а тендер ставится в очередь, чтобы конвейер продолжился с AI_PROCESSING. "
+                "Повторный вызов для уже завершённой задачи ничего не меняет. "
+                "Без настроенного AI_CALLBACK_TOKEN вызовы отклоняются."
+)
+async def ai_callback(
+    payload: AICallback,
+    x_ai_callback_token: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    if not settings.AI_CALLBACK_TOKEN:
+        logger.error(f"AI callback for task {payload.task_id} rejected: AI_CALLBACK_TOKEN is not configured")
+        raise HTTPException(status_code=401, detail="Callbacks are not accepted")
+    if not hmac.compare_digest(x_ai_callback_token or "", settings.AI_CALLBACK_TOKEN):
+        logger.error(f"Invalid AI callback token for task {payload.task_id}")
+        raise HTTPException(status_code=401, detail="Invalid or missing callback token")
+    if payload.status not in TERMINAL_STATUSES:
+        return {"status": "ignored"}
+
+    ai_check = await get_ai_check_by_task(db, payload.task_id)
+    if ai_check is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    response = json.dumps(payload.result if payload.result is not None else "No data", ensure_ascii=False)
+    if not await finish_ai_check(db, payload.task_id, payload.status, response, commit=False):
+        return {"status": "ignored"}
+    tender_type = await db.scalar(select(Tender.type).where(Tender.external_id == ai_check.tender_id))
+    await enqueue_tender_jobs(db, [(None, tender_type, ai_check.tender_id)])
+    logger.info(f"AI callback: task {payload.task_id} finished with status {payload.status}")
+    return {"status": "success"}
+
+@router.get(
+    "/cache/stats",
+    response_model=AICacheStats,
+    summary="Статистика кэша результатов AI",
+    description="Число записей кэша для текущей версии модели и сколько проверок было взято из кэша "
+                "или отправлено в AI."
+)
+async def ai_cache_stats(db: AsyncSession = Depends(get_db)):
+    stats = await get_ai_cache_stats(db, settings.AI_MODEL_VERSION)
+    total = stats["hits"] + stats["misses"]
+    return AICacheStats(model_version=settings.AI_MODEL_VERSION, hit_rate=stats["hits"] / total if total else 0.0,
+                        **stats)
+
+@router.delete(
+    "/cache",
+    response_model=AICacheInvalidateResponse,
+    summary="Сброс кэша результатов AI",
+    description="Удаляет записи кэша по хешу содержимого и/или версии модели, только устаревшие по TTL "
+                "или все. Воркеры перестают использовать свои копии записей в течение AI_CACHE_LOCAL_TTL секунд."
+)
+async def invalidate_ai_cache(
+    content_hash: Optional[str] = Query(None, description="Хеш содержимого документов"),
+    model_version: Optional[str] = Query(None, description="Версия модели"),
+    expired_only: bool = Query(False, description="Удалить только записи старше AI_CACHE_TTL"),
+    db: AsyncSession = Depends(get_db)
+):
+    deleted = await delete_cached_results(db, content_hash, model_version,
+                                          settings.AI_CACHE_TTL if expired_only else None)
+    ai_result_cache.clear()
+    logger.info(f"AI cache invalidated: {deleted} entries deleted")
+    return AICacheInvalidateResponse(deleted=deleted)
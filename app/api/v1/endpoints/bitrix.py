@@ -8,7 +8,7 @@ from app.crud.tenders import get_tender_by_id
 from app.db.database import get_db
 from app.core.logging_config import logger
 from app.core.config import settings
-import aiohttp
+from app.services.http_sessions import get_http_session
 
 router = APIRouter()
 
@@ -54,16 +54,16 @@ async def create_bitrix_lead(
     headers = {"Content-Type": "application/json"}
     payload = {"fields": lead_data.fields}
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.add.json", json=payload, headers=headers
-        ) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                lead_id = result.get("result")
-                logger.info(f"Lead created in Bitrix with ID {lead_id}")
-                return {"message": f"Lead created successfully with ID {lead_id}", "lead_id": lead_id}
-            else:
-                error_text = await resp.text()
-                logger.error(f"Failed to create lead in Bitrix: {resp.status}, {error_text}")
-                raise HTTPException(status_code=resp.status, detail=f"Failed to create lead: {error_text}")
\ No newline at end of file
+    session = get_http_session("bitrix")
+    async with session.post(
+        f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.add.json", json=payload, headers=headers
+    ) as resp:
+        if resp.status == 200:
+            result = await resp.json()
+            lead_id = result.get("result")
+            logger.info(f"Lead created in Bitrix with ID {lead_id}")
+            return {"message": f"Lead created successfully with ID {lead_id}", "lead_id": lead_id}
+        else:
+            error_text = await resp.text()
+            logger.error(f"Failed to create lead in Bitrix: {resp.status}, {error_text}")
+            raise HTTPException(status_code=resp.status, detail=f"Failed to create lead: {error_text}")
\ No newline at end of file
@@ -1,7 +1,34 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.scrape_stats import get_scrape_stats
+from app.db.database import get_db
+from app.schemas.document import ScrapeStatResponse
 
 router = APIRouter()
 
 @router.get("/status")
 async def documents_status():
-    return {"message": "Documents endpoint is working"}
\ No newline at end of file
+    return {"message": "Documents endpoint is working"}
+
+@router.get(
+    "/scrape_stats",
+    response_model=list[ScrapeStatResponse],
+    summary="Статистика скрапинга документов",
+    description="По каждому домену: сколько раз документы нашлись HTTP-запросом, сколько раз понадобился "
+                "браузер, сколько скрапингов не удалось, и оценка сэкономленного времени браузера."
+)
+async def scrape_stats(db: AsyncSession = Depends(get_db)):
+    stats = []
+    for row in await get_scrape_stats(db):
+        succeeded = row.http_success + row.browser_success
+        avg_browser = row.browser_seconds / (row.browser_success + row.failed) if row.browser_success + row.failed else 0.0
+        stats.append(ScrapeStatResponse(
+            domain=row.domain,
+            http_success=row.http_success,
+            browser_success=row.browser_success,
+            failed=row.failed,
+            browser_seconds=row.browser_seconds,
+            http_share=row.http_success / succeeded if succeeded else 0.0,
+            browser_seconds_saved=avg_browser * row.http_success,
+        ))
+    return stats
@@ -1,14 +1,28 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.db.database import get_db
+from app.db.database import get_db, AsyncSessionLocal
+from app.crud.filters import get_filter_stats
 from app.models.filters import Filter
-from app.schemas.filters import FilterCreate, Filter as FilterSchema, FilterListResponse, FilterShort
+from app.schemas.filters import FilterCreate, Filter as FilterSchema, FilterListResponse, \
+    FilterPreviewResponse, FilterStatsItem
+from app.schemas.tenders import TenderMatch
+from app.services.filter_engine import filter_cache, compile_formulas
+from app.services.formula_engine import FormulaError
+from app.services.filter_service import iter_filter_matches, preview_filter
+from app.core.config import settings
 from typing import Optional, List
 from sqlalchemy import func
 
 router = APIRouter()
 
+def check_formulas(filter: FilterCreate) -> None:
+    try:
+        compile_formulas(filter.formula, filter.formula_target)
+    except FormulaError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid formula: {str(e)}")
+
 @router.get("/", response_model=FilterListResponse)
 async def get_filters(
     page: int = Query(1, ge=1),
@@ -44,6 +58,42 @@ async def get_filters(
         "per_page": per_page
     }
 
+@router.post(
+    "/preview",
+    response_model=FilterPreviewResponse,
+    summary="Предпросмотр фильтра",
+    description="Оценивает фильтр, не сохраняя его, на тендерах его типа, поступивших за последние window_days "
+                "дней: сколько прошло и сколько отклонено, с примерами ID. Повторный запрос с тем же условием "
+                "и окном отдаётся из кэша."
+)
+async def preview(
+    filter: FilterCreate,
+    window_days: int = Query(30, ge=1, le=settings.FILTER_PREVIEW_MAX_DAYS, description="Окно в днях"),
+    db: AsyncSession = Depends(get_db)
+):
+    check_formulas(filter)
+    return await preview_filter(db, filter, window_days)
+
+@router.get(
+    "/stats",
+    response_model=List[FilterStatsItem],
+    summary="Статистика фильтров",
+    description="Для каждого фильтра: сколько раз проверялся, сколько раз совпал и пропустил тендер, "
+                "среднее время проверки. Рабочие процессы сбрасывают счётчики в БД периодически."
+)
+async def filter_stats(db: AsyncSession = Depends(get_db)):
+    items = []
+    for filter_obj, stat in await get_filter_stats(db):
+        item = FilterStatsItem(filter_id=filter_obj.id, title=filter_obj.title, type=filter_obj.type,
+                               parent_id=filter_obj.parent_id, priority=filter_obj.priority,
+                               success_action=filter_obj.success_action, active=filter_obj.active)
+        if stat and stat.evaluations:
+            item.evaluations, item.matches, item.passes = stat.evaluations, stat.matches, stat.passes
+            item.match_rate = stat.matches / stat.evaluations
+            item.avg_time_us = stat.total_ns / stat.evaluations / 1000
+        items.append(item)
+    return items
+
 @router.get("/{filter_id}", response_model=FilterSchema)
 async def get_filter_by_id(filter_id: int, db: AsyncSession = Depends(get_db)):
     filter_obj = await db.get(Filter, filter_id)
@@ -51,6 +101,34 @@ async def get_filter_by_id(filter_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Filter not found")
     return filter_obj
 
+@router.get(
+    "/{filter_id}/matches",
+    summary="Тендеры, подходящие под фильтр",
+    description="Потоково отдаёт в формате NDJSON тендеры типа фильтра, проходящие его условие, по возрастанию "
+                "external_id. Условие выполняется в Postgres; для продолжения передайте в after последний "
+                "полученный external_id.",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}, 404: {"description": "Фильтр не найден"}}
+)
+async def get_filter_matches(
+    filter_id: int,
+    after: Optional[str] = Query(None, description="Отдавать тендеры с external_id больше этого"),
+    limit: Optional[int] = Query(None, ge=1, description="Максимальное число тендеров"),
+    db: AsyncSession = Depends(get_db)
+):
+    filter_obj = await db.get(Filter, filter_id)
+    if not filter_obj:
+        raise HTTPException(status_code=404, detail="Filter not found")
+    db.expunge(filter_obj)
+
+    async def lines():
+        # Сессия запроса закрывается до отправки тела, поэтому поток открывает свою
+        async with AsyncSessionLocal() as stream_db:
+            async for tender in iter_filter_matches(stream_db, filter_obj, after, limit):
+                yield TenderMatch.model_validate(tender).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @router.delete("/{filter_id}")
 async def delete_filter(filter_id: int, db: AsyncSession = Depends(get_db)):
     filter_obj = await db.get(Filter, filter_id)
@@ -58,19 +136,23 @@ async def delete_filter(filter_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Filter not found")
     await db.delete(filter_obj)
     await db.commit()
+    filter_cache.invalidate()
     return {"status": "success"}
 
 @router.post("/", response_model=FilterSchema)
 async def create_filter(filter: FilterCreate, db: AsyncSession = Depends(get_db)):
+    check_formulas(filter)
     filter_data = filter.dict(exclude_unset=True)
     db_filter = Filter(**filter_data)
     db.add(db_filter)
     await db.commit()
     await db.refresh(db_filter)
+    filter_cache.invalidate()
     return db_filter
 
 @router.put("/{filter_id}", response_model=FilterSchema)
 async def update_filter(filter_id: int, filter: FilterCreate, db: AsyncSession = Depends(get_db)):
+    check_formulas(filter)
 
     db_filter = await db.get(Filter, filter_id)
     if not db_filter:
@@ -85,5 +167,6 @@ async def update_filter(filter_id: int, filter: FilterCreate, db: AsyncSession =
     db.add(db_filter)
     await db.commit()
     await db.refresh(db_filter)
+    filter_cache.invalidate()
 
     return db_filter
\ No newline at end of file
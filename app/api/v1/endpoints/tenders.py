@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func, asc, desc
 from sqlalchemy.orm import selectinload
-from app.schemas.tender_request import IncomingTenderData, TenderResponse, TenderRequest
+from app.schemas.tender_request import IncomingTenderData, TenderResponse, TenderRequest, TenderIngestResult, \
+    BatchTenderResponse
 from app.schemas.tenders import TenderListResponse, TenderDetail
-from app.services.tender_service import process_and_save_tender
-from app.crud.tenders import get_tender_by_id, save_tender
+from app.crud.tenders import get_existing_tender_ids, save_tenders_bulk
+from app.crud.jobs import enqueue_tender_jobs
 from app.db.database import get_db
 from app.core.logging_config import logger
 from app.models.tenders import Tender
@@ -17,50 +18,67 @@ router = APIRouter()
 
 @router.post(
     "/incoming_data",
-    response_model=TenderResponse,
+    response_model=BatchTenderResponse,
     summary="Создание новых тендеров",
-    description="Принимает список групп тендеров и сразу возвращает подтверждение принятия, запуская обработку в фоне.",
+    description="Принимает все группы тендеров за один запрос, сохраняет новые тендеры одной транзакцией "
+                "вместе с задачами очереди обработки и возвращает результат по каждому тендеру.",
     responses={
         200: {"description": "Запрос успешно принят", "content": {
-            "application/json": {"example": {"status": "success", "tender_id": "IS49226739", "state": "RECEIVED"}}}},
-        409: {"description": "Тендер с таким ID уже существует", "content": {"application/json": {"example": {
-            "detail": {"message": "Tender with id 'IS49226739' already exists", "tender_id": "IS49226739"}}}}},
+            "application/json": {"example": {"status": "success", "accepted": 1, "duplicates": 1, "invalid": 0,
+                                             "results": [
+                                                 {"tender_id": "IS49226739", "result": "accepted", "state": "RECEIVED"},
+                                                 {"tender_id": "IS49226740", "result": "duplicate",
+                                                  "detail": "Tender with id 'IS49226740' already exists"}]}}}},
         422: {"description": "Ошибка валидации входных данных",
               "content": {"application/json": {"example": {"detail": "Invalid tender data"}}}}
     }
 )
 async def incoming_data(
         data: IncomingTenderData,
-        background_tasks: BackgroundTasks,
         db: AsyncSession = Depends(get_db)
 ):
-    logger.info("Received incoming tender data")
+    requests = [(tender_data, group.type) for group in data.data for tender_data in group.requests]
+    logger.info(f"Received incoming tender data: {len(requests)} tenders in {len(data.data)} groups")
     try:
-        for group in data.data:
-            for tender_data in group.requests:
-                logger.info(f"Processing tender {tender_data.id}, initial state: {tender_data.state}")
-                existing_tender = await get_tender_by_id(db, tender_data.id)
-                if existing_tender:
-                    logger.warning(f"Tender {tender_data.id} already exists")
-                    raise HTTPException(
-                        status_code=409,
-                        detail={"message": f"Tender with id '{tender_data.id}' already exists",
-                                "tender_id": tender_data.id}
-                    )
-
-
-                db_tender = await save_tender(db, tender_data, group.type)
-                if not db_tender:
-                    logger.error(f"Failed to initially save tender {tender_data.id}")
-                    raise HTTPException(status_code=500, detail="Failed to save tender")
-
-
-                background_tasks.add_task(process_and_save_tender, tender_data, group.type)
-
-
-                response = TenderResponse(status="success", tender_id=tender_data.id, state="RECEIVED")
-                logger.info(f"Returning success response: {response.dict()}")
-                return response
+        existing_ids = await get_existing_tender_ids(db, [tender_data.id for tender_data, _ in requests if tender_data.id])
+
+        results = []
+        to_save = []
+        seen_ids = set()
+        for tender_data, type_name in requests:
+            if not tender_data.id or not tender_data.title:
+                logger.warning(f"Tender {tender_data.id!r} has no id or title")
+                results.append(TenderIngestResult(tender_id=tender_data.id, result="invalid",
+                                                  detail="Tender id and title are required"))
+                continue
+            if tender_data.id in existing_ids or tender_data.id in seen_ids:
+                logger.warning(f"Tender {tender_data.id} already exists")
+                results.append(TenderIngestResult(tender_id=tender_data.id, result="duplicate",
+                                                  detail=f"Tender with id '{tender_data.id}' already exists"))
+                continue
+            seen_ids.add(tender_data.id)
+            to_save.append((tender_data, type_name))
+            results.append(TenderIngestResult(tender_id=tender_data.id, result="accepted", state="RECEIVED"))
+
+        inserted = set()
+        if to_save:
+            inserted = await save_tenders_bulk(db, to_save, commit=False)
+            await enqueue_tender_jobs(
+                db, [(tender_data, type_name, tender_data.id) for tender_data, type_name in to_save
+                     if tender_data.id in inserted]
+            )
+        for item in results:
+            # Тендер мог быть вставлен параллельным запросом между проверкой и INSERT
+            if item.result == "accepted" and item.tender_id not in inserted:
+                item.result, item.state = "duplicate", None
+                item.detail = f"Tender with id '{item.tender_id}' already exists"
+
+        accepted = len(inserted)
+        duplicates = sum(1 for r in results if r.result == "duplicate")
+        invalid = sum(1 for r in results if r.result == "invalid")
+        logger.info(f"Incoming tender data processed: accepted={accepted}, duplicates={duplicates}, invalid={invalid}")
+        return BatchTenderResponse(status="success", accepted=accepted, duplicates=duplicates, invalid=invalid,
+                                   results=results)
 
     except HTTPException as e:
         raise e
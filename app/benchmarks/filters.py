@@ -0,0 +1,93 @@
+"""Микробенчмарк фильтров: интерпретация JSON на каждый тендер против скомпилированных условий
+и пакетной оценки по колонкам.
+
+Запуск: python -m app.benchmarks.filters [--tenders 10000] [--filters 200]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from app.services.filter_engine import compile_filter, evaluate_condition, TenderBatch
+
+FIELDS = {
+    "title": ["насос", "задвижка", "поставка", "ремонт", "Насосное оборудование"],
+    "initial_price": [10_000, 500_000, 1_000_000, 5_000_000],
+    "currency": ["RUB", "USD"],
+    "etp_code": ["sber", "rts", "roseltorg"],
+    "organizer.region": ["Москва", "Казань", "Пермь"],
+    "smp": ["да", "нет"],
+}
+OPS = ["=", "!=", ">", "<", ">=", "<=", "contains"]
+
+
+def random_leaf(rng: random.Random) -> dict:
+    field = rng.choice(list(FIELDS))
+    return {"field": field, "op": rng.choice(OPS), "value": rng.choice(FIELDS[field])}
+
+
+def random_condition(rng: random.Random, depth: int = 0) -> dict:
+    if depth >= 2 or rng.random() < 0.3:
+        return random_leaf(rng)
+    return {rng.choice(["AND", "OR"]): [random_condition(rng, depth + 1) for _ in range(rng.randint(2, 4))]}
+
+
+def random_tender(rng: random.Random, index: int) -> dict:
+    return {
+        "external_id": f"T{index}",
+        "title": " ".join(rng.sample(FIELDS["title"], 2)),
+        "initial_price": rng.randint(1_000, 10_000_000),
+        "currency": rng.choice(FIELDS["currency"]),
+        "etp_code": rng.choice(FIELDS["etp_code"]),
+        "organizer": {"region": rng.choice(FIELDS["organizer.region"])},
+        "smp": rng.choice(FIELDS["smp"] + [None]),
+        "publication_date": datetime.now(timezone.utc) - timedelta(days=rng.randint(0, 30)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenders", type=int, default=10_000)
+    parser.add_argument("--filters", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    filters = [SimpleNamespace(id=i, updated_at=None, priority=i, parent_id=None, success_action=None,
+                               condition=json.dumps(random_condition(rng)), formula=None, formula_target=None)
+               for i in range(args.filters)]
+    tenders = [random_tender(rng, i) for i in range(args.tenders)]
+
+    # Прежний путь: json.loads и обход дерева для каждой пары (тендер, фильтр)
+    started = time.perf_counter()
+    expected = [[evaluate_condition(json.loads(f.condition), t) for f in filters] for t in tenders]
+    interpreted = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled_filters = [compile_filter(f) for f in filters]
+    compile_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = [[f.predicate(t) for f in compiled_filters] for t in tenders]
+    compiled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = TenderBatch(tenders)
+    columns = [batch.unpack(f.batch_predicate(batch)) for f in compiled_filters]
+    batched = time.perf_counter() - started
+
+    if actual != expected:
+        raise SystemExit("compiled filters disagree with evaluate_condition")
+    if [list(row) for row in zip(*columns)] != expected:
+        raise SystemExit("batch evaluation disagrees with evaluate_condition")
+    pairs = args.tenders * args.filters
+    print(f"{args.tenders} tenders x {args.filters} filters = {pairs} evaluations")
+    print(f"interpreted: {interpreted:.3f}s ({interpreted / pairs * 1e9:.0f} ns/eval)")
+    print(f"compiled:    {compiled:.3f}s ({compiled / pairs * 1e9:.0f} ns/eval), compile {compile_time * 1e3:.1f} ms")
+    print(f"batch:       {batched:.3f}s ({batched / pairs * 1e9:.0f} ns/eval)")
+    print(f"speedup:     {interpreted / compiled:.1f}x compiled, {interpreted / batched:.1f}x batch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Бенчмарк загрузки мелких файлов в S3: новый клиент на каждый вызов против общего клиента процесса.
+
+Запуск: python -m app.benchmarks.s3_client [--uploads 200] [--size 10240] [--concurrency 10] [--endpoint URL]
+
+Без --endpoint поднимается локальная заглушка S3 (PUT отвечает 200), и замер показывает
+цену создания клиента и соединений. С --endpoint используются бакет и ключи из настроек;
+к реальному хранилищу добавляется TLS-рукопожатие на каждый новый клиент.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import socket
+import time
+import aiobotocore.session
+from aiohttp import web
+from app.core.config import settings
+from app.services.s3_client import close_s3_client, get_s3_client
+
+
+async def handle_put(request: web.Request) -> web.Response:
+    body = await request.read()
+    return web.Response(headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+
+async def start_stub_s3() -> tuple[web.AppRunner, str]:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_route("PUT", "/{path:.*}", handle_put)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    return runner, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def upload_per_call(key: str, body: bytes) -> None:
+    """Прежний путь: сессия и клиент создаются на каждую загрузку."""
+    session = aiobotocore.session.get_session()
+    async with session.create_client(
+        "s3",
+        endpoint_url=settings.S3_ENDPOINT_URL,
+        aws_access_key_id=settings.S3_ACCESS_KEY,
+        aws_secret_access_key=settings.S3_SECRET_KEY,
+        region_name=settings.S3_REGION,
+    ) as s3_client:
+        await s3_client.put_object(Bucket=settings.S3_BUCKET_NAME, Key=key, Body=body)
+
+
+async def upload_shared(key: str, body: bytes) -> None:
+    s3_client = await get_s3_client()
+    await s3_client.put_object(Bucket=settings.S3_BUCKET_NAME, Key=key, Body=body)
+
+
+async def measure(upload, uploads: int, size: int, concurrency: int) -> float:
+    slots = asyncio.Semaphore(concurrency)
+    body = os.urandom(size)
+
+    async def one(index: int) -> None:
+        async with slots:
+            await upload(f"benchmarks/{index}", body)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(uploads)))
+    return time.perf_counter() - started
+
+
+async def run(args: argparse.Namespace) -> None:
+    runner = None
+    if args.endpoint:
+        settings.S3_ENDPOINT_URL = args.endpoint
+    else:
+        runner, settings.S3_ENDPOINT_URL = await start_stub_s3()
+        settings.S3_BUCKET_NAME = settings.S3_BUCKET_NAME or "benchmarks"
+        settings.S3_REGION = settings.S3_REGION or "us-east-1"
+    try:
+        per_call = await measure(upload_per_call, args.uploads, args.size, args.concurrency)
+        # Создание общего клиента — разовая цена при старте процесса, в замер её не включаем
+        await get_s3_client()
+        shared = await measure(upload_shared, args.uploads, args.size, args.concurrency)
+    finally:
+        await close_s3_client()
+        if runner is not None:
+            await runner.cleanup()
+
+    print(f"{args.uploads} uploads x {args.size} bytes, concurrency {args.concurrency}, "
+          f"endpoint {settings.S3_ENDPOINT_URL}")
+    print(f"per-call client: {per_call:.3f}s ({per_call / args.uploads * 1e3:.1f} ms/upload)")
+    print(f"shared client:   {shared:.3f}s ({shared / args.uploads * 1e3:.1f} ms/upload)")
+    print(f"speedup:         {per_call / shared:.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--size", type=int, default=10 * 1024)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--endpoint", help="S3-совместимый endpoint вместо локальной заглушки")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
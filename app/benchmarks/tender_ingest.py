@@ -0,0 +1,124 @@
+"""Число обращений к БД при сохранении тендеров: прежний путь (commit/refresh на каждую строку)
+против save_tenders_bulk.
+
+Запуск: python -m app.benchmarks.tender_ingest [--tenders 100] [--lots 10] [--docs 15]
+
+Считаются выполненные курсором запросы и COMMIT на SQLite в памяти: число обращений от СУБД
+не зависит, а время на Postgres растёт примерно пропорционально ему.
+"""
+import argparse
+import asyncio
+import time
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from app.models.base import Base
+from app.models.tenders import Tender
+from app.models.lots import Lot as LotModel
+from app.models.documents import Document as DocumentModel
+from app.schemas.tender_request import TenderRequest
+from app.crud.documents import save_documents
+from app.crud.lots import create_lot
+from app.crud.tenders import save_tenders_bulk, tender_row
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+def make_tenders(prefix: str, count: int, lots: int, docs: int) -> list[TenderRequest]:
+    return [
+        TenderRequest(
+            id=f"{prefix}{i}",
+            title=f"Тендер {i}",
+            organizer={"inn": "7700000000", "shortName": "ООО Заказчик"},
+            initial_sum={"price": 100_000 + i, "currency": "RUB"},
+            lots=[{"title": f"Лот {j}", "initial_sum": {"price": 1000 + j, "currency": "RUB"},
+                   "delivery_term": "30 дней"} for j in range(lots)],
+            docs=[{"file_name": f"doc{j}.pdf", "url": f"https://example.org/{prefix}{i}/doc{j}.pdf"}
+                  for j in range(docs)],
+        )
+        for i in range(count)
+    ]
+
+
+async def save_tender_per_row(db: AsyncSession, tender: TenderRequest, type_name: str) -> None:
+    """Прежний save_tender: тендер, затем каждый документ и лот со своим commit."""
+    db_tender = Tender(**tender_row(tender, type_name))
+    db.add(db_tender)
+    await db.commit()
+    await db.refresh(db_tender)
+    if tender.docs:
+        await save_documents(db, tender.id, tender.docs, tender.kontur_link)
+    for lot in tender.lots:
+        await create_lot(db, tender.id, lot.title, lot.initial_sum.price, lot.initial_sum.currency,
+                         lot.delivery_place, lot.delivery_term, lot.payment_term)
+    await db.commit()
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._statement)
+        event.listen(engine.sync_engine, "commit", self._commit)
+
+    def _statement(self, *args) -> None:
+        self.statements += 1
+
+    def _commit(self, *args) -> None:
+        self.commits += 1
+
+    def reset(self) -> None:
+        self.statements = self.commits = 0
+
+
+async def run(args: argparse.Namespace) -> None:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    counter = StatementCounter(engine)
+
+    results = {}
+    for name, prefix in (("per-row", "R"), ("bulk", "B")):
+        tenders = make_tenders(prefix, args.tenders, args.lots, args.docs)
+        counter.reset()
+        started = time.perf_counter()
+        async with AsyncSession(engine) as db:
+            if name == "per-row":
+                for tender in tenders:
+                    await save_tender_per_row(db, tender, "bench")
+            else:
+                await save_tenders_bulk(db, [(tender, "bench") for tender in tenders])
+        elapsed = time.perf_counter() - started
+        async with AsyncSession(engine) as db:
+            rows = tuple([
+                await db.scalar(select(func.count()).select_from(model).where(column.like(f"{prefix}%")))
+                for model, column in ((Tender, Tender.external_id), (LotModel, LotModel.tender_id),
+                                      (DocumentModel, DocumentModel.tender_id))
+            ])
+        results[name] = (counter.statements, counter.commits, elapsed, rows)
+    await engine.dispose()
+
+    if results["per-row"][3] != results["bulk"][3]:
+        raise SystemExit(f"paths saved different rows: {results['per-row'][3]} vs {results['bulk'][3]}")
+    print(f"{args.tenders} tenders x {args.lots} lots x {args.docs} docs, rows saved {results['bulk'][3]}")
+    for name, (statements, commits, elapsed, _) in results.items():
+        print(f"{name:8} {statements:6} statements, {commits:5} commits, "
+              f"{(statements + commits) / args.tenders:6.1f} round trips/tender, {elapsed:.3f}s")
+    per_row, bulk = (results[name][0] + results[name][1] for name in ("per-row", "bulk"))
+    print(f"round trips: {per_row / bulk:.1f}x fewer")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenders", type=int, default=100)
+    parser.add_argument("--lots", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=15)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
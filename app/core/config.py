@@ -3,6 +3,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _http_profile(prefix: str, limit: int, limit_per_host: int, keepalive_timeout: int, ttl_dns_cache: int,
+                  total_timeout: int, connect_timeout: int, read_timeout: int) -> dict:
+    """Настройки пула соединений одного внешнего сервиса; 0 в таймаутах — без ограничения."""
+    return {
+        "limit": int(getenv(f"HTTP_{prefix}_LIMIT", str(limit))),
+        "limit_per_host": int(getenv(f"HTTP_{prefix}_LIMIT_PER_HOST", str(limit_per_host))),
+        "keepalive_timeout": int(getenv(f"HTTP_{prefix}_KEEPALIVE", str(keepalive_timeout))),
+        "ttl_dns_cache": int(getenv(f"HTTP_{prefix}_DNS_TTL", str(ttl_dns_cache))),
+        "total_timeout": int(getenv(f"HTTP_{prefix}_TIMEOUT", str(total_timeout))),
+        "connect_timeout": int(getenv(f"HTTP_{prefix}_CONNECT_TIMEOUT", str(connect_timeout))),
+        "read_timeout": int(getenv(f"HTTP_{prefix}_READ_TIMEOUT", str(read_timeout))),
+    }
+
 class Config:
 
     ALLOWED_ORIGINS: list = getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
@@ -23,10 +36,49 @@ class Config:
     # Bitrix24
     BITRIX_WEBHOOK_URL: str = getenv("BITRIX_WEBHOOK_URL")
     KEPLER_API_TOKEN: str = getenv("KEPLER_API_TOKEN")
+    # Пакетный экспорт через batch: конвейер оставляет тендеры в READY_FOR_EXPORT, а воркер отправляет их,
+    # когда набралось MAX_SIZE лидов или самый старый ждёт MAX_LATENCY секунд
+    BITRIX_BATCH_EXPORT: bool = getenv("BITRIX_BATCH_EXPORT", "false").lower() in ("1", "true", "yes")
+    BITRIX_BATCH_MAX_SIZE: int = int(getenv("BITRIX_BATCH_MAX_SIZE", "50"))
+    BITRIX_BATCH_MAX_LATENCY: float = float(getenv("BITRIX_BATCH_MAX_LATENCY", "60"))
+    BITRIX_BATCH_POLL_INTERVAL: float = float(getenv("BITRIX_BATCH_POLL_INTERVAL", "5"))
+    # Параллельные disk.file.upload при пакетном экспорте
+    BITRIX_UPLOAD_CONCURRENCY: int = int(getenv("BITRIX_UPLOAD_CONCURRENCY", "2"))
+    # Как долго считать загруженные значения списочных полей лида актуальными
+    BITRIX_USER_FIELDS_TTL: float = float(getenv("BITRIX_USER_FIELDS_TTL", "3600"))
 
     # AI-сервис
     AI_API_BASE_URL: str = getenv("AI_API_BASE_URL")
     AI_API_TOKEN: str = getenv("AI_API_TOKEN")
+    # Callback о готовности задачи: публичный URL POST /v1/ai/callback и секрет в заголовке X-AI-Callback-Token
+    # (обязателен вместе с URL; без секрета callback отклоняется). Без URL результаты забирает общий поллер
+    AI_CALLBACK_URL: str = getenv("AI_CALLBACK_URL")
+    AI_CALLBACK_TOKEN: str = getenv("AI_CALLBACK_TOKEN")
+    # Общий поллер /task_status: интервал растёт от MIN до MAX, пока задача не готова
+    AI_POLL_MIN_INTERVAL: float = float(getenv("AI_POLL_MIN_INTERVAL", "2"))
+    AI_POLL_MAX_INTERVAL: float = float(getenv("AI_POLL_MAX_INTERVAL", "30"))
+    AI_POLL_BACKOFF: float = float(getenv("AI_POLL_BACKOFF", "1.5"))
+    AI_POLL_BATCH_SIZE: int = int(getenv("AI_POLL_BATCH_SIZE", "20"))
+    AI_TASK_TIMEOUT: int = int(getenv("AI_TASK_TIMEOUT", "600"))
+    # Как часто воркер ищет тендеры, застрявшие в AI_PROCESSING без задачи в очереди,
+    # и через сколько секунд ожидания PENDING-проверка считается оставшейся без присмотра
+    AI_SWEEP_INTERVAL: float = float(getenv("AI_SWEEP_INTERVAL", "60"))
+    AI_SWEEP_AFTER: int = int(getenv("AI_SWEEP_AFTER", "300"))
+    # Кэш результатов AI по хешу документов: версия модели входит в ключ, смена версии обнуляет кэш
+    AI_MODEL_VERSION: str = getenv("AI_MODEL_VERSION", "1")
+    AI_CACHE_TTL: int = int(getenv("AI_CACHE_TTL", str(30 * 24 * 3600)))
+    AI_CACHE_SIZE: int = int(getenv("AI_CACHE_SIZE", "1000"))
+    AI_CACHE_LOCAL_TTL: float = float(getenv("AI_CACHE_LOCAL_TTL", "60"))
+    # Документы тендера уходят в AI одним запросом: лимит на файл, на весь запрос и параллельность чтения из S3
+    AI_MAX_DOCUMENT_SIZE: int = int(getenv("AI_MAX_DOCUMENT_SIZE", str(20 * 1024 * 1024)))
+    AI_MAX_TOTAL_SIZE: int = int(getenv("AI_MAX_TOTAL_SIZE", str(50 * 1024 * 1024)))
+    AI_FETCH_CONCURRENCY: int = int(getenv("AI_FETCH_CONCURRENCY", "8"))
+    # Как документы попадают в AI: upload — читаются в память и загружаются, stream — тело S3 или файла
+    # идёт в запрос потоком, url — AI сам скачивает их по presigned URL (поле urls) или file:// для AI_LOCAL_SPOOL_DIR
+    AI_DOCUMENT_TRANSFER: str = getenv("AI_DOCUMENT_TRANSFER", "upload")
+    AI_PRESIGNED_URL_TTL: int = int(getenv("AI_PRESIGNED_URL_TTL", "900"))
+    # Каталог локального спула вместо S3 (стенды без хранилища): file:// и абсолютные пути читаются только внутри него
+    AI_LOCAL_SPOOL_DIR: str = getenv("AI_LOCAL_SPOOL_DIR")
 
     # S3-хранилище (Yandex Object Storage)
     S3_ENDPOINT_URL: str = getenv("S3_ENDPOINT_URL")
@@ -34,11 +86,60 @@ class Config:
     S3_REGION: str = getenv("S3_REGION")
     S3_ACCESS_KEY: str = getenv("S3_ACCESS_KEY")
     S3_SECRET_KEY: str = getenv("S3_SECRET_KEY")
+    S3_MAX_POOL_CONNECTIONS: int = int(getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+    # Потоковая загрузка: размер части multipart upload и число частей в полёте
+    S3_PART_SIZE: int = int(getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+    S3_MAX_PARTS_IN_FLIGHT: int = int(getenv("S3_MAX_PARTS_IN_FLIGHT", "2"))
+
+    # Загрузка документов тендера
+    DOC_FETCH_CONCURRENCY: int = int(getenv("DOC_FETCH_CONCURRENCY", "16"))
+    DOC_FETCH_PER_HOST: int = int(getenv("DOC_FETCH_PER_HOST", "4"))
+
+    # Пул headless Chrome для скрапинга документов
+    BROWSER_POOL_SIZE: int = int(getenv("BROWSER_POOL_SIZE", "2"))
+    BROWSER_MAX_USES: int = int(getenv("BROWSER_MAX_USES", "20"))
+    BROWSER_MAX_WAITING: int = int(getenv("BROWSER_MAX_WAITING", "10"))
+    # Корень для отдельных каталогов загрузок каждого тендера
+    DOWNLOAD_DIR: str = getenv("DOWNLOAD_DIR", "/tmp")
+    SCRAPE_PAGE_TIMEOUT: int = int(getenv("SCRAPE_PAGE_TIMEOUT", "15"))
+    SCRAPE_DOWNLOAD_TIMEOUT: int = int(getenv("SCRAPE_DOWNLOAD_TIMEOUT", "60"))
+    # Быстрый путь без браузера: сколько HTML страницы тендера читать
+    SCRAPE_HTTP_MAX_PAGE_SIZE: int = int(getenv("SCRAPE_HTTP_MAX_PAGE_SIZE", str(5 * 1024 * 1024)))
+
+    # Как долго скомпилированные фильтры используются без проверки версии в БД
+    FILTER_CACHE_TTL: float = float(getenv("FILTER_CACHE_TTL", "30"))
+    # Дерево фильтров: как часто пересортировывать соседние фильтры и сбрасывать статистику в БД
+    FILTER_REORDER_EVERY: int = int(getenv("FILTER_REORDER_EVERY", "200"))
+    FILTER_STATS_FLUSH_INTERVAL: float = float(getenv("FILTER_STATS_FLUSH_INTERVAL", "60"))
+    # Размер страницы keyset-выборки для GET /v1/filters/{id}/matches
+    FILTER_MATCHES_PAGE_SIZE: int = int(getenv("FILTER_MATCHES_PAGE_SIZE", "1000"))
+    # Предпросмотр фильтра (POST /v1/filters/preview)
+    FILTER_PREVIEW_CACHE_TTL: float = float(getenv("FILTER_PREVIEW_CACHE_TTL", "300"))
+    FILTER_PREVIEW_CACHE_SIZE: int = int(getenv("FILTER_PREVIEW_CACHE_SIZE", "256"))
+    FILTER_PREVIEW_SAMPLE_SIZE: int = int(getenv("FILTER_PREVIEW_SAMPLE_SIZE", "20"))
+    FILTER_PREVIEW_MAX_DAYS: int = int(getenv("FILTER_PREVIEW_MAX_DAYS", "365"))
 
     # Telegram-уведомления
     TELEGRAM_BOT_TOKEN: str = getenv("TELEGRAM_BOT_TOKEN")
     TELEGRAM_CHAT_ID: str = getenv("TELEGRAM_CHAT_ID")
 
+    # Очередь обработки тендеров (python -m app.worker)
+    WORKER_CONCURRENCY: int = int(getenv("WORKER_CONCURRENCY", "4"))
+    WORKER_POLL_INTERVAL: float = float(getenv("WORKER_POLL_INTERVAL", "2"))
+    JOB_VISIBILITY_TIMEOUT: int = int(getenv("JOB_VISIBILITY_TIMEOUT", "900"))
+    JOB_MAX_ATTEMPTS: int = int(getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_RETRY_BACKOFF: int = int(getenv("JOB_RETRY_BACKOFF", "30"))
+    JOB_RETRY_BACKOFF_MAX: int = int(getenv("JOB_RETRY_BACKOFF_MAX", "3600"))
+
+    # HTTP-сессии внешних сервисов
+    HTTP_SESSIONS: dict = {
+        "ai": _http_profile("AI", 20, 20, 60, 300, 300, 10, 0),
+        "bitrix": _http_profile("BITRIX", 10, 10, 60, 300, 60, 10, 0),
+        "telegram": _http_profile("TELEGRAM", 5, 5, 60, 300, 30, 10, 0),
+        # Документы качаются потоком, поэтому ограничено только ожидание между чанками
+        "documents": _http_profile("DOCUMENTS", 100, 8, 30, 300, 0, 15, 60),
+    }
+
     # Порт приложения
     APP_PORT: int = int(getenv("APP_PORT", "8000"))
 
@@ -52,6 +153,9 @@ class Config:
             "TELEGRAM_BOT_TOKEN": self.TELEGRAM_BOT_TOKEN,
             "TELEGRAM_CHAT_ID": self.TELEGRAM_CHAT_ID,
         }
+        # Без секрета callback принял бы результат AI от любого, кто знает task_id
+        if self.AI_CALLBACK_URL:
+            required_vars["AI_CALLBACK_TOKEN"] = self.AI_CALLBACK_TOKEN
         missing_vars = [key for key, value in required_vars.items() if not value]
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -1,9 +1,78 @@
+from datetime import timedelta
+from sqlalchemy import update, func, exists, or_, true
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from app.models.ai_checks import AICheck
+from app.models.jobs import TenderJob
+from app.models.tenders import Tender
 
 async def create_ai_check(db: AsyncSession, tender_id: int, ai_status: str, ai_response: str):
     db_check = AICheck(tender_id=tender_id, ai_status=ai_status, ai_response=ai_response)
     db.add(db_check)
     await db.commit()
     await db.refresh(db_check)
-    return db_check
\ No newline at end of file
+    return db_check
+
+async def get_ai_check_by_task(db: AsyncSession, task_id: str) -> AICheck | None:
+    result = await db.execute(select(AICheck).where(AICheck.task_id == task_id).order_by(AICheck.id.desc()).limit(1))
+    return result.scalars().first()
+
+async def get_latest_ai_check(db: AsyncSession, tender_id: str) -> AICheck | None:
+    result = await db.execute(
+        select(AICheck).where(AICheck.tender_id == tender_id).order_by(AICheck.id.desc()).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_stuck_ai_tenders(db: AsyncSession, pending_after: int, limit: int = 500) -> list[tuple[str, str]]:
+    """(external_id, type) тендеров в AI_PROCESSING без ожидающей или выполняемой задачи в очереди.
+
+    Сюда попадают тендеры с готовым результатом, по которому задачу не поставили
+    (например, упал процесс), без проверки вовсе и с проверкой PENDING дольше
+    pending_after секунд — за такой, возможно, никто не следит после перезапуска.
+    """
+    latest = (
+        select(AICheck.ai_status, AICheck.checked_at)
+        .where(AICheck.tender_id == Tender.external_id)
+        .order_by(AICheck.id.desc())
+        .limit(1)
+        .lateral()
+    )
+    queued = exists().where(TenderJob.tender_id == Tender.external_id, TenderJob.status.in_(("queued", "running")))
+    result = await db.execute(
+        select(Tender.external_id, Tender.type)
+        .outerjoin(latest, true())
+        .where(
+            Tender.state == "AI_PROCESSING",
+            ~queued,
+            or_(
+                latest.c.ai_status.is_(None),
+                latest.c.ai_status != "PENDING",
+                latest.c.checked_at < func.now() - timedelta(seconds=pending_after),
+            ),
+        )
+        .limit(limit)
+    )
+    return [tuple(row) for row in result.all()]
+
+async def get_finished_ai_checks(db: AsyncSession, task_ids: list[str]) -> list[AICheck]:
+    """Проверки из task_ids, которые уже получили результат (например, через callback)."""
+    if not task_ids:
+        return []
+    result = await db.execute(select(AICheck).where(AICheck.task_id.in_(task_ids), AICheck.ai_status != "PENDING"))
+    return list(result.scalars().all())
+
+async def finish_ai_check(db: AsyncSession, task_id: str, ai_status: str, ai_response: str | None,
+                          commit: bool = True) -> bool:
+    """Записывает результат задачи, если он ещё не записан; False — записи PENDING с таким task_id нет.
+
+    Условие на PENDING делает запись идемпотентной: callback и поллер могут
+    прийти с одним результатом одновременно.
+    """
+    result = await db.execute(
+        update(AICheck)
+        .where(AICheck.task_id == task_id, AICheck.ai_status == "PENDING")
+        .values(ai_status=ai_status, ai_response=ai_response, checked_at=func.now())
+    )
+    if commit:
+        await db.commit()
+    return result.rowcount > 0
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from app.models.ai_checks import AICheck
+from app.models.ai_result_cache import AIResultCache
+
+
+async def get_cached_result(db: AsyncSession, content_hash: str, model_version: str,
+                            max_age: int) -> AIResultCache | None:
+    """Запись кэша не старше max_age секунд."""
+    result = await db.execute(
+        select(AIResultCache).where(
+            AIResultCache.content_hash == content_hash,
+            AIResultCache.model_version == model_version,
+            AIResultCache.created_at >= func.now() - timedelta(seconds=max_age),
+        )
+    )
+    return result.scalars().first()
+
+
+async def save_cached_result(db: AsyncSession, content_hash: str, model_version: str, ai_status: str,
+                             ai_response: str | None, commit: bool = True) -> None:
+    stmt = insert(AIResultCache).values(content_hash=content_hash, model_version=model_version,
+                                        ai_status=ai_status, ai_response=ai_response)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[AIResultCache.content_hash, AIResultCache.model_version],
+        set_={"ai_status": stmt.excluded.ai_status, "ai_response": stmt.excluded.ai_response,
+              "created_at": func.now()}
+    ))
+    if commit:
+        await db.commit()
+
+
+async def delete_cached_results(db: AsyncSession, content_hash: str | None = None, model_version: str | None = None,
+                                older_than: int | None = None, commit: bool = True) -> int:
+    """Удаляет записи кэша, подходящие под все заданные условия; без аргументов — все."""
+    stmt = delete(AIResultCache)
+    if older_than is not None:
+        stmt = stmt.where(AIResultCache.created_at < func.now() - timedelta(seconds=older_than))
+    if content_hash:
+        stmt = stmt.where(AIResultCache.content_hash == content_hash)
+    if model_version:
+        stmt = stmt.where(AIResultCache.model_version == model_version)
+    result = await db.execute(stmt)
+    if commit:
+        await db.commit()
+    return result.rowcount
+
+
+async def get_ai_cache_stats(db: AsyncSession, model_version: str) -> dict:
+    """Число записей кэша и попаданий/промахов по проверкам ai_checks с известным хешом."""
+    entries = await db.scalar(
+        select(func.count()).select_from(AIResultCache).where(AIResultCache.model_version == model_version)
+    )
+    result = await db.execute(
+        select(
+            func.count().filter(AICheck.from_cache.is_(True)),
+            func.count().filter(AICheck.from_cache.is_(False)),
+        ).where(AICheck.content_hash.isnot(None))
+    )
+    hits, misses = result.one()
+    return {"entries": entries, "hits": hits, "misses": misses}
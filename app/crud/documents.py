@@ -1,8 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql import text
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert
 from app.models.documents import Document as DocumentModel
+from app.models.document_fetch_cache import DocumentFetchCache
 from app.schemas.tender_request import Document as DocumentSchema
 from app.crud.errors import log_tender_error
 from app.core.logging_config import logger
@@ -100,4 +102,34 @@ async def update_document_url(db: AsyncSession, tender_id: str, file_name: str,
     except Exception as e:
         logger.error(f"Error updating document URL for tender {tender_id}, file {file_name}: {str(e)}")
         await db.rollback()
-        return False
\ No newline at end of file
+        return False
+
+
+async def get_fetch_cache(db: AsyncSession, urls: list[str]) -> dict[str, DocumentFetchCache]:
+    """Загружает записи кэша загрузок для списка URL одним запросом."""
+    if not urls:
+        return {}
+    result = await db.execute(select(DocumentFetchCache).filter(DocumentFetchCache.url.in_(urls)))
+    return {entry.url: entry for entry in result.scalars().all()}
+
+
+async def save_fetch_cache(db: AsyncSession, entries: list[dict], commit: bool = True) -> None:
+    """Записывает валидаторы ETag/Last-Modified и результат загрузки для URL документов."""
+    if not entries:
+        return
+    stmt = insert(DocumentFetchCache).values(entries)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[DocumentFetchCache.url],
+        set_={
+            "etag": stmt.excluded.etag,
+            "last_modified": stmt.excluded.last_modified,
+            "content_length": stmt.excluded.content_length,
+            "content_hash": stmt.excluded.content_hash,
+            "size": stmt.excluded.size,
+            "mime_type": stmt.excluded.mime_type,
+            "s3_url": stmt.excluded.s3_url,
+            "fetched_at": func.now(),
+        }
+    ))
+    if commit:
+        await db.commit()
@@ -2,7 +2,10 @@ from typing import List
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from app.models.filters import Filter
+from app.models.filter_stats import FilterStat
 
 async def get_active_filters(db: AsyncSession, filter_type: str = "tender") -> List[Filter]:
     result = await db.execute(
@@ -10,6 +13,13 @@ async def get_active_filters(db: AsyncSession, filter_type: str = "tender") -> L
     )
     return result.scalars().all()
 
+async def get_active_filters_version(db: AsyncSession, filter_type: str = "tender") -> tuple:
+    """Версия набора активных фильтров типа: (количество, max(updated_at)); меняется при любой правке."""
+    result = await db.execute(
+        select(func.count(Filter.id), func.max(Filter.updated_at)).filter_by(active=True, type=filter_type)
+    )
+    return tuple(result.one())
+
 async def get_filter(db: AsyncSession, filter_id: int) -> Filter:
     result = await db.execute(select(Filter).filter_by(id=filter_id))
     return result.scalars().first()
@@ -35,4 +45,32 @@ async def delete_filter(db: AsyncSession, filter_id: int) -> Filter:
     if db_filter:
         await db.delete(db_filter)
         await db.commit()
-    return db_filter
\ No newline at end of file
+    return db_filter
+
+async def record_filter_stats(db: AsyncSession, deltas: dict[int, list[int]], commit: bool = True) -> None:
+    """Прибавляет приращения [проверок, совпадений, пропусков, наносекунд] к статистике фильтров."""
+    if not deltas:
+        return
+    stmt = insert(FilterStat).values([
+        {"filter_id": filter_id, "evaluations": e, "matches": m, "passes": p, "total_ns": ns}
+        for filter_id, (e, m, p, ns) in deltas.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[FilterStat.filter_id],
+        set_={
+            "evaluations": FilterStat.evaluations + stmt.excluded.evaluations,
+            "matches": FilterStat.matches + stmt.excluded.matches,
+            "passes": FilterStat.passes + stmt.excluded.passes,
+            "total_ns": FilterStat.total_ns + stmt.excluded.total_ns,
+            "updated_at": func.now(),
+        }
+    ))
+    if commit:
+        await db.commit()
+
+async def get_filter_stats(db: AsyncSession) -> list[tuple[Filter, FilterStat | None]]:
+    result = await db.execute(
+        select(Filter, FilterStat).outerjoin(FilterStat, FilterStat.filter_id == Filter.id)
+        .order_by(Filter.type, Filter.priority, Filter.id)
+    )
+    return list(result.tuples().all())
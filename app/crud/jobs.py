@@ -0,0 +1,137 @@
+from datetime import timedelta
+from sqlalchemy import update, or_, and_, func, exists
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from app.models.jobs import TenderJob
+from app.schemas.tender_request import TenderRequest
+from app.core.config import settings
+from app.core.logging_config import logger
+
+
+async def enqueue_tender_jobs(db: AsyncSession, tenders: list[tuple[TenderRequest | None, str | None, str]],
+                              commit: bool = True) -> None:
+    """Ставит тендеры в очередь обработки: (данные запроса или None, тип, external_id).
+
+    Если у тендера уже есть ожидающая задача, новая не создаётся.
+    """
+    if not tenders:
+        return
+    rows = [
+        {
+            "tender_id": tender_id,
+            "type": type_name,
+            "payload": tender.model_dump(mode="json") if tender else None,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": settings.JOB_MAX_ATTEMPTS,
+        }
+        for tender, type_name, tender_id in tenders
+    ]
+    await db.execute(
+        insert(TenderJob).values(rows).on_conflict_do_nothing(
+            index_elements=[TenderJob.tender_id], index_where=TenderJob.status == "queued"
+        )
+    )
+    if commit:
+        await db.commit()
+    logger.info(f"Enqueued {len(rows)} tender jobs")
+
+
+async def claim_jobs(db: AsyncSession, worker_id: str, limit: int = 1) -> list[TenderJob]:
+    """Забирает готовые к запуску задачи через SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Подхватываются и задачи, чей воркер не продлил блокировку (visibility timeout).
+    Задача не берётся, пока по тому же тендеру выполняется другая: результат AI
+    может поставить тендер в очередь, пока отправивший его конвейер ещё работает.
+    """
+    now = func.now()
+    # Просроченные задачи без оставшихся попыток больше не запускаем
+    await db.execute(
+        update(TenderJob)
+        .where(TenderJob.status == "running", TenderJob.locked_until < now,
+               TenderJob.attempts >= TenderJob.max_attempts)
+        .values(status="failed", last_error="Visibility timeout expired on last attempt", updated_at=now)
+    )
+    running = aliased(TenderJob)
+    busy = exists().where(running.tender_id == TenderJob.tender_id, running.id != TenderJob.id,
+                          running.status == "running", running.locked_until >= now)
+    ready = (
+        select(TenderJob.id)
+        .where(
+            TenderJob.attempts < TenderJob.max_attempts,
+            ~busy,
+            or_(
+                and_(TenderJob.status == "queued", TenderJob.run_at <= now),
+                and_(TenderJob.status == "running", TenderJob.locked_until < now),
+            )
+        )
+        .order_by(TenderJob.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.scalars(
+        update(TenderJob)
+        .where(TenderJob.id.in_(ready.scalar_subquery()))
+        .values(
+            status="running",
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+            attempts=TenderJob.attempts + 1,
+            updated_at=now,
+        )
+        .returning(TenderJob)
+    )
+    jobs = result.all()
+    for job in jobs:
+        # Отсоединяем, чтобы атрибуты не истекли при коммите
+        db.expunge(job)
+    await db.commit()
+    return jobs
+
+
+async def extend_job_lock(db: AsyncSession, job_id: int, worker_id: str) -> bool:
+    result = await db.execute(
+        update(TenderJob)
+        .where(TenderJob.id == job_id, TenderJob.locked_by == worker_id, TenderJob.status == "running")
+        .values(locked_until=func.now() + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT))
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def complete_job(db: AsyncSession, job_id: int) -> None:
+    await db.execute(
+        update(TenderJob)
+        .where(TenderJob.id == job_id)
+        .values(status="done", locked_by=None, locked_until=None, updated_at=func.now())
+    )
+    await db.commit()
+
+
+async def fail_job(db: AsyncSession, job: TenderJob, error: str) -> None:
+    """Возвращает задачу в очередь с экспоненциальной задержкой или помечает её failed."""
+    queued = await db.scalar(
+        select(TenderJob.id).where(TenderJob.tender_id == job.tender_id, TenderJob.status == "queued")
+    )
+    if job.attempts >= job.max_attempts or queued:
+        status, delay = "failed", 0
+        logger.error(f"Job {job.id} for tender {job.tender_id} failed permanently after {job.attempts} attempts")
+    else:
+        status = "queued"
+        delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+        logger.warning(f"Job {job.id} for tender {job.tender_id} will be retried in {delay}s")
+    await db.execute(
+        update(TenderJob)
+        .where(TenderJob.id == job.id)
+        .values(
+            status=status,
+            run_at=func.now() + timedelta(seconds=delay),
+            locked_by=None,
+            locked_until=None,
+            last_error=error,
+            updated_at=func.now(),
+        )
+    )
+    await db.commit()
@@ -0,0 +1,30 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert
+from app.models.scrape_stats import ScrapeStat
+
+# Путь, которым удалось (или не удалось) получить документы со страницы
+SCRAPE_PATHS = {"http": "http_success", "browser": "browser_success", "failed": "failed"}
+
+
+async def record_scrape(db: AsyncSession, domain: str, path: str, browser_seconds: float = 0.0,
+                        commit: bool = True) -> None:
+    """Увеличивает счётчик пути скрапинга для домена одним UPSERT."""
+    column = SCRAPE_PATHS[path]
+    stmt = insert(ScrapeStat).values(domain=domain, browser_seconds=browser_seconds, **{column: 1})
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[ScrapeStat.domain],
+        set_={
+            column: getattr(ScrapeStat, column) + 1,
+            "browser_seconds": ScrapeStat.browser_seconds + stmt.excluded.browser_seconds,
+            "updated_at": func.now(),
+        }
+    ))
+    if commit:
+        await db.commit()
+
+
+async def get_scrape_stats(db: AsyncSession) -> list[ScrapeStat]:
+    result = await db.execute(select(ScrapeStat).order_by(ScrapeStat.domain))
+    return list(result.scalars().all())
@@ -1,10 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.dialects.postgresql import insert
 from app.models.tenders import Tender
-from app.schemas.tender_request import TenderRequest, Etp
-from app.crud.documents import save_documents, get_documents_by_tender_id
-from app.crud.lots import create_lot, get_lots_by_tender_id
+from app.models.lots import Lot as LotModel
+from app.models.documents import Document as DocumentModel
+from app.models.errors import Error
+from app.schemas.tender_request import TenderRequest, Etp, Lot, Money
+from app.crud.documents import get_documents_by_tender_id
+from app.crud.lots import get_lots_by_tender_id
 from app.core.logging_config import logger
 
 async def get_tender_by_id(db: AsyncSession, tender_id: str) -> Tender | None:
@@ -31,47 +36,163 @@ async def update_tender_status(db: AsyncSession, tender_id: str, status: str) ->
         await db.refresh(tender)
     return tender
 
-async def save_tender(db: AsyncSession, tender: TenderRequest, type_name: str) -> Tender:
+async def get_existing_tender_ids(db: AsyncSession, tender_ids: list[str]) -> set[str]:
+    """Возвращает те external_id из списка, которые уже есть в базе (один запрос)."""
+    if not tender_ids:
+        return set()
+    result = await db.execute(select(Tender.external_id).filter(Tender.external_id.in_(tender_ids)))
+    return set(result.scalars().all())
+
+# asyncpg ограничивает число параметров одного запроса 32767
+MAX_BIND_PARAMS = 32000
+
+async def count_tenders_in_state(db: AsyncSession, state: str) -> int:
+    return await db.scalar(select(func.count()).select_from(Tender).where(Tender.state == state))
+
+async def lock_tenders_in_state(db: AsyncSession, state: str, limit: int) -> list[Tender]:
+    """Блокирует до limit тендеров в состоянии state (FOR UPDATE SKIP LOCKED), старые первыми.
+
+    Блокировка держится до конца транзакции: параллельные процессы берут другие тендеры.
+    """
+    result = await db.execute(
+        select(Tender)
+        .options(selectinload(Tender.docs), selectinload(Tender.lots))
+        .where(Tender.state == state)
+        .order_by(Tender.created_at)
+        .limit(limit)
+        .with_for_update(of=Tender, skip_locked=True)
+    )
+    return list(result.scalars().all())
+
+def tender_row(tender: TenderRequest, type_name: str) -> dict:
+    return {
+        "external_id": tender.id,
+        "title": tender.title,
+        "notification_number": tender.notification_number,
+        "notification_type": tender.notification_type,
+        "organizer": tender.organizer,
+        "initial_price": tender.initial_sum.price,
+        "currency": tender.initial_sum.currency,
+        "application_deadline": tender.application_deadline,
+        "etp_code": tender.etp.code if tender.etp else None,
+        "etp_name": tender.etp.name if tender.etp else None,
+        "etp_url": tender.etp.url if tender.etp else None,
+        "kontur_link": tender.kontur_link,
+        "publication_date": tender.publication_date,
+        "last_modified": tender.last_modified,
+        "selection_method": tender.selection_method,
+        "smp": tender.smp,
+        "status": "new",
+        "type": type_name,
+        "state": "RECEIVED",
+    }
+
+def lot_rows(tender: TenderRequest) -> list[dict]:
+    return [
+        {
+            "tender_id": tender.id,
+            "title": lot.title,
+            "initial_sum": lot.initial_sum.price,
+            "currency": lot.initial_sum.currency,
+            "delivery_place": lot.delivery_place or "",
+            "delivery_term": lot.delivery_term or "",
+            "payment_term": lot.payment_term or "",
+        }
+        for lot in tender.lots
+    ]
+
+def document_rows(tender: TenderRequest) -> tuple[list[dict], list[dict]]:
+    """Строит строки documents и errors так же, как save_documents."""
+    docs = {}
+    errors = []
+    for doc in tender.docs:
+        if not doc.url or not doc.file_name:
+            file_name = doc.file_name or "unknown"
+            url = doc.url or tender.kontur_link or "unknown"
+            logger.error(f"Отсутствует url или file_name в тендере {tender.id}")
+            errors.append({"tender_id": tender.id, "module": "tender_processing",
+                           "error_message": f"Отсутствует url или file_name: {url}"})
+            docs[file_name] = {"tender_id": tender.id, "file_name": file_name, "url": url,
+                               "storage_location": "original", "status": "error"}
+        else:
+            # Повтор file_name внутри тендера перезаписывает предыдущий: ON CONFLICT не может
+            # обновить одну строку дважды в одном запросе
+            docs[doc.file_name] = {"tender_id": tender.id, "file_name": doc.file_name, "url": doc.url,
+                                   "storage_location": "s3", "status": "downloaded"}
+    return list(docs.values()), errors
+
+def _chunks(rows: list[dict]):
+    if not rows:
+        return
+    size = max(1, MAX_BIND_PARAMS // len(rows[0]))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+async def _insert_children(db: AsyncSession, tenders: list[TenderRequest]) -> None:
+    lots, docs, errors = [], [], []
+    for tender in tenders:
+        lots.extend(lot_rows(tender))
+        tender_docs, tender_errors = document_rows(tender)
+        docs.extend(tender_docs)
+        errors.extend(tender_errors)
+
+    for chunk in _chunks(lots):
+        await db.execute(insert(LotModel).values(chunk))
+    for chunk in _chunks(docs):
+        stmt = insert(DocumentModel).values(chunk)
+        await db.execute(stmt.on_conflict_do_update(
+            constraint="uq_tender_file",
+            set_={
+                "url": stmt.excluded.url,
+                "storage_location": stmt.excluded.storage_location,
+                "status": stmt.excluded.status,
+            }
+        ))
+    for chunk in _chunks(errors):
+        await db.execute(insert(Error).values(chunk))
+
+async def save_tenders_bulk(db: AsyncSession, tenders: list[tuple[TenderRequest, str]],
+                            commit: bool = True) -> set[str]:
+    """Сохраняет пачку тендеров с лотами и документами многострочными INSERT в одной транзакции.
+
+    Возвращает external_id реально вставленных тендеров: уже существующие пропускаются
+    через ON CONFLICT DO NOTHING, поэтому гонка двух одновременных запросов не даёт ошибки.
+    С commit=False транзакция остаётся открытой, чтобы вызывающий код дописал в неё своё.
+    """
+    inserted = set()
     try:
-        db_tender = Tender(
-            external_id=tender.id,
-            title=tender.title,
-            notification_number=tender.notification_number,
-            notification_type=tender.notification_type,
-            organizer=tender.organizer,
-            initial_price=tender.initial_sum.price,
-            currency=tender.initial_sum.currency,
-            application_deadline=tender.application_deadline,
-            etp_code=tender.etp.code if tender.etp else None,
-            etp_name=tender.etp.name if tender.etp else None,
-            etp_url=tender.etp.url if tender.etp else None,
-            kontur_link=tender.kontur_link,
-            publication_date=tender.publication_date,
-            last_modified=tender.last_modified,
-            selection_method=tender.selection_method,
-            smp=tender.smp,
-            type=type_name,
-            state="RECEIVED"
-        )
-        db.add(db_tender)
-        await db.commit()
-        await db.refresh(db_tender)
-
-        # Сохраняем документы и лоты в рамках одной транзакции
-        if tender.docs:
-            if not await save_documents(db, tender.id, tender.docs, tender.kontur_link):
-                raise Exception("Failed to save documents")
-        for lot in tender.lots:
-            await create_lot(
-                db,
-                tender.id,
-                lot.title,
-                lot.initial_sum.price,
-                lot.initial_sum.currency,
-                lot.delivery_place,
-                lot.delivery_term,
-                lot.payment_term
+        for chunk in _chunks([tender_row(tender, type_name) for tender, type_name in tenders]):
+            result = await db.execute(
+                insert(Tender).values(chunk)
+                .on_conflict_do_nothing(index_elements=[Tender.external_id])
+                .returning(Tender.external_id)
             )
+            inserted.update(result.scalars().all())
+        await _insert_children(db, [tender for tender, _ in tenders if tender.id in inserted])
+        if commit:
+            await db.commit()
+        logger.info(f"Saved {len(inserted)} of {len(tenders)} tenders in one transaction")
+        return inserted
+    except Exception as e:
+        logger.error(f"Error saving tender batch of {len(tenders)}: {str(e)}")
+        await db.rollback()
+        raise
+
+async def save_tender(db: AsyncSession, tender: TenderRequest, type_name: str) -> Tender | None:
+    """Сохраняет тендер, его лоты и документы за один коммит без промежуточных refresh."""
+    try:
+        result = await db.scalars(
+            insert(Tender).values(tender_row(tender, type_name))
+            .on_conflict_do_nothing(index_elements=[Tender.external_id])
+            .returning(Tender)
+        )
+        db_tender = result.first()
+        if db_tender is None:
+            logger.warning(f"Tender {tender.id} already exists")
+            await db.rollback()
+            return None
+
+        await _insert_children(db, [tender])
         await db.commit()
         return db_tender
 
@@ -82,7 +203,16 @@ async def save_tender(db: AsyncSession, tender: TenderRequest, type_name: str) -
 
 async def tender_to_schema(tender: Tender, db: AsyncSession) -> TenderRequest:
     docs = await get_documents_by_tender_id(db, tender.external_id)
-    lots = await get_lots_by_tender_id(db, tender.external_id)
+    lots = [
+        Lot(
+            title=lot.title,
+            initial_sum=Money(price=float(lot.initial_sum or 0), currency=lot.currency or ""),
+            delivery_place=lot.delivery_place,
+            delivery_term=lot.delivery_term,
+            payment_term=lot.payment_term
+        )
+        for lot in await get_lots_by_tender_id(db, tender.external_id)
+    ]
     etp = Etp(code=tender.etp_code, name=tender.etp_name, url=tender.etp_url) if tender.etp_code else None
     return TenderRequest(
         id=tender.external_id,
@@ -90,7 +220,7 @@ async def tender_to_schema(tender: Tender, db: AsyncSession) -> TenderRequest:
         notification_number=tender.notification_number,
         notification_type=tender.notification_type,
         organizer=tender.organizer or {},
-        initial_sum={"price": tender.initial_price, "currency": tender.currency},
+        initial_sum={"price": float(tender.initial_price or 0), "currency": tender.currency or ""},
         application_deadline=tender.application_deadline,
         publication_date=tender.publication_date,
         last_modified=tender.last_modified,
@@ -0,0 +1,42 @@
+"""Tender processing job queue
+
+Revision ID: 2_create_tender_jobs
+Revises: 1_create_tables
+Create Date: 2025-04-07 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '2_create_tender_jobs'
+down_revision = '1_create_tables'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ### Создание таблицы tender_jobs ###
+    op.create_table(
+        'tender_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tender_id', sa.String(), nullable=False),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('run_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['tender_id'], ['tenders.external_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_tender_jobs_id', 'id'),
+        sa.Index('ix_tender_jobs_status_run_at', 'status', 'run_at'),
+        sa.Index('uq_tender_jobs_queued', 'tender_id', unique=True, postgresql_where=sa.text("status = 'queued'"))
+    )
+
+def downgrade():
+    op.drop_table('tender_jobs')
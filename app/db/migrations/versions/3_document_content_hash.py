@@ -0,0 +1,26 @@
+"""Content-addressed document storage
+
+Revision ID: 3_document_content_hash
+Revises: 2_create_tender_jobs
+Create Date: 2025-04-09 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '3_document_content_hash'
+down_revision = '2_create_tender_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('documents', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('mime_type', sa.String(), nullable=True))
+    op.create_index('ix_documents_content_hash', 'documents', ['content_hash'])
+
+def downgrade():
+    op.drop_index('ix_documents_content_hash', table_name='documents')
+    op.drop_column('documents', 'mime_type')
+    op.drop_column('documents', 'size')
+    op.drop_column('documents', 'content_hash')
@@ -0,0 +1,33 @@
+"""Conditional document refetch cache
+
+Revision ID: 4_document_fetch_cache
+Revises: 3_document_content_hash
+Create Date: 2025-04-10 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '4_document_fetch_cache'
+down_revision = '3_document_content_hash'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ### Создание таблицы document_fetch_cache ###
+    op.create_table(
+        'document_fetch_cache',
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('etag', sa.String(), nullable=True),
+        sa.Column('last_modified', sa.String(), nullable=True),
+        sa.Column('content_length', sa.BigInteger(), nullable=True),
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=True),
+        sa.Column('mime_type', sa.String(), nullable=True),
+        sa.Column('s3_url', sa.String(), nullable=False),
+        sa.Column('fetched_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('url')
+    )
+
+def downgrade():
+    op.drop_table('document_fetch_cache')
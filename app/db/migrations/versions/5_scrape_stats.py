@@ -0,0 +1,30 @@
+"""Per-domain document scraping stats
+
+Revision ID: 5_scrape_stats
+Revises: 4_document_fetch_cache
+Create Date: 2025-04-11 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '5_scrape_stats'
+down_revision = '4_document_fetch_cache'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ### Создание таблицы scrape_stats ###
+    op.create_table(
+        'scrape_stats',
+        sa.Column('domain', sa.String(), nullable=False),
+        sa.Column('http_success', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('browser_success', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('browser_seconds', sa.Float(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('domain')
+    )
+
+def downgrade():
+    op.drop_table('scrape_stats')
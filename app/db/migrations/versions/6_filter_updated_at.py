@@ -0,0 +1,21 @@
+"""Filter version timestamp for the compiled filter cache
+
+Revision ID: 6_filter_updated_at
+Revises: 5_scrape_stats
+Create Date: 2025-04-14 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '6_filter_updated_at'
+down_revision = '5_scrape_stats'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('filters', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(),
+                                       nullable=False))
+
+def downgrade():
+    op.drop_column('filters', 'updated_at')
@@ -0,0 +1,30 @@
+"""Per-filter evaluation stats
+
+Revision ID: 7_filter_stats
+Revises: 6_filter_updated_at
+Create Date: 2025-04-15 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '7_filter_stats'
+down_revision = '6_filter_updated_at'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ### Создание таблицы filter_stats ###
+    op.create_table(
+        'filter_stats',
+        sa.Column('filter_id', sa.Integer(), nullable=False),
+        sa.Column('evaluations', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('matches', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('passes', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('total_ns', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('filter_id')
+    )
+
+def downgrade():
+    op.drop_table('filter_stats')
@@ -0,0 +1,20 @@
+"""Index ai_checks by AI task id
+
+Revision ID: 8_ai_checks_task_id
+Revises: 7_filter_stats
+Create Date: 2025-04-16 10:00:00
+"""
+
+from alembic import op
+
+revision = '8_ai_checks_task_id'
+down_revision = '7_filter_stats'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Callback AI-сервиса и общий поллер ищут проверку по task_id
+    op.create_index('ix_ai_checks_task_id', 'ai_checks', ['task_id'])
+
+def downgrade():
+    op.drop_index('ix_ai_checks_task_id', table_name='ai_checks')
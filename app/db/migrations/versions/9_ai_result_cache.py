@@ -0,0 +1,33 @@
+"""AI result cache by document content hash
+
+Revision ID: 9_ai_result_cache
+Revises: 8_ai_checks_task_id
+Create Date: 2025-04-17 10:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '9_ai_result_cache'
+down_revision = '8_ai_checks_task_id'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ### Создание таблицы ai_result_cache ###
+    op.create_table(
+        'ai_result_cache',
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('model_version', sa.String(), nullable=False),
+        sa.Column('ai_status', sa.String(), nullable=False),
+        sa.Column('ai_response', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash', 'model_version')
+    )
+    op.add_column('ai_checks', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('ai_checks', sa.Column('from_cache', sa.Boolean(), server_default='false', nullable=False))
+
+def downgrade():
+    op.drop_column('ai_checks', 'from_cache')
+    op.drop_column('ai_checks', 'content_hash')
+    op.drop_table('ai_result_cache')
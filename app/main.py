@@ -1,14 +1,26 @@
 import asyncpg
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import routes
 from app.core.config import settings
+from app.services.s3_client import init_s3_client, close_s3_client
+from app.services.http_sessions import init_http_sessions, close_http_sessions
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Общие клиенты внешних сервисов живут всё время работы процесса
+    await init_s3_client()
+    await init_http_sessions()
+    yield
+    await close_http_sessions()
+    await close_s3_client()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, func
 from app.models.base import Base
 
 class AICheck(Base):
@@ -8,5 +8,7 @@ class AICheck(Base):
     tender_id = Column(String, ForeignKey("tenders.external_id", ondelete="CASCADE"), nullable=False)
     ai_status = Column(String, nullable=False)
     ai_response = Column(Text)
-    task_id = Column(Text)
+    task_id = Column(Text, index=True)
+    content_hash = Column(String)  # ключ ai_result_cache для документов проверки
+    from_cache = Column(Boolean, nullable=False, server_default="false", default=False)
     checked_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
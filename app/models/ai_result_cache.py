@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Text, DateTime, func
+from app.models.base import Base
+
+class AIResultCache(Base):
+    """Результат разбора AI по хешу содержимого документов и версии модели."""
+    __tablename__ = "ai_result_cache"
+
+    content_hash = Column(String, primary_key=True)
+    model_version = Column(String, primary_key=True)
+    ai_status = Column(String, nullable=False)
+    ai_response = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
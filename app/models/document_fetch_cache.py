@@ -0,0 +1,16 @@
+from sqlalchemy import BigInteger, Column, String, DateTime, func
+from app.models.base import Base
+
+class DocumentFetchCache(Base):
+    """Валидаторы HTTP-кэша исходного URL документа и то, во что он был сохранён."""
+    __tablename__ = "document_fetch_cache"
+
+    url = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)  # значение заголовка Last-Modified как есть
+    content_length = Column(BigInteger)
+    content_hash = Column(String, nullable=False)
+    size = Column(BigInteger)
+    mime_type = Column(String)
+    s3_url = Column(String, nullable=False)
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from app.models.base import Base
@@ -13,6 +13,9 @@ class Document(Base):
     url = Column(String, nullable=False)
     storage_location = Column(String, default="s3")
     status = Column(String, default="pending")
+    content_hash = Column(String, index=True)  # sha256 содержимого, ключ blob в S3
+    size = Column(BigInteger)
+    mime_type = Column(String)
     tender = relationship("Tender", back_populates="docs")
 
 
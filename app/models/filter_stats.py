@@ -0,0 +1,13 @@
+from sqlalchemy import BigInteger, Column, Integer, DateTime, func
+from app.models.base import Base
+
+class FilterStat(Base):
+    """Накопленная статистика проверок фильтра по всем процессам."""
+    __tablename__ = "filter_stats"
+
+    filter_id = Column(Integer, primary_key=True)
+    evaluations = Column(BigInteger, nullable=False, server_default="0")
+    matches = Column(BigInteger, nullable=False, server_default="0")
+    passes = Column(BigInteger, nullable=False, server_default="0")
+    total_ns = Column(BigInteger, nullable=False, server_default="0")  # время проверки вместе с дочерними
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -19,4 +19,5 @@ class Filter(Base):
     parent_id = Column(Integer, ForeignKey("filters.id"), nullable=True)
     active = Column(Boolean, default=True, nullable=False)
     success_action = Column(Integer, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
\ No newline at end of file
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from app.models.base import Base
+
+class TenderJob(Base):
+    __tablename__ = "tender_jobs"
+    __table_args__ = (
+        # Не больше одной ожидающей задачи на тендер
+        Index("uq_tender_jobs_queued", "tender_id", unique=True, postgresql_where=text("status = 'queued'")),
+        Index("ix_tender_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tender_id = Column(String, ForeignKey("tenders.external_id", ondelete="CASCADE"), nullable=False)
+    type = Column(String)
+    payload = Column(JSONB)  # TenderRequest на момент приёма; None — восстановить из базы
+    status = Column(String, nullable=False, default="queued")  # queued / running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_by = Column(String)
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
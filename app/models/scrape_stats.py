@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Integer, Float, DateTime, func
+from app.models.base import Base
+
+class ScrapeStat(Base):
+    """Счётчики скрапинга документов по домену страницы тендера."""
+    __tablename__ = "scrape_stats"
+
+    domain = Column(String, primary_key=True)
+    http_success = Column(Integer, nullable=False, server_default="0")
+    browser_success = Column(Integer, nullable=False, server_default="0")
+    failed = Column(Integer, nullable=False, server_default="0")
+    browser_seconds = Column(Float, nullable=False, server_default="0")  # суммарное время работы браузера
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Any
+
+class AICallback(BaseModel):
+    # Тот же формат, что у ответа /task_status
+    task_id: str
+    status: str
+    result: Any = None
+
+class AICacheStats(BaseModel):
+    model_version: str
+    entries: int  # записей текущей версии модели, включая устаревшие по TTL
+    hits: int  # проверок, взятых из кэша
+    misses: int  # проверок, отправленных в AI
+    hit_rate: float = 0.0
+
+class AICacheInvalidateResponse(BaseModel):
+    deleted: int
@@ -8,6 +8,21 @@ class Document(BaseModel):
     url: str
     storage_location: Optional[str] = None
     status: Optional[str] = None
+    content_hash: Optional[str] = None
+    size: Optional[int] = None
+    mime_type: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ScrapeStatResponse(BaseModel):
+    domain: str
+    http_success: int
+    browser_success: int
+    failed: int
+    browser_seconds: float
+    http_share: float  # доля успешных скрапингов без браузера
+    browser_seconds_saved: float  # оценка: среднее время браузера * успехи HTTP-пути
+
+    class Config:
+        from_attributes = True
@@ -23,6 +23,7 @@ class FilterCreate(FilterBase):
 class Filter(FilterBase):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -37,4 +38,28 @@ class FilterListResponse(BaseModel):
     filters: List[FilterShort]
     total: int
     page: int
-    per_page: int
\ No newline at end of file
+    per_page: int
+
+class FilterPreviewResponse(BaseModel):
+    window_days: int
+    total: int
+    passed: int
+    rejected: int
+    sample_passed: List[str]  # последние по времени создания
+    sample_rejected: List[str]
+    cached: bool = False
+
+
+class FilterStatsItem(BaseModel):
+    filter_id: int
+    title: str
+    type: str
+    parent_id: Optional[int] = None
+    priority: int
+    success_action: Optional[int] = None
+    active: bool
+    evaluations: int = 0
+    matches: int = 0
+    passes: int = 0
+    match_rate: float = 0.0
+    avg_time_us: float = 0.0  # вместе с проверкой дочерних фильтров
@@ -73,4 +73,19 @@ class TenderResponse(BaseModel):
     state: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class TenderIngestResult(BaseModel):
+    tender_id: str
+    result: str  # accepted / duplicate / invalid
+    state: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class BatchTenderResponse(BaseModel):
+    status: str
+    accepted: int
+    duplicates: int
+    invalid: int
+    results: List[TenderIngestResult]
\ No newline at end of file
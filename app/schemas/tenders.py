@@ -43,6 +43,21 @@ class TenderShort(BaseModel):
     class Config:
         from_attributes = True
 
+class TenderMatch(BaseModel):
+    """Строка NDJSON-ответа со списком тендеров, подходящих под фильтр."""
+    external_id: str
+    title: str
+    type: Optional[str] = None
+    state: str
+    initial_price: Optional[float] = None
+    currency: Optional[str] = None
+    publication_date: Optional[datetime] = None
+    application_deadline: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class TenderListResponse(BaseModel):
     tenders: List[TenderShort]
     total: int
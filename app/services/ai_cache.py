@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.ai_result_cache import get_cached_result, save_cached_result
+from app.core.config import settings
+from app.core.logging_config import logger
+
+# Окончательные ответы модели; ERROR и TIMEOUT не кэшируем, их стоит повторить
+CACHEABLE_STATUSES = ("SUCCESS", "REJECTED")
+
+
+class AIResultCache:
+    """Результаты AI по хешу содержимого документов для текущей AI_MODEL_VERSION.
+
+    Основное хранилище — таблица ai_result_cache (записи живут ttl секунд),
+    перед ней — LRU процесса на max_entries записей. Локальная запись
+    доверяется не дольше local_ttl секунд, поэтому ручная инвалидация через
+    API доходит до воркеров за это время.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, local_ttl: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self._entries: OrderedDict[str, tuple[float, str, str | None]] = OrderedDict()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _remember(self, content_hash: str, ai_status: str, ai_response: str | None) -> None:
+        self._entries[content_hash] = (time.monotonic(), ai_status, ai_response)
+        self._entries.move_to_end(content_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, db: AsyncSession, content_hash: str) -> tuple[str, str | None] | None:
+        """(ai_status, ai_response) прошлой проверки тех же документов или None."""
+        entry = self._entries.get(content_hash)
+        if entry is not None:
+            if time.monotonic() - entry[0] < min(self.local_ttl, self.ttl):
+                self._entries.move_to_end(content_hash)
+                return entry[1], entry[2]
+            del self._entries[content_hash]
+
+        cached = await get_cached_result(db, content_hash, settings.AI_MODEL_VERSION, self.ttl)
+        if cached is None:
+            return None
+        self._remember(content_hash, cached.ai_status, cached.ai_response)
+        return cached.ai_status, cached.ai_response
+
+    async def put(self, db: AsyncSession, content_hash: str, ai_status: str, ai_response: str | None) -> None:
+        if ai_status not in CACHEABLE_STATUSES:
+            return
+        try:
+            await save_cached_result(db, content_hash, settings.AI_MODEL_VERSION, ai_status, ai_response)
+        except Exception as e:
+            logger.error(f"Failed to cache AI result for {content_hash}: {str(e)}")
+            await db.rollback()
+            return
+        self._remember(content_hash, ai_status, ai_response)
+
+
+ai_result_cache = AIResultCache(settings.AI_CACHE_TTL, settings.AI_CACHE_SIZE, settings.AI_CACHE_LOCAL_TTL)
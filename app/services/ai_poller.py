@@ -0,0 +1,176 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from app.core.config import settings
+from app.core.logging_config import logger
+from app.crud.ai_checks import finish_ai_check, get_finished_ai_checks
+from app.crud.jobs import enqueue_tender_jobs
+from app.db.database import AsyncSessionLocal
+from app.services.http_sessions import get_http_session
+
+# Статусы задачи AI, после которых результат больше не меняется
+TERMINAL_STATUSES = ("SUCCESS", "REJECTED", "ERROR")
+
+
+async def fetch_task_status(task_id: str) -> dict | None:
+    """Один запрос /task_status; None — статус пока не получен (ошибка сервиса или сети)."""
+    session = get_http_session("ai")
+    url = f"{settings.AI_API_BASE_URL}/task_status/{task_id}"
+    headers = {"Authorization": f"Bearer {settings.AI_API_TOKEN}"}
+    try:
+        async with session.get(url, headers=headers) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            if resp.status == 404:
+                return {"status": "ERROR", "result": "Task not found"}
+            logger.warning(f"Polling task {task_id}: unexpected status code {resp.status}")
+    except Exception as e:
+        logger.warning(f"Error polling task {task_id}: {str(e)}")
+    return None
+
+
+@dataclass
+class _PendingTask:
+    future: asyncio.Future
+    deadline: float
+    interval: float
+    next_check: float
+    tender_id: str | None
+    tender_type: str | None
+
+
+class AIPoller:
+    """Общий на процесс опрос задач AI вместо отдельной корутины с опросом на каждый тендер.
+
+    Задачи регистрируются через watch(). За проход цикл одним запросом к БД
+    забирает результаты, уже записанные callback'ом, и параллельно, не больше
+    batch_size за раз, спрашивает /task_status у задач, чей срок проверки
+    наступил. После каждого «ещё не готово» или ошибки интервал задачи растёт в
+    backoff раз до max_interval. Если AI-сервис присылает callback, удалённый
+    опрос сразу идёт с max_interval — только как страховка от потерянного вызова.
+    Найденный поллером результат записывается в ai_checks, а для тендера
+    ставится задача в очередь, которая продолжит конвейер с AI_PROCESSING.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float, batch_size: int):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self._pending: dict[str, _PendingTask] = {}
+        self._runner: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def watch(self, task_id: str, tender_id: str | None = None, tender_type: str | None = None,
+              timeout: float | None = None) -> asyncio.Future:
+        """Начинает следить за задачей; повторный вызов для той же задачи возвращает тот же future.
+
+        Future получает результат в формате /task_status: {"status": ..., "result": ...},
+        по истечении timeout — статус TIMEOUT.
+        """
+        loop = asyncio.get_running_loop()
+        entry = self._pending.get(task_id)
+        if entry is None:
+            now = loop.time()
+            interval = self.max_interval if settings.AI_CALLBACK_URL else self.min_interval
+            entry = self._pending[task_id] = _PendingTask(
+                future=loop.create_future(),
+                deadline=now + (timeout or settings.AI_TASK_TIMEOUT),
+                interval=interval,
+                next_check=now + interval,
+                tender_id=tender_id,
+                tender_type=tender_type,
+            )
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return entry.future
+
+    async def _resolve(self, task_id: str, task_data: dict, persist: bool = True) -> None:
+        entry = self._pending.pop(task_id, None)
+        if persist:
+            try:
+                async with AsyncSessionLocal() as db:
+                    finished = await finish_ai_check(db, task_id, task_data.get("status"),
+                                                     json.dumps(task_data.get("result", "No data"), ensure_ascii=False),
+                                                     commit=False)
+                    # Если результат уже записал callback, задачу в очередь поставил он
+                    if finished and entry is not None and entry.tender_id:
+                        await enqueue_tender_jobs(db, [(None, entry.tender_type, entry.tender_id)], commit=False)
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"Failed to save AI result for task {task_id}: {str(e)}")
+        if entry is not None and not entry.future.done():
+            entry.future.set_result(task_data)
+
+    async def _collect_finished(self) -> None:
+        async with AsyncSessionLocal() as db:
+            checks = await get_finished_ai_checks(db, list(self._pending))
+        for check in checks:
+            try:
+                result = json.loads(check.ai_response) if check.ai_response else "No data"
+            except json.JSONDecodeError:
+                result = check.ai_response
+            logger.info(f"Task {check.task_id} finished with status {check.ai_status} (reported by callback)")
+            await self._resolve(check.task_id, {"status": check.ai_status, "result": result}, persist=False)
+
+    async def _check(self, task_id: str) -> None:
+        task_data = await fetch_task_status(task_id)
+        entry = self._pending.get(task_id)
+        if entry is None:
+            return
+        if task_data and task_data.get("status") in TERMINAL_STATUSES:
+            await self._resolve(task_id, task_data)
+            return
+        entry.interval = min(entry.interval * self.backoff, self.max_interval)
+        entry.next_check = asyncio.get_running_loop().time() + entry.interval
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        await self._collect_finished()
+        now = loop.time()
+        for task_id, entry in list(self._pending.items()):
+            if now >= entry.deadline:
+                logger.error(f"Task {task_id} polling timed out")
+                await self._resolve(task_id, {"status": "TIMEOUT", "result": "Task polling timed out"})
+        due = sorted((entry.next_check, task_id) for task_id, entry in self._pending.items() if entry.next_check <= now)
+        if due:
+            await asyncio.gather(*(self._check(task_id) for _, task_id in due[:self.batch_size]))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.error(f"AI poller iteration failed: {str(e)}")
+            if not self._pending:
+                break
+            # Результаты callback'ов подхватываются не реже чем раз в min_interval
+            next_check = min(entry.next_check for entry in self._pending.values())
+            delay = min(max(next_check - loop.time(), 0.0), self.min_interval)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        if self._runner is not None and not self._runner.done():
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+        for entry in self._pending.values():
+            entry.future.cancel()
+        self._pending.clear()
+
+
+ai_poller = AIPoller(settings.AI_POLL_MIN_INTERVAL, settings.AI_POLL_MAX_INTERVAL, settings.AI_POLL_BACKOFF,
+                     settings.AI_POLL_BATCH_SIZE)
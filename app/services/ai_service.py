@@ -1,147 +1,299 @@
 import asyncio
+from contextlib import AsyncExitStack
+from typing import AsyncIterator
+from pathlib import Path
+from urllib.parse import unquote, urlparse
 import aiohttp
-import aiobotocore.session
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.tenders import Tender
+from app.models.documents import Document
 from app.models.ai_checks import AICheck
 from app.core.logging_config import logger
 from app.core.config import settings
+from app.services.s3_client import get_s3_client
+from app.services.s3_uploader import s3_key_for
+from app.services.http_sessions import get_http_session
+from app.services.ai_cache import ai_result_cache
+import hashlib
 import json
 import os
 
 SUPPORTED_FORMATS = {".txt", ".doc", ".docx", ".pdf", ".xlsx", ".xls", ".html"}
+READ_CHUNK_SIZE = 1024 * 1024
 
-async def process_with_ai(tender: Tender, db: AsyncSession) -> bool:
+def select_ai_documents(docs: list[Document]) -> list[Document]:
+    """Документы для AI в порядке тендера: сохранённые в S3 или в спуле, поддерживаемый формат,
+    не больше AI_MAX_DOCUMENT_SIZE, суммарно не больше AI_MAX_TOTAL_SIZE.
+    Документы без известного размера проверяются после чтения."""
+    selected, total = [], 0
+    for doc in docs:
+        file_name = (doc.file_name or "").lower()
+        if not doc.url or not file_name.endswith(tuple(SUPPORTED_FORMATS)):
+            continue
+        # Не скачанный документ хранит ссылку клиента; content_hash сам по себе не годится —
+        # повторный приём тендера перезаписывает url, оставляя хеш
+        if s3_key_for(doc.url) is None and local_path(doc.url) is None:
+            logger.warning(f"Document {doc.file_name} is not stored ({doc.url}), skipped")
+            continue
+        if doc.size is not None:
+            if doc.size > settings.AI_MAX_DOCUMENT_SIZE or total + doc.size > settings.AI_MAX_TOTAL_SIZE:
+                logger.warning(f"Document {doc.file_name} ({doc.size} bytes) exceeds AI size limits, skipped")
+                continue
+            total += doc.size
+        selected.append(doc)
+    return selected
+
+def documents_hash(hashes: list[str]) -> str:
+    """Ключ кэша AI для набора документов; для одного документа — его собственный хеш."""
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256("\n".join(sorted(hashes)).encode()).hexdigest()
+
+def local_path(doc_url: str) -> str | None:
+    """Путь на диске для file:// и абсолютных путей внутри AI_LOCAL_SPOOL_DIR; None — документ не из спула.
+
+    Ссылки документов приходят от клиентов API, поэтому без настроенного спула с диска
+    не читается ничего, а путь сверяется с каталогом после раскрытия симлинков и "..".
+    """
+    if not settings.AI_LOCAL_SPOOL_DIR:
+        return None
+    if doc_url.startswith("file://"):
+        parsed = urlparse(doc_url)
+        if parsed.netloc not in ("", "localhost"):
+            return None
+        path = unquote(parsed.path)
+    elif os.path.isabs(doc_url):
+        path = doc_url
+    else:
+        return None
+    spool = os.path.realpath(settings.AI_LOCAL_SPOOL_DIR)
+    path = os.path.realpath(path)
+    if path == spool or os.path.commonpath([spool, path]) != spool:
+        return None
+    return path
+
+async def _iter_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, READ_CHUNK_SIZE):
+            yield chunk
+
+async def open_document(doc_url: str, stack: AsyncExitStack) -> tuple[int | None, AsyncIterator[bytes]]:
+    """Открывает документ на чтение частями: (размер, если известен, итератор частей).
+
+    Тело S3 или HTTP-ответ закрывается вместе со stack. Ошибки не перехватываются.
+    """
+    path = local_path(doc_url)
+    if path is not None:
+        return os.path.getsize(path), _iter_file(path)
+    s3_key = s3_key_for(doc_url)
+    if s3_key is not None:
+        s3_client = await get_s3_client()
+        response = await s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
+        body = await stack.enter_async_context(response['Body'])
+        return response.get('ContentLength'), body.iter_chunks(READ_CHUNK_SIZE)
+    # file:// и пути вне спула сюда тоже доходят: по HTTP их не запрашиваем
+    if urlparse(doc_url).scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported document location {doc_url}")
+    session = get_http_session("documents")
+    response = await stack.enter_async_context(session.get(doc_url))
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}")
+    return response.content_length, response.content.iter_chunked(READ_CHUNK_SIZE)
+
+async def _collect(doc_url: str, chunks: AsyncIterator[bytes], limit: int | None) -> bytes | None:
+    parts, size = [], 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if limit is not None and size > limit:
+            logger.warning(f"Document {doc_url} is larger than {limit} bytes, skipped")
+            return None
+        parts.append(chunk)
+    return b"".join(parts)
+
+async def load_documents(docs: list[Document], stack: AsyncExitStack,
+                         stream: bool = False) -> list[tuple[Document, bytes | AsyncIterator[bytes]]]:
+    """Открывает документы параллельно; пропускает нечитаемые и не влезающие в лимиты размера.
+
+    При stream=True документ с известными хешем и размером отдаётся итератором
+    частей, который читается прямо в запрос к AI; остальные читаются в память.
+    """
+    slots = asyncio.Semaphore(settings.AI_FETCH_CONCURRENCY)
+
+    async def load(doc: Document) -> tuple[int, bytes | AsyncIterator[bytes]] | None:
+        async with slots:
+            try:
+                size, chunks = await open_document(doc.url, stack)
+                if size is not None and size > settings.AI_MAX_DOCUMENT_SIZE:
+                    logger.warning(f"Document {doc.file_name} ({size} bytes) exceeds AI size limits, skipped")
+                    return None
+                # Без хеша содержимое нужно целиком, чтобы посчитать ключ кэша
+                if stream and size is not None and doc.content_hash:
+                    return size, chunks
+                content = await _collect(doc.url, chunks, settings.AI_MAX_DOCUMENT_SIZE)
+            except Exception as e:
+                logger.error(f"Failed to read {doc.url}: {str(e)}")
+                return None
+            return (len(content), content) if content is not None else None
+
+    results = await asyncio.gather(*(load(doc) for doc in docs))
+    loaded, total = [], 0
+    for doc, result in zip(docs, results):
+        if result is None:
+            continue
+        size, payload = result
+        if total + size > settings.AI_MAX_TOTAL_SIZE:
+            logger.warning(f"Document {doc.file_name} does not fit into the AI payload budget, skipped")
+            continue
+        total += size
+        loaded.append((doc, payload))
+    return loaded
+
+async def document_urls(docs: list[Document]) -> list[tuple[str, str]]:
+    """Ссылки, по которым AI сам скачает документы: presigned URL для S3, file:// для спула.
+
+    Документы не из хранилища пропускаются: их ссылки пришли от клиента API.
+    """
+    urls = []
+    for doc in docs:
+        path = local_path(doc.url)
+        if path is not None:
+            # Локальный спул AI-заглушка читает по file://
+            urls.append((doc.file_name, Path(path).as_uri()))
+            continue
+        s3_key = s3_key_for(doc.url)
+        if s3_key is None:
+            logger.warning(f"Document {doc.file_name} is not stored ({doc.url}), not passed to AI")
+            continue
+        s3_client = await get_s3_client()
+        url = await s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.S3_BUCKET_NAME, "Key": s3_key},
+            ExpiresIn=settings.AI_PRESIGNED_URL_TTL,
+        )
+        urls.append((doc.file_name, url))
+    return urls
+
+async def save_ai_check(db: AsyncSession, **fields) -> AICheck:
+    ai_check = AICheck(**fields)
+    db.add(ai_check)
+    await db.commit()
+    await db.refresh(ai_check)
+    return ai_check
+
+async def submit_to_ai(tender: Tender, db: AsyncSession) -> AICheck | None:
+    """Отправляет документы тендера в AI одним запросом и сохраняет проверку со статусом PENDING.
+
+    None — отправить не удалось. Результат не ждём: его записывают в ai_checks
+    callback или ai_poller. Если документы с тем же содержимым уже разбирались
+    текущей версией модели, в AI ничего не отправляется, а проверка сразу
+    сохраняется с прошлым результатом.
+    """
     tender_id = tender.external_id
     logger.info(f"Starting AI processing for tender {tender_id}")
 
     if not tender.docs:
         logger.error(f"No documents found for tender {tender_id}")
-        return False
+        return None
+
+    docs = select_ai_documents(tender.docs)
+    if not docs:
+        logger.error(f"No suitable documents for tender {tender_id} among {len(tender.docs)}")
+        return None
+
+    # Хеши содержимого известны с загрузки в S3: кэш проверяем до скачивания
+    content_hash = cached = None
+    if all(doc.content_hash for doc in docs):
+        content_hash = documents_hash([doc.content_hash for doc in docs])
+        cached = await ai_result_cache.get(db, content_hash)
+
+    task_id = None
+    if cached is None:
+        async with AsyncExitStack() as stack:
+            if settings.AI_DOCUMENT_TRANSFER == "url":
+                files = await document_urls(docs)
+                if not files:
+                    logger.error(f"No document URLs for tender {tender_id}")
+                    return None
+            else:
+                loaded = await load_documents(docs, stack, stream=settings.AI_DOCUMENT_TRANSFER == "stream")
+                if not loaded:
+                    logger.error(f"Failed to read documents of tender {tender_id}")
+                    return None
+                # У старых документов хеша нет, а часть документов могла не прочитаться
+                loaded_hash = documents_hash([doc.content_hash or hashlib.sha256(payload).hexdigest()
+                                              for doc, payload in loaded])
+                if loaded_hash != content_hash:
+                    content_hash = loaded_hash
+                    cached = await ai_result_cache.get(db, content_hash)
+                files = [(doc.file_name, payload) for doc, payload in loaded]
+            # Отправляем файлы в AI и получаем task_id
+            if cached is None:
+                task_id = await send_to_ai_parse(files)
 
-    doc = tender.docs[0]
-    doc_url = doc.url
-    file_name = doc.file_name.lower()
-    if not doc_url or not any(file_name.endswith(fmt) for fmt in SUPPORTED_FORMATS):
-        logger.error(f"No suitable document for tender {tender_id} (URL: {doc_url}, File: {file_name})")
-        return False
+    if cached is not None:
+        ai_status, ai_response = cached
+        ai_check = await save_ai_check(db, tender_id=tender_id, ai_status=ai_status, ai_response=ai_response,
+                                       content_hash=content_hash, from_cache=True)
+        logger.info(f"AI result for tender {tender_id} taken from cache ({content_hash})")
+        return ai_check
 
-    # Отправляем файл в AI и получаем task_id
-    task_id = await send_to_ai_parse(doc_url)
     if not task_id:
         logger.error(f"Failed to send tender {tender_id} to AI")
-        return False
+        return None
 
     # Сохраняем task_id в ai_checks с начальным статусом
-    ai_check = AICheck(
-        tender_id=tender_id,
-        ai_status="PENDING",
-        task_id=task_id,
-        ai_response=None
-    )
-    db.add(ai_check)
-    await db.commit()
-    await db.refresh(ai_check)
-    logger.info(f"Saved task_id {task_id} for tender {tender_id} in ai_checks")
-
-    # Опрашиваем статус задачи
-    task_result = await poll_task(task_id)
-    if not task_result:
-        logger.error(f"Polling failed for tender {tender_id}")
-        ai_check.ai_status = "FAILED"
-        await db.commit()
-        return False
-
-    status = task_result.get("status")
-    result = task_result.get("result", "No data")
-    logger.info(f"AI result for tender {tender_id}: status={status}, result={result}")
-
-    # Обновляем запись в ai_checks с результатом
-    ai_check.ai_status = status
-    ai_check.ai_response = json.dumps(result, ensure_ascii=False)
-    await db.commit()
+    ai_check = await save_ai_check(db, tender_id=tender_id, ai_status="PENDING", task_id=task_id,
+                                   ai_response=None, content_hash=content_hash)
+    logger.info(f"Saved task_id {task_id} for tender {tender_id} in ai_checks ({len(files)} documents)")
+    return ai_check
+
+def is_ai_accepted(ai_check: AICheck) -> bool:
+    """Принят ли тендер по завершённой проверке AI."""
+    try:
+        result = json.loads(ai_check.ai_response) if ai_check.ai_response else None
+    except json.JSONDecodeError:
+        result = None
+    logger.info(f"AI result for tender {ai_check.tender_id}: status={ai_check.ai_status}, result={result}")
 
-    # Проверяем, принят ли тендер
     is_accepted = False
-    if status == "SUCCESS" and isinstance(result, dict) and "parameters" in result:
+    if ai_check.ai_status == "SUCCESS" and isinstance(result, dict) and "parameters" in result:
         is_accepted = any(param.get("accepted_for_recommendation", False) for param in result.get("parameters", []))
 
     return is_accepted
 
-async def send_to_ai_parse(doc_url: str) -> str | None:
-    if "storage.yandexcloud.net" in doc_url:
-        s3_key = doc_url.replace(f"{settings.S3_ENDPOINT_URL}/{settings.S3_BUCKET_NAME}/", "")
-        session = aiobotocore.session.get_session()
-        async with session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT_URL,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            region_name=settings.S3_REGION
-        ) as s3_client:
-            try:
-                response = await s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
-                file_content = await response['Body'].read()
-                filename = s3_key.split('/')[-1]
-            except Exception as e:
-                logger.error(f"Failed to download from S3 {doc_url}: {str(e)}")
-                return None
-    else:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(doc_url) as response:
-                if response.status != 200:
-                    logger.error(f"Failed to download file {doc_url}: {response.status}")
-                    return None
-                file_content = await response.read()
-                filename = doc_url.split('/')[-1]
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            headers = {"Authorization": f"Bearer {settings.AI_API_TOKEN}"}
-            form_data = aiohttp.FormData()
-            form_data.add_field('files', file_content, filename=filename)
-            form_data.add_field('details', '')
-
-            async with session.post(f"{settings.AI_API_BASE_URL}/parse", headers=headers, data=form_data) as resp:
-                if resp.status in (200, 202):
-                    data = await resp.json()
-                    task_id = data.get("task_id")
-                    if task_id:
-                        logger.info(f"File sent to AI, task_id: {task_id}, status: {resp.status}")
-                        return task_id
-                    else:
-                        logger.error(f"AI response missing task_id: {await resp.text()}")
-                        return None
+async def send_to_ai_parse(files: list[tuple[str, bytes | AsyncIterator[bytes] | str]]) -> str | None:
+    """Отправляет файлы в /parse одним multipart-запросом; возвращает task_id.
+
+    files — пары (имя, содержимое): байты, итератор частей (тело уходит
+    потоком, без буфера в памяти) или строка — ссылка, по которой AI
+    скачает файл сам (поле urls).
+    """
+    session = get_http_session("ai")
+    try:
+        headers = {"Authorization": f"Bearer {settings.AI_API_TOKEN}"}
+        form_data = aiohttp.FormData()
+        for filename, file_content in files:
+            if isinstance(file_content, str):
+                form_data.add_field('urls', file_content)
+            else:
+                form_data.add_field('files', file_content, filename=filename)
+        form_data.add_field('details', '')
+        if settings.AI_CALLBACK_URL:
+            form_data.add_field('callback_url', settings.AI_CALLBACK_URL)
+
+        async with session.post(f"{settings.AI_API_BASE_URL}/parse", headers=headers, data=form_data) as resp:
+            if resp.status in (200, 202):
+                data = await resp.json()
+                task_id = data.get("task_id")
+                if task_id:
+                    logger.info(f"{len(files)} files sent to AI, task_id: {task_id}, status: {resp.status}")
+                    return task_id
                 else:
-                    logger.error(f"Failed to send to AI: {resp.status}, response: {await resp.text()}")
+                    logger.error(f"AI response missing task_id: {await resp.text()}")
                     return None
-        except Exception as e:
-            logger.error(f"Error sending file to AI: {e}")
-            return None
-
-async def poll_task(task_id: str, timeout: int = 600, interval: int = 10) -> dict | None:
-    start_time = asyncio.get_event_loop().time()
-    async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                url = f"{settings.AI_API_BASE_URL}/task_status/{task_id}"
-                headers = {"Authorization": f"Bearer {settings.AI_API_TOKEN}"}
-                async with session.get(url, headers=headers) as resp:
-                    if resp.status == 200:
-                        task_data = await resp.json()
-                        status = task_data.get("status")
-                        if status in ["SUCCESS", "REJECTED", "ERROR"]:
-                            return task_data
-                        elif status == "IN PROGRESS":
-                            logger.info(f"Task {task_id} still in progress")
-                    else:
-                        logger.error(f"Polling: unexpected status code {resp.status}")
-                        return None
-            except Exception as e:
-                logger.error(f"Error polling task {task_id}: {e}")
+            else:
+                logger.error(f"Failed to send to AI: {resp.status}, response: {await resp.text()}")
                 return None
-
-            await asyncio.sleep(interval)
-            if asyncio.get_event_loop().time() - start_time > timeout:
-                logger.error(f"Task {task_id} polling timed out")
-                return {"status": "TIMEOUT", "result": "Task polling timed out"}
\ No newline at end of file
+    except Exception as e:
+        logger.error(f"Error sending file to AI: {e}")
+        return None
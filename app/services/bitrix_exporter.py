@@ -0,0 +1,78 @@
+import time
+from app.core.config import settings
+from app.core.logging_config import logger
+from app.crud.tenders import count_tenders_in_state, lock_tenders_in_state
+from app.db.database import AsyncSessionLocal
+from app.services.bitrix_service import export_batch_to_bitrix
+from app.services.notifications import send_telegram_alert
+from app.services.tender_state_machine import TenderStateMachine
+
+
+class BitrixBatchExporter:
+    """Пакетный экспорт тендеров из READY_FOR_EXPORT в Bitrix.
+
+    Конвейер останавливает тендер на READY_FOR_EXPORT, а воркер периодически
+    вызывает tick(). Пакет уходит, когда готовых тендеров набралось max_batch
+    или самый старый из замеченных ждёт дольше max_latency секунд. Тендеры
+    пакета заблокированы (FOR UPDATE SKIP LOCKED) до записи результата, так что
+    несколько воркеров не экспортируют один тендер дважды, а после падения
+    процесса тендеры остаются в READY_FOR_EXPORT.
+    """
+
+    def __init__(self, max_batch: int, max_latency: float):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._waiting_since: float | None = None
+
+    async def tick(self) -> None:
+        async with AsyncSessionLocal() as db:
+            ready = await count_tenders_in_state(db, "READY_FOR_EXPORT")
+        if not ready:
+            self._waiting_since = None
+            return
+        now = time.monotonic()
+        if self._waiting_since is None:
+            self._waiting_since = now
+        if ready < self.max_batch and now - self._waiting_since < self.max_latency:
+            return
+        # Полные пакеты отправляем подряд; если Bitrix не ответил, ждём следующего tick
+        while await self.flush() >= self.max_batch:
+            pass
+        self._waiting_since = None
+
+    async def flush(self) -> int:
+        """Экспортирует один пакет; возвращает число тендеров, по которым Bitrix дал ответ."""
+        decided = 0
+        async with AsyncSessionLocal() as db:
+            tenders = await lock_tenders_in_state(db, "READY_FOR_EXPORT", self.max_batch)
+            if not tenders:
+                return 0
+            logger.info(f"Exporting batch of {len(tenders)} tenders to Bitrix")
+            machines = {tender.external_id: TenderStateMachine(tender, tender.external_id) for tender in tenders}
+            for sm in machines.values():
+                await sm.start_exporting()
+
+            outcome = await export_batch_to_bitrix(tenders)
+            for tender in tenders:
+                sm = machines[tender.external_id]
+                exported = outcome.get(tender.external_id)
+                if exported is None:
+                    # До Bitrix не дошли: тендер остаётся в READY_FOR_EXPORT до следующего сброса
+                    logger.warning(f"Tender {tender.external_id} stays ready for export: batch was not delivered")
+                    continue
+                if exported:
+                    await sm.complete()
+                    logger.info(f"Tender {tender.external_id} successfully completed")
+                else:
+                    await sm.fail_export()
+                    logger.error(f"Export failed for tender {tender.external_id}")
+                tender.state = sm.state
+                decided += 1
+                if not exported:
+                    # До commit: после него атрибуты тендера истекают
+                    await send_telegram_alert(tender, "Ошибка экспорта в Bitrix")
+            await db.commit()
+        return decided
+
+
+bitrix_exporter = BitrixBatchExporter(settings.BITRIX_BATCH_MAX_SIZE, settings.BITRIX_BATCH_MAX_LATENCY)
@@ -0,0 +1,96 @@
+import asyncio
+import time
+import aiohttp
+from app.core.config import settings
+from app.core.logging_config import logger
+
+
+async def load_user_fields(session: aiohttp.ClientSession) -> dict[str, tuple[str, set[str]]] | None:
+    """Списочные пользовательские поля лида: FIELD_NAME -> (ID поля, значения); None — Bitrix не ответил."""
+    fields, start = {}, 0
+    while True:
+        payload = {"filter": {"USER_TYPE_ID": "enumeration"}, "start": start}
+        try:
+            async with session.post(f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.userfield.list", json=payload) as resp:
+                if resp.status != 200:
+                    logger.error(f"Failed to load Bitrix user fields: {resp.status}, {await resp.text()}")
+                    return None
+                data = await resp.json()
+        except Exception as e:
+            logger.error(f"Failed to load Bitrix user fields: {str(e)}")
+            return None
+        for field in data.get("result") or []:
+            values = {item.get("VALUE") for item in field.get("LIST") or []}
+            fields[field["FIELD_NAME"]] = (str(field["ID"]), values)
+        start = data.get("next")
+        if not start:
+            return fields
+
+
+async def update_user_field(session: aiohttp.ClientSession, field_id: str, enum_values: list[str]) -> bool:
+    """Добавляет значения в список поля; значения, которых нет в запросе, Bitrix не трогает."""
+    payload = {
+        "id": field_id,
+        "fields": {
+            "LIST": [{"VALUE": value} for value in enum_values]
+        }
+    }
+    try:
+        async with session.post(
+            f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.userfield.update", json=payload
+        ) as resp:
+            data = await resp.json(content_type=None) if resp.status == 200 else None
+            if data and data.get("result"):
+                logger.info(f"Updated user field {field_id} with values {enum_values}")
+                return True
+            logger.error(f"Failed to update user field {field_id}: {resp.status}, {data or await resp.text()}")
+    except Exception as e:
+        logger.error(f"Failed to update user field {field_id}: {str(e)}")
+    return False
+
+
+class UserFieldCache:
+    """Схема списочных полей лида, загружаемая из Bitrix раз в ttl секунд.
+
+    ensure() сравнивает нужные экспорту значения с загруженными и вызывает
+    crm.lead.userfield.update, только если какого-то значения ещё нет. После
+    неудачного обновления схема сбрасывается и загружается заново при
+    следующем экспорте.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._fields: dict[str, tuple[str, set[str]]] | None = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._fields = None
+
+    async def ensure(self, session: aiohttp.ClientSession, required: dict[str, list[str]]) -> None:
+        """Добавляет в поля {FIELD_NAME: значения} недостающие значения."""
+        async with self._lock:
+            if self._fields is None or time.monotonic() - self._loaded_at >= self.ttl:
+                fields = await load_user_fields(session)
+                if fields is None:
+                    return
+                self._fields, self._loaded_at = fields, time.monotonic()
+                logger.info(f"Loaded {len(fields)} Bitrix user fields")
+
+            for field_name, values in required.items():
+                field = self._fields.get(field_name)
+                if field is None:
+                    logger.warning(f"Bitrix user field {field_name} not found")
+                    continue
+                field_id, known = field
+                missing = [value for value in dict.fromkeys(values) if value and value not in known]
+                if not missing:
+                    continue
+                if await update_user_field(session, field_id, missing):
+                    known.update(missing)
+                else:
+                    self.invalidate()
+                    return
+
+
+user_field_cache = UserFieldCache(settings.BITRIX_USER_FIELDS_TTL)
@@ -1,33 +1,41 @@
+import asyncio
+from urllib.parse import urlencode
 import aiohttp
-import aiobotocore.session
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.tenders import Tender
 from app.services.notifications import send_telegram_alert
 from app.core.logging_config import logger
 from app.core.config import settings
+from app.services.s3_client import get_s3_client
+from app.services.s3_uploader import s3_key_for
+from app.services.http_sessions import get_http_session
+from app.services.bitrix_fields import user_field_cache
 
-async def upload_file_to_bitrix(session: aiohttp.ClientSession, file_url: str, tender_id: str) -> str | None:
+# Списочные пользовательские поля лида и значения, которые должны в них быть перед экспортом
+USER_FIELD_VALUES = {
+    "UF_CRM_1742608808760": ["Оплата после поставки"],
+    "UF_CRM_1742608851091": ["30 дней"],
+}
+# Ограничение Bitrix24 на число команд в одном вызове batch
+BATCH_MAX_COMMANDS = 50
 
-    if "storage.yandexcloud.net" not in file_url:
+async def upload_file_to_bitrix(session: aiohttp.ClientSession, file_url: str, tender_id: str,
+                                file_name: str | None = None) -> str | None:
+
+    s3_key = s3_key_for(file_url)
+    if s3_key is None:
         logger.error(f"Unsupported file URL for Bitrix upload: {file_url}")
         return None
 
-    s3_key = file_url.replace(f"{settings.S3_ENDPOINT_URL}/{settings.S3_BUCKET_NAME}/", "")
-    s3_session = aiobotocore.session.get_session()
-    async with s3_session.create_client(
-        "s3",
-        endpoint_url=settings.S3_ENDPOINT_URL,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        region_name=settings.S3_REGION
-    ) as s3_client:
-        try:
-            response = await s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
-            file_content = await response['Body'].read()
-            filename = s3_key.split('/')[-1]
-        except Exception as e:
-            logger.error(f"Failed to download from S3 {file_url}: {str(e)}")
-            return None
+    try:
+        s3_client = await get_s3_client()
+        response = await s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
+        async with response['Body'] as body:
+            file_content = await body.read()
+        filename = file_name or s3_key.split('/')[-1]
+    except Exception as e:
+        logger.error(f"Failed to download from S3 {file_url}: {str(e)}")
+        return None
 
     form_data = aiohttp.FormData()
     form_data.add_field("file", file_content, filename=filename)
@@ -43,89 +51,172 @@ async def upload_file_to_bitrix(session: aiohttp.ClientSession, file_url: str, t
             logger.error(f"Failed to upload file to Bitrix: {resp.status}, {await resp.text()}")
             return None
 
-async def update_user_field(session: aiohttp.ClientSession, field_id: str, enum_values: list[str]):
-
-    payload = {
-        "ID": field_id,
-        "fields": {
-            "ENUM": [{"VALUE": value} for value in enum_values]
-        }
+def lead_fields(tender: Tender, file_id: str | None) -> dict:
+    """Поля лида crm.lead.add для тендера."""
+    return {
+        "TITLE": f"{tender.lots[0].title if tender.lots else tender.title} (ID: {tender.external_id})",
+        "ASSIGNED_BY_ID": 9,
+        "SOURCE_ID": "BIDZAAR",
+        "SOURCE_DESCRIPTION": tender.etp_url or "",
+        "OPPORTUNITY": str(tender.initial_price),
+        "CURRENCY_ID": tender.currency,
+        "COMPANY_TITLE": tender.organizer.get("shortName", ""),
+        "PHONE": [{"VALUE": tender.organizer.get("phone", ""), "VALUE_TYPE": "WORK"}],
+        "EMAIL": [{"VALUE": tender.organizer.get("email", ""), "VALUE_TYPE": "WORK"}],
+        "COMMENTS": (
+            f"Тип: {tender.type}\n"
+            f"Номер уведомления: {tender.notification_number}\n"
+            f"Тип уведомления: {tender.notification_type}\n"
+            f"Метод выбора: {tender.selection_method}\n"
+            f"SMP: {tender.smp}\n"
+            f"Дата публикации: {tender.publication_date.isoformat() if tender.publication_date else ''}"
+        ),
+        "UF_CRM_1742603751016": tender.lots[0].title if tender.lots else tender.title,
+        "UF_CRM_1742606680844": file_id if file_id else "",
+        "UF_CRM_1742606760239": tender.etp_url or "",
+        "UF_CRM_1742609850193": tender.organizer.get("fullName", ""),
+        "UF_CRM_1742609875440": tender.external_id,
+        "UF_CRM_1742609910653": tender.notification_number or "",
+        "UF_CRM_1742609934994": tender.lots[0].title if tender.lots else tender.title,
+        "UF_CRM_1742609963686": tender.selection_method or "Тендер",
+        "UF_CRM_1742609998740": tender.notification_type or "",
+        "UF_CRM_1742610026724": str(tender.initial_price),
+        "UF_CRM_1742610077432": tender.etp_url or "",
+        "UF_CRM_1742610126567": tender.kontur_link or "",
+        "UF_CRM_1742610167102": tender.application_deadline.isoformat() if tender.application_deadline else "",
+        "UF_CRM_1742610221983": tender.last_modified.isoformat() if tender.last_modified else "",
+        "UF_CRM_1742610256352": tender.lots[0].delivery_place if tender.lots else "",
+        "UF_CRM_1742610279807": tender.organizer.get("inn", ""),
+        "UF_CRM_1742610403956": file_id if file_id else "",
+        "UF_CRM_1742610442197": tender.docs[0].url if tender.docs else "",
+        "UF_CRM_1742610493435": tender.organizer.get("phone", ""),
+        "UF_CRM_1742610518824": (
+            f"{tender.lots[0].title if tender.lots else tender.title}, "
+            f"сумма: {tender.initial_price} {tender.currency}, "
+            f"доставка: {tender.lots[0].delivery_place if tender.lots else ''}, "
+            f"срок: {tender.lots[0].delivery_term if tender.lots else ''}, "
+            f"оплата: {tender.lots[0].payment_term if tender.lots else ''}"
+        ),
+        "UF_CRM_1742608808760": tender.lots[0].payment_term if tender.lots else "",
+        "UF_CRM_1742608851091": tender.lots[0].delivery_term if tender.lots else ""
     }
-    async with session.post(
-        f"{settings.BITRIX_WEBHOOK_URL}/crm.userfield.update", json=payload
-    ) as resp:
-        if resp.status == 200:
-            logger.info(f"Updated user field {field_id} with values {enum_values}")
-        else:
-            logger.error(f"Failed to update user field {field_id}: {resp.status}, {await resp.text()}")
 
 async def export_to_bitrix(tender: Tender, db: AsyncSession) -> bool:
 
     headers = {"Content-Type": "application/json"}
-    async with aiohttp.ClientSession() as session:
-        await update_user_field(session, "UF_CRM_1742608808760", ["Оплата после поставки"])
-        await update_user_field(session, "UF_CRM_1742608851091", ["30 дней"])
-
-        file_id = None
-        if tender.docs and tender.docs[0].url:
-            file_id = await upload_file_to_bitrix(session, tender.docs[0].url, tender.external_id)
-
-        payload = {
-            "fields": {
-                "TITLE": f"{tender.lots[0].title if tender.lots else tender.title} (ID: {tender.external_id})",
-                "ASSIGNED_BY_ID": 9,
-                "SOURCE_ID": "BIDZAAR",
-                "SOURCE_DESCRIPTION": tender.etp_url or "",
-                "OPPORTUNascopy link | edit linkOPPORTUNITY": str(tender.initial_price),
-                "CURRENCY_ID": tender.currency,
-                "COMPANY_TITLE": tender.organizer.get("shortName", ""),
-                "PHONE": [{"VALUE": tender.organizer.get("phone", ""), "VALUE_TYPE": "WORK"}],
-                "EMAIL": [{"VALUE": tender.organizer.get("email", ""), "VALUE_TYPE": "WORK"}],
-                "COMMENTS": (
-                    f"Тип: {tender.type}\n"
-                    f"Номер уведомления: {tender.notification_number}\n"
-                    f"Тип уведомления: {tender.notification_type}\n"
-                    f"Метод выбора: {tender.selection_method}\n"
-                    f"SMP: {tender.smp}\n"
-                    f"Дата публикации: {tender.publication_date.isoformat() if tender.publication_date else ''}"
-                ),
-                "UF_CRM_1742603751016": tender.lots[0].title if tender.lots else tender.title,
-                "UF_CRM_1742606680844": file_id if file_id else "",
-                "UF_CRM_1742606760239": tender.etp_url or "",
-                "UF_CRM_1742609850193": tender.organizer.get("fullName", ""),
-                "UF_CRM_1742609875440": tender.external_id,
-                "UF_CRM_1742609910653": tender.notification_number or "",
-                "UF_CRM_1742609934994": tender.lots[0].title if tender.lots else tender.title,
-                "UF_CRM_1742609963686": tender.selection_method or "Тендер",
-                "UF_CRM_1742609998740": tender.notification_type or "",
-                "UF_CRM_1742610026724": str(tender.initial_price),
-                "UF_CRM_1742610077432": tender.etp_url or "",
-                "UF_CRM_1742610126567": tender.kontur_link or "",
-                "UF_CRM_1742610167102": tender.application_deadline.isoformat() if tender.application_deadline else "",
-                "UF_CRM_1742610221983": tender.last_modified.isoformat() if tender.last_modified else "",
-                "UF_CRM_1742610256352": tender.lots[0].delivery_place if tender.lots else "",
-                "UF_CRM_1742610279807": tender.organizer.get("inn", ""),
-                "UF_CRM_1742610403956": file_id if file_id else "",
-                "UF_CRM_1742610442197": tender.docs[0].url if tender.docs else "",
-                "UF_CRM_1742610493435": tender.organizer.get("phone", ""),
-                "UF_CRM_1742610518824": (
-                    f"{tender.lots[0].title if tender.lots else tender.title}, "
-                    f"сумма: {tender.initial_price} {tender.currency}, "
-                    f"доставка: {tender.lots[0].delivery_place if tender.lots else ''}, "
-                    f"срок: {tender.lots[0].delivery_term if tender.lots else ''}, "
-                    f"оплата: {tender.lots[0].payment_term if tender.lots else ''}"
-                ),
-                "UF_CRM_1742608808760": tender.lots[0].payment_term if tender.lots else "",
-                "UF_CRM_1742608851091": tender.lots[0].delivery_term if tender.lots else ""
-            }
-        }
-
-        async with session.post(f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.add.json", json=payload, headers=headers) as resp:
-            if resp.status == 200:
-                bitrix_id = (await resp.json()).get("result")
-                logger.info(f"Tender {tender.external_id} exported to Bitrix with ID {bitrix_id}")
-                return bool(bitrix_id)
+    session = get_http_session("bitrix")
+    await user_field_cache.ensure(session, USER_FIELD_VALUES)
+
+    file_id = None
+    if tender.docs and tender.docs[0].url:
+        file_id = await upload_file_to_bitrix(session, tender.docs[0].url, tender.external_id, tender.docs[0].file_name)
+
+    payload = {"fields": lead_fields(tender, file_id)}
+
+    async with session.post(f"{settings.BITRIX_WEBHOOK_URL}/crm.lead.add.json", json=payload, headers=headers) as resp:
+        if resp.status == 200:
+            bitrix_id = (await resp.json()).get("result")
+            logger.info(f"Tender {tender.external_id} exported to Bitrix with ID {bitrix_id}")
+            return bool(bitrix_id)
+        else:
+            logger.error(f"Failed to export tender {tender.external_id} to Bitrix: {resp.status}")
+            await send_telegram_alert(tender, f"Ошибка экспорта в Bitrix для заявки {tender.external_id}: {resp.status}")
+            return False
+
+def http_build_query(params: dict) -> str:
+    """Строка запроса как у PHP http_build_query: fields[PHONE][0][VALUE]=...; None пропускается.
+
+    Так Bitrix разбирает параметры команд внутри batch.
+    """
+    pairs = []
+
+    def walk(value, key: str) -> None:
+        if isinstance(value, dict):
+            for name, item in value.items():
+                walk(item, f"{key}[{name}]" if key else str(name))
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                walk(item, f"{key}[{index}]")
+        elif isinstance(value, bool):
+            pairs.append((key, "1" if value else "0"))
+        elif value is not None:
+            pairs.append((key, str(value)))
+
+    walk(params, "")
+    return urlencode(pairs)
+
+async def call_batch(session: aiohttp.ClientSession, commands: dict[str, str]) -> tuple[dict, dict]:
+    """Выполняет команды {ключ: "метод?параметры"} через batch, по BATCH_MAX_COMMANDS за вызов.
+
+    Возвращает (результаты, ошибки) по ключам команд. Команды вызова, который
+    не дошёл до Bitrix (сеть, лимит запросов), нет ни в одном из словарей.
+    """
+    results, errors = {}, {}
+    keys = list(commands)
+    for start in range(0, len(keys), BATCH_MAX_COMMANDS):
+        chunk = {key: commands[key] for key in keys[start:start + BATCH_MAX_COMMANDS]}
+        try:
+            async with session.post(f"{settings.BITRIX_WEBHOOK_URL}/batch", json={"halt": 0, "cmd": chunk}) as resp:
+                if resp.status != 200:
+                    logger.error(f"Bitrix batch of {len(chunk)} commands failed: {resp.status}, {await resp.text()}")
+                    continue
+                data = (await resp.json()).get("result") or {}
+        except Exception as e:
+            logger.error(f"Bitrix batch of {len(chunk)} commands failed: {str(e)}")
+            continue
+        # Пустые словари PHP отдаёт как []
+        chunk_results = data.get("result") or {}
+        chunk_errors = data.get("result_error") or {}
+        for key in chunk:
+            if chunk_errors.get(key):
+                errors[key] = chunk_errors[key]
+            elif key in chunk_results:
+                results[key] = chunk_results[key]
             else:
-                logger.error(f"Failed to export tender {tender.external_id} to Bitrix: {resp.status}")
-                await send_telegram_alert(tender, f"Ошибка экспорта в Bitrix для заявки {tender.external_id}: {resp.status}")
-                return False
\ No newline at end of file
+                errors[key] = "No result"
+    return results, errors
+
+async def export_batch_to_bitrix(tenders: list[Tender]) -> dict[str, bool | None]:
+    """Экспортирует тендеры одним или несколькими вызовами batch.
+
+    Недостающие значения пользовательских полей добавляются один раз на пакет,
+    crm.lead.add идут командами batch, документы загружаются отдельно через
+    disk.file.upload. Возвращает по
+    external_id: True — лид создан, False — Bitrix вернул ошибку, None — до
+    Bitrix не дошли, тендер можно отправить ещё раз.
+    """
+    session = get_http_session("bitrix")
+    slots = asyncio.Semaphore(settings.BITRIX_UPLOAD_CONCURRENCY)
+
+    async def upload(tender: Tender) -> str | None:
+        if not tender.docs or not tender.docs[0].url:
+            return None
+        async with slots:
+            try:
+                return await upload_file_to_bitrix(session, tender.docs[0].url, tender.external_id,
+                                                   tender.docs[0].file_name)
+            except Exception as e:
+                logger.error(f"Failed to upload document of tender {tender.external_id} to Bitrix: {str(e)}")
+                return None
+
+    await user_field_cache.ensure(session, USER_FIELD_VALUES)
+    file_ids = await asyncio.gather(*(upload(tender) for tender in tenders))
+
+    commands = {
+        f"lead_{index}": "crm.lead.add?" + http_build_query({"fields": lead_fields(tender, file_id)})
+        for index, (tender, file_id) in enumerate(zip(tenders, file_ids))
+    }
+    results, errors = await call_batch(session, commands)
+
+    outcome = {}
+    for index, tender in enumerate(tenders):
+        key = f"lead_{index}"
+        if key in results:
+            outcome[tender.external_id] = bool(results[key])
+            logger.info(f"Tender {tender.external_id} exported to Bitrix with ID {results[key]}")
+        elif key in errors:
+            outcome[tender.external_id] = False
+            logger.error(f"Failed to export tender {tender.external_id} to Bitrix: {errors[key]}")
+        else:
+            outcome[tender.external_id] = None
+    return outcome
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from webdriver_manager.chrome import ChromeDriverManager
+from app.core.logging_config import logger
+from app.core.config import settings
+
+# Папка для хранения драйвера
+DRIVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "drivers")
+os.makedirs(DRIVER_DIR, exist_ok=True)
+
+
+def get_local_driver_path() -> str:
+
+    driver_path = os.path.join(DRIVER_DIR, "chromedriver" + (".exe" if os.name == "nt" else ""))
+
+    if not os.path.exists(driver_path):
+        logger.info("ChromeDriver not found locally, downloading to drivers folder...")
+        # Скачиваем драйвер один раз и сохраняем в DRIVER_DIR
+        driver_path = ChromeDriverManager(path=DRIVER_DIR).install()
+        logger.info(f"ChromeDriver downloaded to: {driver_path}")
+    else:
+        logger.debug(f"Using existing ChromeDriver at: {driver_path}")
+
+    return driver_path
+
+
+class BrowserPoolBusy(Exception):
+    """Очередь ожидания браузера переполнена; задачу стоит повторить позже."""
+
+
+class PooledBrowser:
+    def __init__(self, driver: webdriver.Chrome, profile_dir: str, number: int):
+        self.driver = driver
+        self.profile_dir = profile_dir
+        self.number = number
+        self.uses = 0
+
+
+class BrowserPool:
+    """Пул headless Chrome фиксированного размера.
+
+    Браузеры создаются по требованию и переиспользуются между тендерами; каждый
+    тендер получает очищенный контекст. Браузер пересоздаётся после max_uses
+    тендеров или после падения WebDriver. Все вызовы Selenium идут через
+    собственный пул потоков размера пула, а не через executor по умолчанию.
+    """
+
+    def __init__(self, size: int, max_uses: int, max_waiting: int):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_waiting = max_waiting
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="chrome")
+        self._slots: asyncio.Queue | None = None
+        self._waiting = 0
+        self._created = 0
+        self._driver_path: str | None = None
+
+    def _queue(self) -> asyncio.Queue:
+        if self._slots is None:
+            # None в очереди — свободное место, на котором ещё нет запущенного браузера
+            self._slots = asyncio.Queue()
+            for _ in range(self.size):
+                self._slots.put_nowait(None)
+        return self._slots
+
+    async def run(self, fn, *args):
+        """Выполняет блокирующий вызов Selenium в потоках пула."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _launch(self) -> PooledBrowser:
+        if self._driver_path is None:
+            self._driver_path = get_local_driver_path()
+        profile_dir = tempfile.mkdtemp(prefix="chrome-profile-")
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--incognito")
+        options.add_argument(f"--user-data-dir={profile_dir}")
+        options.add_experimental_option("prefs", {
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+            # Разрешаем несколько загрузок со страницы без запроса
+            "profile.default_content_setting_values.automatic_downloads": 1,
+            "safebrowsing.enabled": True
+        })
+        try:
+            driver = webdriver.Chrome(service=Service(executable_path=self._driver_path), options=options)
+        except Exception:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            raise
+        self._created += 1
+        logger.info(f"Browser #{self._created} started")
+        return PooledBrowser(driver, profile_dir, self._created)
+
+    @staticmethod
+    def _quit(browser: PooledBrowser) -> None:
+        try:
+            browser.driver.quit()
+        except Exception as e:
+            logger.warning(f"Browser #{browser.number} did not quit cleanly: {str(e)}")
+        shutil.rmtree(browser.profile_dir, ignore_errors=True)
+        logger.info(f"Browser #{browser.number} stopped after {browser.uses} uses")
+
+    @staticmethod
+    def _reset(browser: PooledBrowser, download_dir: str) -> None:
+        """Очищает состояние предыдущего тендера и направляет загрузки в download_dir."""
+        driver = browser.driver
+        driver.get("about:blank")
+        driver.delete_all_cookies()
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": "*", "storageTypes": "all"})
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+
+    async def _acquire(self) -> PooledBrowser:
+        if self._waiting >= self.max_waiting:
+            raise BrowserPoolBusy(f"{self._waiting} scrapes already waiting for a browser")
+        self._waiting += 1
+        try:
+            browser = await self._queue().get()
+        finally:
+            self._waiting -= 1
+        if browser is not None:
+            return browser
+        try:
+            return await self.run(self._launch)
+        except BaseException:
+            self._queue().put_nowait(None)
+            raise
+
+    async def _release(self, browser: PooledBrowser, healthy: bool) -> None:
+        browser.uses += 1
+        if healthy and browser.uses < self.max_uses:
+            self._queue().put_nowait(browser)
+            return
+        try:
+            await self.run(self._quit, browser)
+        finally:
+            self._queue().put_nowait(None)
+
+    @asynccontextmanager
+    async def browser(self, download_dir: str):
+        """Выдаёт WebDriver с чистым контекстом на время обработки одного тендера."""
+        browser = await self._acquire()
+        healthy = True
+        try:
+            await self.run(self._reset, browser, download_dir)
+            yield browser.driver
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            healthy = False
+            raise
+        finally:
+            await self._release(browser, healthy)
+
+    async def close(self) -> None:
+        if self._slots is not None:
+            while not self._slots.empty():
+                browser = self._slots.get_nowait()
+                if browser is not None:
+                    await self.run(self._quit, browser)
+            self._slots = None
+        self._executor.shutdown(wait=False)
+
+
+browser_pool = BrowserPool(settings.BROWSER_POOL_SIZE, settings.BROWSER_MAX_USES, settings.BROWSER_MAX_WAITING)
@@ -0,0 +1,104 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+from app.core.logging_config import logger
+
+# Временные файлы, которые Chrome переименовывает по завершении загрузки
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Интервал опроса каталога, если inotify недоступен (не Linux)
+POLL_INTERVAL = 0.2
+
+
+def _load_libc():
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+class DownloadWatcher:
+    """Ждёт завершения загрузок браузера в отдельном каталоге.
+
+    На Linux каталог отслеживается через inotify: каталог пересматривается только
+    при появлении или переименовании файла. В остальных случаях каталог
+    опрашивается с интервалом POLL_INTERVAL. Наблюдатель нужно открыть до
+    начала загрузок, чтобы не пропустить события.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._fd: int | None = None
+        self._changed = asyncio.Event()
+
+    async def __aenter__(self) -> "DownloadWatcher":
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(
+                    fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) >= 0:
+                self._fd = fd
+                asyncio.get_running_loop().add_reader(fd, self._on_events)
+            else:
+                if fd >= 0:
+                    os.close(fd)
+                logger.warning(f"inotify unavailable for {self.directory}, falling back to polling")
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def _on_events(self) -> None:
+        try:
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        self._changed.set()
+
+    def _scan(self) -> tuple[list[str], int]:
+        finished, pending = [], 0
+        for name in os.listdir(self.directory):
+            if name.endswith(PARTIAL_SUFFIXES):
+                pending += 1
+            elif os.path.isfile(os.path.join(self.directory, name)):
+                finished.append(name)
+        return sorted(finished), pending
+
+    async def wait(self, expected: int, timeout: float) -> list[str]:
+        """Возвращает имена завершённых файлов, когда их не меньше expected и нет
+        незавершённых загрузок, либо то, что успело скачаться за timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            self._changed.clear()
+            finished, pending = self._scan()
+            if len(finished) >= expected and not pending:
+                return finished
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning(f"Downloads in {self.directory} timed out: "
+                               f"{len(finished)}/{expected} finished, {pending} in progress")
+                return finished
+            wait_for = remaining if self._fd is not None else min(remaining, POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait_for)
+            except asyncio.TimeoutError:
+                pass
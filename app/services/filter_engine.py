@@ -0,0 +1,498 @@
+import json
+import operator
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.filters import get_active_filters, get_active_filters_version
+from app.models.filters import Filter
+from app.models.tenders import Tender
+from app.services.formula_engine import CompiledFormula, FormulaError, compile_formula
+from app.core.config import settings
+from app.core.logging_config import logger
+
+Predicate = Callable[[dict], bool]
+
+COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+# Поля тендера, доступные в условиях фильтров
+FILTER_FIELDS = (
+    "external_id",
+    "title",
+    "notification_number",
+    "notification_type",
+    "organizer",
+    "initial_price",
+    "currency",
+    "application_deadline",
+    "etp_code",
+    "etp_name",
+    "etp_url",
+    "kontur_link",
+    "publication_date",
+    "last_modified",
+    "selection_method",
+    "smp",
+    "state",
+)
+
+
+# Вычисляемые поля: есть в словаре тендера, но не в колонках tenders
+DERIVED_FIELDS = ("lots_count",)
+CONTEXT_FIELDS = FILTER_FIELDS + DERIVED_FIELDS
+
+
+class TenderContext(dict):
+    """Словарь тендера для фильтров; formula_values — значения формул, уже посчитанные для него."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.formula_values: dict[str, Any] = {}
+
+
+def tender_to_filter_dict(tender: Tender) -> TenderContext:
+    data = TenderContext((field, getattr(tender, field)) for field in FILTER_FIELDS)
+    # Лоты считаем, только если они уже загружены: ленивая загрузка в async-сессии недоступна
+    data["lots_count"] = len(tender.lots) if "lots" not in inspect(tender).unloaded else None
+    return data
+
+
+def get_nested_value(data: dict, field: str) -> Any:
+
+    keys = field.split(".")
+    value = data
+    for key in keys:
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        else:
+            return None
+    return value
+
+
+def evaluate_condition(condition: dict, tender_data: dict) -> bool:
+    # Рекурсивно оценивает условие с учётом AND, OR и операторов
+    if "AND" in condition:
+        return all(evaluate_condition(sub_cond, tender_data) for sub_cond in condition["AND"])
+    if "OR" in condition:
+        return any(evaluate_condition(sub_cond, tender_data) for sub_cond in condition["OR"])
+
+    # Простое условие
+    field = condition.get("field")
+    op = condition.get("op")
+    value = condition.get("value")
+
+    if not all([field, op, value is not None]):
+        logger.debug(f"Invalid condition format: {condition}")
+        return False
+
+    tender_value = get_nested_value(tender_data, field)
+    if tender_value is None:
+        logger.debug(f"Field {field} not found in tender data")
+        return False
+
+    try:
+        # Обработка операторов
+        if op == "=":
+            return tender_value == value
+        elif op == "!=":
+            return tender_value != value
+        elif op == ">":
+            return tender_value > value
+        elif op == "<":
+            return tender_value < value
+        elif op == ">=":
+            return tender_value >= value
+        elif op == "<=":
+            return tender_value <= value
+        elif op == "contains":
+            if isinstance(tender_value, str) and isinstance(value, str):
+                return value.lower() in tender_value.lower()
+            return False
+        else:
+            logger.debug(f"Unknown operator {op} in condition")
+            return False
+    except TypeError as e:
+        logger.debug(f"Type error in condition {condition}: {str(e)}")
+        return False
+
+
+def _field_getter(field: str) -> Callable[[dict], Any]:
+    keys = tuple(field.split("."))
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda data: data.get(key) if isinstance(data, dict) else None
+
+    def get(data: dict) -> Any:
+        value = data
+        for key in keys:
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                return None
+        return value
+    return get
+
+
+def _value_test(op: Any, value: Any) -> Callable[[Any], bool] | None:
+    """Проверка значения поля для листа условия; None — лист всегда ложен."""
+    if op == "contains":
+        if not isinstance(value, str):
+            return None
+        needle = value.lower()
+        return lambda tender_value: isinstance(tender_value, str) and needle in tender_value.lower()
+
+    compare = COMPARISONS.get(op) if isinstance(op, str) else None
+    if compare is None:
+        return None
+
+    def test(tender_value: Any) -> bool:
+        if tender_value is None:
+            return False
+        try:
+            return bool(compare(tender_value, value))
+        except TypeError:
+            return False
+    return test
+
+
+def _leaf_key(field: str, op: str, value: Any) -> tuple | None:
+    key = (field, op, type(value), value)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class _ScalarBackend:
+    """Условие как предикат над словарём одного тендера."""
+
+    @staticmethod
+    def const(result: bool) -> Predicate:
+        return lambda data: result
+
+    @staticmethod
+    def interpreted(condition: Any) -> Predicate:
+        # Для нестандартной формы условия сохраняем поведение evaluate_condition как есть
+        return lambda data: evaluate_condition(condition, data)
+
+    @staticmethod
+    def leaf(field: str, op: str, value: Any, test: Callable[[Any], bool], key: tuple | None) -> Predicate:
+        get = _field_getter(field)
+        return lambda data: test(get(data))
+
+    @staticmethod
+    def all(compiled: tuple) -> Predicate:
+        return lambda data: all(predicate(data) for predicate in compiled)
+
+    @staticmethod
+    def any(compiled: tuple) -> Predicate:
+        return lambda data: any(predicate(data) for predicate in compiled)
+
+
+class TenderBatch:
+    """Пакет тендеров в колоночном виде для пакетной оценки фильтров.
+
+    Колонка поля строится один раз на пакет и кодируется словарём: каждое
+    различное значение проверяется листом условия один раз. Результат листа —
+    битовая маска (int, бит i — тендер i), AND/OR — побитовые операции.
+    """
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.size = len(rows)
+        self.all = (1 << self.size) - 1
+        # поле -> (различные значения, код значения для каждой строки)
+        self._columns: dict[str, tuple[list, list[int]]] = {}
+        self._leaf_masks: dict[tuple, int] = {}
+        # источник формулы -> значения по строкам; (формула, цель) -> маска
+        self._formula_values: dict[str, list] = {}
+        self._formula_masks: dict[tuple[str, str | None], int] = {}
+
+    def column(self, field: str) -> tuple[list, list[int]]:
+        if field not in self._columns:
+            get = _field_getter(field)
+            values, codes, index = [], [], {}
+            for row in self.rows:
+                value = get(row)
+                try:
+                    key = (type(value), value)
+                    code = index.get(key)
+                    if code is None:
+                        code = index[key] = len(values)
+                        values.append(value)
+                except TypeError:
+                    code = len(values)
+                    values.append(value)
+                codes.append(code)
+            self._columns[field] = (values, codes)
+        return self._columns[field]
+
+    def mask_from_flags(self, flags: list[str]) -> int:
+        """Маска из флагов "0"/"1" в порядке строк."""
+        return int("".join(reversed(flags)), 2) if flags else 0
+
+    def leaf_mask(self, field: str, test: Callable[[Any], bool], key: tuple | None) -> int:
+        if key is not None and key in self._leaf_masks:
+            return self._leaf_masks[key]
+        values, codes = self.column(field)
+        table = ["1" if test(value) else "0" for value in values]
+        mask = self.mask_from_flags([table[code] for code in codes])
+        if key is not None:
+            self._leaf_masks[key] = mask
+        return mask
+
+    def predicate_mask(self, predicate: Predicate) -> int:
+        return self.mask_from_flags(["1" if predicate(row) else "0" for row in self.rows])
+
+    def formula_values(self, formula: CompiledFormula) -> list[Any]:
+        """Значения формулы по строкам; одна формула в нескольких фильтрах считается один раз."""
+        if formula.source not in self._formula_values:
+            self._formula_values[formula.source] = formula.evaluate_batch(self.rows)
+        return self._formula_values[formula.source]
+
+    def formula_mask(self, formula: CompiledFormula, target: CompiledFormula | None) -> int:
+        key = (formula.source, target.source if target else None)
+        if key not in self._formula_masks:
+            values = self.formula_values(formula)
+            self._formula_masks[key] = self.mask_from_flags(
+                ["1" if formula_target_passes(target, row, value) else "0" for row, value in zip(self.rows, values)])
+        return self._formula_masks[key]
+
+    def unpack(self, mask: int) -> list[bool]:
+        bits = bin(mask)[2:].zfill(self.size)[::-1] if self.size else ""
+        return [bit == "1" for bit in bits]
+
+
+BatchPredicate = Callable[[TenderBatch], int]
+
+
+class _BatchBackend:
+    """Условие как функция пакета тендеров, возвращающая маску прошедших."""
+
+    @staticmethod
+    def const(result: bool) -> BatchPredicate:
+        return lambda batch: batch.all if result else 0
+
+    @staticmethod
+    def interpreted(condition: Any) -> BatchPredicate:
+        predicate = _ScalarBackend.interpreted(condition)
+        return lambda batch: batch.predicate_mask(predicate)
+
+    @staticmethod
+    def leaf(field: str, op: str, value: Any, test: Callable[[Any], bool], key: tuple | None) -> BatchPredicate:
+        return lambda batch: batch.leaf_mask(field, test, key)
+
+    @staticmethod
+    def all(compiled: tuple) -> BatchPredicate:
+        def conjunction(batch: TenderBatch) -> int:
+            mask = batch.all
+            for predicate in compiled:
+                mask &= predicate(batch)
+                if not mask:
+                    break
+            return mask
+        return conjunction
+
+    @staticmethod
+    def any(compiled: tuple) -> BatchPredicate:
+        def disjunction(batch: TenderBatch) -> int:
+            mask = 0
+            for predicate in compiled:
+                mask |= predicate(batch)
+                if mask == batch.all:
+                    break
+            return mask
+        return disjunction
+
+
+def walk_condition(condition: Any, backend):
+    """Обходит дерево условия так же, как evaluate_condition, и собирает результат через backend.
+
+    backend задаёт const(bool), interpreted(condition) для нестандартной формы,
+    leaf(field, op, value, test, key) и all/any над скомпилированными детьми.
+    """
+    if not isinstance(condition, dict):
+        return backend.interpreted(condition)
+    for group in ("AND", "OR"):
+        if group in condition:
+            subs = condition[group]
+            if not isinstance(subs, list) or not all(isinstance(sub, dict) for sub in subs):
+                return backend.interpreted(condition)
+            compiled = tuple(walk_condition(sub, backend) for sub in subs)
+            if len(compiled) == 1:
+                return compiled[0]
+            return backend.all(compiled) if group == "AND" else backend.any(compiled)
+
+    field = condition.get("field")
+    op = condition.get("op")
+    value = condition.get("value")
+    if not all([field, op, value is not None]):
+        return backend.const(False)
+    if not isinstance(field, str):
+        return backend.interpreted(condition)
+    test = _value_test(op, value)
+    if test is None:
+        return backend.const(False)
+    return backend.leaf(field, op, value, test, _leaf_key(field, op, value))
+
+
+def compile_condition(condition: Any) -> Predicate:
+    """Компилирует дерево условия в замыкание с той же семантикой, что у evaluate_condition.
+
+    Разбор операторов и путей полей выполняется один раз; при вызове остаются
+    только чтение полей и сравнения.
+    """
+    return walk_condition(condition, _ScalarBackend)
+
+
+def compile_batch_condition(condition: Any) -> BatchPredicate:
+    """То же условие для TenderBatch: возвращает маску тендеров, прошедших условие."""
+    return walk_condition(condition, _BatchBackend)
+
+
+class _TargetScope:
+    """Поля тендера и value — значение формулы — для formula_target."""
+    __slots__ = ("data", "value")
+
+    def __init__(self, data: dict, value: Any):
+        self.data = data
+        self.value = value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.value if name == "value" else self.data.get(name, default)
+
+
+def formula_target_passes(target: CompiledFormula | None, data: dict, value: Any) -> bool:
+    """Без formula_target достаточно истинного значения формулы; None (ошибка) не проходит никогда."""
+    if value is None:
+        return False
+    if target is None:
+        return bool(value)
+    return bool(target.evaluate(_TargetScope(data, value)))
+
+
+def compile_formulas(formula: str | None, formula_target: str | None) -> tuple[CompiledFormula | None,
+                                                                              CompiledFormula | None]:
+    """Компилирует formula и formula_target фильтра; FormulaError, если одна из них некорректна."""
+    if not formula:
+        return None, None
+    compiled = compile_formula(formula, CONTEXT_FIELDS)
+    target = compile_formula(formula_target, CONTEXT_FIELDS + ("value",)) if formula_target else None
+    return compiled, target
+
+
+def _with_formula(predicate: Predicate, batch_predicate: BatchPredicate, formula: CompiledFormula,
+                  target: CompiledFormula | None) -> tuple[Predicate, BatchPredicate]:
+    # Формула считается только для тендеров, прошедших условие
+    def matches(data: dict) -> bool:
+        return predicate(data) and formula_target_passes(target, data, formula.evaluate(data))
+
+    def batch_matches(batch: TenderBatch) -> int:
+        mask = batch_predicate(batch)
+        return mask & batch.formula_mask(formula, target) if mask else 0
+    return matches, batch_matches
+
+
+@dataclass(frozen=True)
+class CompiledFilter:
+    id: int
+    updated_at: datetime | None
+    priority: int
+    parent_id: int | None
+    success_action: int | None
+    condition: dict | None
+    formula: CompiledFormula | None
+    predicate: Predicate
+    batch_predicate: BatchPredicate
+
+    def matches(self, tender_data: dict) -> bool:
+        return self.predicate(tender_data)
+
+
+def compile_filter(filter_obj: Filter) -> CompiledFilter:
+    """Разбирает JSON условия и формулы фильтра один раз.
+
+    Условие работает как в check_filter. Если задана formula, фильтр совпадает,
+    когда выполнено условие и formula_target от значения формулы (value) истинно.
+    """
+    condition = formula = None
+    if not filter_obj.condition:
+        predicate, batch_predicate = _ScalarBackend.const(True), _BatchBackend.const(True)
+    else:
+        try:
+            condition = json.loads(filter_obj.condition)
+            predicate, batch_predicate = compile_condition(condition), compile_batch_condition(condition)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid filter condition JSON for filter {filter_obj.id}: {str(e)}")
+            predicate, batch_predicate = _ScalarBackend.const(False), _BatchBackend.const(False)
+    try:
+        formula, target = compile_formulas(filter_obj.formula, filter_obj.formula_target)
+        if formula is not None:
+            predicate, batch_predicate = _with_formula(predicate, batch_predicate, formula, target)
+    except FormulaError as e:
+        logger.error(f"Invalid formula for filter {filter_obj.id}: {str(e)}")
+        predicate, batch_predicate = _ScalarBackend.const(False), _BatchBackend.const(False)
+    return CompiledFilter(id=filter_obj.id, updated_at=filter_obj.updated_at, priority=filter_obj.priority,
+                          parent_id=filter_obj.parent_id, success_action=filter_obj.success_action,
+                          condition=condition, formula=formula, predicate=predicate,
+                          batch_predicate=batch_predicate)
+
+
+class FilterCache:
+    """Скомпилированные активные фильтры по типу тендера.
+
+    Скомпилированные условия хранятся по ключу (id, updated_at), поэтому
+    изменённый фильтр компилируется заново, а остальные переиспользуются. Список
+    для типа считается свежим FILTER_CACHE_TTL секунд; после этого одним
+    запросом count/max(updated_at) проверяется, не поменялись ли фильтры в
+    другом процессе. Эндпоинты фильтров сбрасывают кэш сразу через invalidate().
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._compiled: dict[tuple[int, datetime | None], CompiledFilter] = {}
+        # тип -> (версия набора, время проверки, фильтры в порядке priority)
+        self._by_type: dict[str, tuple[tuple, float, list[CompiledFilter]]] = {}
+
+    def invalidate(self) -> None:
+        self._by_type.clear()
+
+    async def get(self, db: AsyncSession, filter_type: str) -> list[CompiledFilter]:
+        cached = self._by_type.get(filter_type)
+        now = time.monotonic()
+        if cached and now - cached[1] < self.ttl:
+            return cached[2]
+
+        version = await get_active_filters_version(db, filter_type)
+        if cached and cached[0] == version:
+            self._by_type[filter_type] = (version, now, cached[2])
+            return cached[2]
+
+        filters = []
+        for filter_obj in await get_active_filters(db, filter_type=filter_type):
+            key = (filter_obj.id, filter_obj.updated_at)
+            if key not in self._compiled:
+                self._compiled[key] = compile_filter(filter_obj)
+            filters.append(self._compiled[key])
+        live = {(f.id, f.updated_at) for f in filters}
+        for by_type in self._by_type.values():
+            live.update((f.id, f.updated_at) for f in by_type[2])
+        for key in self._compiled.keys() - live:
+            del self._compiled[key]
+        self._by_type[filter_type] = (version, now, filters)
+        logger.info(f"Compiled {len(filters)} active filters of type {filter_type}")
+        return filters
+
+
+filter_cache = FilterCache(settings.FILTER_CACHE_TTL)
@@ -1,124 +1,210 @@
-from app.crud.filters import get_active_filters
 from app.models.filters import Filter
+import hashlib
 import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
 from app.models.tenders import Tender
 from app.core.logging_config import logger
-from app.schemas.filters import FilterCreate
-from typing import Any
+from app.schemas.filters import FilterCreate, FilterPreviewResponse
+from app.services.filter_engine import filter_cache, tender_to_filter_dict, CompiledFilter, TenderBatch, \
+    compile_filter, compile_formulas, FILTER_FIELDS
+from app.services.filter_sql import filter_to_sql, FILTER_COLUMNS
+from app.services.filter_tree import get_filter_tree, filter_stats
+from app.core.config import settings
 
 
 async def apply_filters(tender_data: Tender, tender_id: str, db: AsyncSession) -> bool:
-    active_filters = await get_active_filters(db, filter_type=tender_data.type)
-    logger.info(f"Found {len(active_filters)} active filters for tender {tender_id}")
-    if not active_filters:
+    # Дерево скомпилированных фильтров закэшировано; БД опрашивается не чаще FILTER_CACHE_TTL
+    tree = await get_filter_tree(db, tender_data.type)
+    logger.info(f"Found {tree.size} active filters for tender {tender_id}")
+    if not tree.size:
         logger.info(f"No active filters found for tender {tender_id}, passing to next stage")
         return True
 
-    tender_dict = {
-        "external_id": tender_data.external_id,
-        "title": tender_data.title,
-        "notification_number": tender_data.notification_number,
-        "notification_type": tender_data.notification_type,
-        "organizer": tender_data.organizer,
-        "initial_price": tender_data.initial_price,
-        "currency": tender_data.currency,
-        "application_deadline": tender_data.application_deadline,
-        "etp_code": tender_data.etp_code,
-        "etp_name": tender_data.etp_name,
-        "etp_url": tender_data.etp_url,
-        "kontur_link": tender_data.kontur_link,
-        "publication_date": tender_data.publication_date,
-        "last_modified": tender_data.last_modified,
-        "selection_method": tender_data.selection_method,
-        "smp": tender_data.smp,
-        "state": tender_data.state,
-    }
+    if "lots" in inspect(tender_data).unloaded:
+        # db.refresh после смены состояния сбрасывает связи, а lots_count нужны лоты
+        await db.refresh(tender_data, ["lots"])
 
     logger.info(f"Applying filters to tender {tender_id}")
-    for filter_obj in active_filters:
-        logger.debug(f"Checking filter {filter_obj.id}: condition={filter_obj.condition}")
-        if check_filter(filter_obj, tender_dict):
-            logger.info(f"Tender {tender_id} passed filter {filter_obj.id}")
-            return True
-        else:
-            logger.info(f"Tender {tender_id} failed filter {filter_obj.id}")
-    logger.info(f"Tender {tender_id} did not pass any filters")
-    return False
-
-
-def get_nested_value(data: dict, field: str) -> Any:
-
-    keys = field.split(".")
-    value = data
-    for key in keys:
-        if isinstance(value, dict) and key in value:
-            value = value[key]
+    # Один словарь на прогон: формулы, общие для нескольких фильтров, считаются один раз
+    passed = tree.evaluate(tender_to_filter_dict(tender_data))
+    await filter_stats.flush()
+    if passed:
+        logger.info(f"Tender {tender_id} passed filters")
+    else:
+        logger.info(f"Tender {tender_id} did not pass filters")
+    return passed
+
+
+def filter_matrix(filters: list[CompiledFilter], tenders: list[Tender | dict]) -> list[list[bool]]:
+    """Пакетная оценка: строка на тендер, столбец на фильтр в порядке filters.
+
+    Тендеры переводятся в колонки один раз, каждое условие считается над
+    всем пакетом битовыми масками (см. TenderBatch). Результат совпадает с
+    поштучным compiled.matches(tender_to_filter_dict(tender)).
+    """
+    batch = TenderBatch([tender if isinstance(tender, dict) else tender_to_filter_dict(tender) for tender in tenders])
+    columns = [batch.unpack(compiled.batch_predicate(batch)) for compiled in filters]
+    if not columns:
+        return [[] for _ in tenders]
+    return [list(row) for row in zip(*columns)]
+
+
+async def apply_filters_batch(tenders: list[Tender], filter_type: str, db: AsyncSession) -> list[bool]:
+    """То же решение, что apply_filters, для пакета тендеров одного типа."""
+    tree = await get_filter_tree(db, filter_type)
+    batch = TenderBatch([tender_to_filter_dict(tender) for tender in tenders])
+    passed = tree.evaluate_batch(batch)
+    logger.info(f"Batch filtering of {len(tenders)} {filter_type} tenders: {bin(passed).count('1')} passed")
+    return batch.unpack(passed)
+
+
+def evaluate_formula_batch(formula: str, tenders: list[Tender | dict]) -> list[Any]:
+    """Значение формулы для каждого тендера пакета; None там, где она не вычисляется.
+
+    Формула компилируется один раз. Для ORM-тендеров lots_count известен, только
+    если лоты загружены заранее. FormulaError, если формула некорректна.
+    """
+    compiled, _ = compile_formulas(formula, None)
+    batch = TenderBatch([tender if isinstance(tender, dict) else tender_to_filter_dict(tender) for tender in tenders])
+    return batch.formula_values(compiled)
+
+
+async def iter_filter_matches(db: AsyncSession, filter_obj: Filter, after: str | None = None,
+                              limit: int | None = None) -> AsyncIterator[Tender]:
+    """Тендеры типа фильтра, проходящие его условие, по возрастанию external_id.
+
+    Условие переводится в SQL и выбирается страницами по ключу external_id,
+    поэтому в Python попадают только подходящие строки. Если условие нельзя
+    перевести в SQL точно, страницы тендеров проверяются пакетной оценкой.
+    """
+    expression = filter_to_sql(filter_obj)
+    compiled = compile_filter(filter_obj) if expression is None else None
+    if compiled is not None:
+        logger.info(f"Filter {filter_obj.id} cannot be pushed down to SQL, evaluating pages in Python")
+
+    page_size = settings.FILTER_MATCHES_PAGE_SIZE
+    sent = 0
+    while limit is None or sent < limit:
+        query = select(Tender).where(Tender.type == filter_obj.type)
+        if expression is not None:
+            query = query.where(expression)
         else:
+            # lots_count в словаре тендера считается по загруженным лотам
+            query = query.options(selectinload(Tender.lots))
+        if after is not None:
+            query = query.where(Tender.external_id > after)
+        size = page_size if limit is None or compiled is not None else min(page_size, limit - sent)
+        result = await db.execute(query.order_by(Tender.external_id).limit(size))
+        page = result.scalars().all()
+        # Объекты страницы больше не нужны сессии; identity map не растёт
+        db.expunge_all()
+        if not page:
+            return
+        after = page[-1].external_id
+
+        matched = page
+        if compiled is not None:
+            batch = TenderBatch([tender_to_filter_dict(tender) for tender in page])
+            flags = batch.unpack(compiled.batch_predicate(batch))
+            matched = [tender for tender, passed in zip(page, flags) if passed]
+        for tender in matched:
+            if limit is not None and sent >= limit:
+                return
+            yield tender
+            sent += 1
+        if len(page) < size:
+            return
+
+
+class PreviewCache:
+    """Результаты предпросмотра по ключу (хеш условия, формулы, тип, окно) на FILTER_PREVIEW_CACHE_TTL секунд."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, FilterPreviewResponse]] = OrderedDict()
+
+    def get(self, key: tuple) -> FilterPreviewResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
             return None
-    return value
-
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
 
-def evaluate_condition(condition: dict, tender_data: dict) -> bool:
-    # Рекурсивно оценивает условие с учётом AND, OR и операторов
-    if "AND" in condition:
-        return all(evaluate_condition(sub_cond, tender_data) for sub_cond in condition["AND"])
-    if "OR" in condition:
-        return any(evaluate_condition(sub_cond, tender_data) for sub_cond in condition["OR"])
+    def put(self, key: tuple, response: FilterPreviewResponse) -> None:
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
-    # Простое условие
-    field = condition.get("field")
-    op = condition.get("op")
-    value = condition.get("value")
 
-    if not all([field, op, value is not None]):
-        logger.debug(f"Invalid condition format: {condition}")
-        return False
+preview_cache = PreviewCache(settings.FILTER_PREVIEW_CACHE_TTL, settings.FILTER_PREVIEW_CACHE_SIZE)
 
-    tender_value = get_nested_value(tender_data, field)
-    if tender_value is None:
-        logger.debug(f"Field {field} not found in tender data")
-        return False
 
+def condition_hash(condition: str | None) -> str:
+    """Хеш условия, не зависящий от пробелов и порядка ключей в JSON."""
     try:
-        # Обработка операторов
-        if op == "=":
-            return tender_value == value
-        elif op == "!=":
-            return tender_value != value
-        elif op == ">":
-            return tender_value > value
-        elif op == "<":
-            return tender_value < value
-        elif op == ">=":
-            return tender_value >= value
-        elif op == "<=":
-            return tender_value <= value
-        elif op == "contains":
-            if isinstance(tender_value, str) and isinstance(value, str):
-                return value.lower() in tender_value.lower()
-            return False
-        else:
-            logger.debug(f"Unknown operator {op} in condition")
-            return False
-    except TypeError as e:
-        logger.debug(f"Type error in condition {condition}: {str(e)}")
-        return False
+        canonical = json.dumps(json.loads(condition), sort_keys=True, ensure_ascii=False) if condition else ""
+    except json.JSONDecodeError:
+        canonical = condition
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def preview_filter(db: AsyncSession, filter_data: FilterCreate, window_days: int) -> FilterPreviewResponse:
+    """Сколько тендеров типа фильтра, созданных за window_days дней, он бы пропустил и отклонил.
+
+    Условие оценивается скомпилированным пакетным вычислителем, совпадающим с
+    evaluate_condition, над колонками тендеров, выбираемыми частями.
+    """
+    key = (condition_hash(filter_data.condition), filter_data.formula, filter_data.formula_target,
+           filter_data.type, window_days)
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached.model_copy(update={"cached": True})
+
+    compiled = compile_filter(Filter(**filter_data.dict()))
+    since = datetime.now(timezone.utc) - timedelta(days=window_days)
+    query = (
+        select(*(Tender.__table__.c[field] for field in FILTER_FIELDS),
+               FILTER_COLUMNS["lots_count"][0].label("lots_count"))
+        .where(Tender.type == filter_data.type, Tender.created_at >= since)
+        .order_by(Tender.created_at.desc())
+        .execution_options(yield_per=settings.FILTER_MATCHES_PAGE_SIZE)
+    )
+    sample_size = settings.FILTER_PREVIEW_SAMPLE_SIZE
+    total, passed = 0, 0
+    sample_passed, sample_rejected = [], []
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        batch = TenderBatch([dict(row._mapping) for row in rows])
+        flags = batch.unpack(compiled.batch_predicate(batch))
+        total += batch.size
+        passed += sum(flags)
+        for row, flag in zip(batch.rows, flags):
+            sample = sample_passed if flag else sample_rejected
+            if len(sample) < sample_size:
+                sample.append(row["external_id"])
+
+    response = FilterPreviewResponse(window_days=window_days, total=total, passed=passed, rejected=total - passed,
+                                     sample_passed=sample_passed, sample_rejected=sample_rejected)
+    preview_cache.put(key, response)
+    logger.info(f"Filter preview over {total} {filter_data.type} tenders for {window_days} days: {passed} passed")
+    return response
 
 
 def check_filter(filter_obj: Filter, tender_data: dict) -> bool:
-
-    if not filter_obj.condition:
-        logger.debug(f"Filter {filter_obj.id} has no condition, passing")
-        return True
-
-    try:
-        condition = json.loads(filter_obj.condition)
-        logger.debug(f"Filter {filter_obj.id} condition: {condition}")
-        return evaluate_condition(condition, tender_data)
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid filter condition JSON for filter {filter_obj.id}: {str(e)}")
-        return False
+    """Проверка одного тендера фильтром; для многих тендеров компилируйте фильтр один раз через filter_cache."""
+    return compile_filter(filter_obj).matches(tender_data)
 
 
 async def create_new_filter(filter_data: FilterCreate, db: AsyncSession) -> Filter:
@@ -126,5 +212,6 @@ async def create_new_filter(filter_data: FilterCreate, db: AsyncSession) -> Filt
     db.add(db_filter)
     await db.commit()
     await db.refresh(db_filter)
+    filter_cache.invalidate()
     logger.info(f"Created new filter with ID {db_filter.id}")
     return db_filter
\ No newline at end of file
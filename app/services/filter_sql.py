@@ -0,0 +1,173 @@
+import json
+import math
+from decimal import Decimal
+from typing import Any, Callable
+from sqlalchemy import and_, or_, not_, case, cast, false, true, func, literal, select, Float, Numeric, String, \
+    DateTime, Text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.sql.elements import ColumnElement
+from app.models.filters import Filter
+from app.models.lots import Lot
+from app.models.tenders import Tender
+from app.services.filter_engine import COMPARISONS, FILTER_FIELDS, walk_condition
+from app.core.logging_config import logger
+
+
+def _column_kind(column) -> str:
+    column_type = column.type
+    if isinstance(column_type, JSONB):
+        return "json"
+    if isinstance(column_type, Numeric):
+        return "numeric"
+    if isinstance(column_type, DateTime):
+        return "datetime"
+    if isinstance(column_type, String):
+        return "string"
+    raise ValueError(f"Unsupported filter column type {column_type!r}")
+
+
+# Поле условия -> (колонка, вид значения в Python)
+FILTER_COLUMNS = {name: (Tender.__table__.c[name], _column_kind(Tender.__table__.c[name])) for name in FILTER_FIELDS}
+# Вычисляемые поля из DERIVED_FIELDS; count не бывает NULL, как и len(tender.lots)
+FILTER_COLUMNS["lots_count"] = (
+    select(func.count(Lot.__table__.c.id))
+    .where(Lot.__table__.c.tender_id == Tender.__table__.c.external_id)
+    .correlate(Tender.__table__)
+    .scalar_subquery(),
+    "numeric",
+)
+
+
+def _normalize(value: Any) -> Any:
+    """Значение условия для SQL; None — в SQL без потери семантики не переводится."""
+    if isinstance(value, bool):
+        # В Python True == 1, поэтому булевы значения сравниваются как числа
+        return int(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float)):
+        return value
+    return None
+
+
+def _contains(text_expr, value: str) -> ColumnElement:
+    return func.strpos(func.lower(text_expr), func.lower(literal(value, Text))) > 0
+
+
+def _scalar_leaf(column, kind: str, op: str, value: Any) -> ColumnElement:
+    # str, Decimal и datetime сравнимы в Python только со значениями своего типа;
+    # для остальных "=" ложно, "!=" истинно, а порядок даёт TypeError -> False
+    if op == "contains":
+        return _contains(column, value) if kind == "string" else false()
+    comparable = ((kind == "string" and isinstance(value, str))
+                  or (kind == "numeric" and isinstance(value, (int, float))))
+    if not comparable:
+        return column.isnot(None) if op == "!=" else false()
+    if kind == "numeric":
+        # Decimal сравнивается с float точно, поэтому берём точное двоичное значение float
+        return COMPARISONS[op](column, literal(Decimal(value), Numeric))
+    if op in ("=", "!="):
+        return COMPARISONS[op](column, literal(value, Text))
+    # Строки в Python сравниваются по кодовым точкам, как байты UTF-8 в COLLATE "C"
+    return COMPARISONS[op](column.collate("C"), literal(value, Text))
+
+
+def _json_leaf(column, path: tuple[str, ...], op: str, value: Any) -> ColumnElement:
+    node = column.op("#>")(literal(list(path), ARRAY(Text))) if path else column
+    json_type = func.jsonb_typeof(node)
+    text_value = node.op("#>>")(literal([], ARRAY(Text)))
+    # get_nested_value спускается только по объектам, а #> умеет и по индексам массивов
+    guards = [func.jsonb_typeof(column.op("#>")(literal(list(path[:depth]), ARRAY(Text))) if depth else column)
+              == "object" for depth in range(len(path))]
+
+    if isinstance(value, str):
+        if op == "contains":
+            matched = and_(json_type == "string", _contains(text_value, value))
+        elif op in ("=", "!="):
+            matched = and_(json_type == "string", text_value == literal(value, Text))
+        else:
+            matched = and_(json_type == "string", COMPARISONS[op](text_value.collate("C"), literal(value, Text)))
+    else:
+        # В Python с числом сравнимы числа и bool; JSON-числа приходят как int/float
+        target = Float if isinstance(value, float) else Numeric
+        number = case(
+            (json_type == "number", cast(text_value, target)),
+            (json_type == "boolean", case((text_value == "true", 1), else_=0)),
+        )
+        compare_op = "=" if op == "!=" else op
+        matched = and_(json_type.in_(("number", "boolean")),
+                       COMPARISONS[compare_op](number, literal(value, target)))
+
+    if op == "!=":
+        matched = and_(json_type != "null", not_(func.coalesce(matched, false())))
+    return and_(*guards, matched) if guards else matched
+
+
+class _SqlBackend:
+    """Условие как SQL-выражение над tenders; None — условие нельзя перевести точно."""
+
+    @staticmethod
+    def const(result: bool) -> ColumnElement:
+        return true() if result else false()
+
+    @staticmethod
+    def interpreted(condition: Any) -> None:
+        return None
+
+    @staticmethod
+    def leaf(field: str, op: str, value: Any, test: Callable, key: tuple | None) -> ColumnElement | None:
+        name, _, rest = field.partition(".")
+        if name not in FILTER_COLUMNS:
+            # Поля нет в словаре тендера -> get_nested_value вернёт None
+            return false()
+        column, kind = FILTER_COLUMNS[name]
+        if rest and kind != "json":
+            # Спуск внутрь не-словаря даёт None
+            return false()
+        value = _normalize(value)
+        if value is None:
+            return None
+        if kind == "json":
+            expression = _json_leaf(column, tuple(rest.split(".")) if rest else (), op, value)
+        else:
+            expression = _scalar_leaf(column, kind, op, value)
+        # NULL в SQL соответствует None в Python, а лист с None ложен
+        return func.coalesce(expression, false())
+
+    @staticmethod
+    def all(compiled: tuple) -> ColumnElement | None:
+        if any(expression is None for expression in compiled):
+            return None
+        return and_(*compiled) if compiled else true()
+
+    @staticmethod
+    def any(compiled: tuple) -> ColumnElement | None:
+        if any(expression is None for expression in compiled):
+            return None
+        return or_(*compiled) if compiled else false()
+
+
+def condition_to_sql(condition: Any) -> ColumnElement | None:
+    """Переводит дерево условия в выражение SQLAlchemy с той же семантикой, что evaluate_condition.
+
+    Возвращает None, если условие использует то, что нельзя выразить в SQL без
+    расхождений (нестандартная форма, список или словарь в value, NaN).
+    """
+    return walk_condition(condition, _SqlBackend)
+
+
+def filter_to_sql(filter_obj: Filter) -> ColumnElement | None:
+    """Условие фильтра целиком, как у check_filter: пустое условие пропускает всё.
+
+    Формулы в SQL не переводятся: для фильтра с formula возвращается None.
+    """
+    if filter_obj.formula:
+        return None
+    if not filter_obj.condition:
+        return true()
+    try:
+        condition = json.loads(filter_obj.condition)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid filter condition JSON for filter {filter_obj.id}: {str(e)}")
+        return false()
+    return condition_to_sql(condition)
@@ -0,0 +1,196 @@
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.filters import record_filter_stats
+from app.db.database import AsyncSessionLocal
+from app.services.filter_engine import CompiledFilter, TenderBatch, filter_cache
+from app.core.config import settings
+from app.core.logging_config import logger
+
+# Значения Filter.success_action при совпадении условия
+ACTION_PASS = 1
+ACTION_REJECT = 2
+
+
+class FilterStats:
+    """Счётчики фильтров в процессе: [проверок, совпадений, пропусков, наносекунд].
+
+    Накопленные с последнего сброса приращения периодически записываются в
+    filter_stats, чтобы статистику видели все процессы.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.totals: dict[int, list[int]] = {}
+        self._pending: dict[int, list[int]] = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, filter_id: int, matched: bool, passed: bool, elapsed_ns: int) -> None:
+        for counters in (self.totals, self._pending):
+            row = counters.get(filter_id)
+            if row is None:
+                row = counters[filter_id] = [0, 0, 0, 0]
+            row[0] += 1
+            row[1] += matched
+            row[2] += passed
+            row[3] += elapsed_ns
+
+    def rank(self, filter_id: int) -> float:
+        """Ожидаемая цена поиска пропуска через фильтр: среднее время / вероятность пропуска."""
+        evaluations, _, passes, elapsed_ns = self.totals.get(filter_id, (0, 0, 0, 0))
+        average_ns = elapsed_ns / evaluations if evaluations else 0.0
+        return average_ns * (evaluations + 2) / (passes + 1)
+
+    async def flush(self, force: bool = False) -> None:
+        """Записывает приращения в своей сессии: ошибка статистики не трогает транзакцию конвейера."""
+        if not self._pending or (not force and time.monotonic() - self._flushed_at < self.flush_interval):
+            return
+        pending, self._pending = self._pending, {}
+        self._flushed_at = time.monotonic()
+        try:
+            async with AsyncSessionLocal() as db:
+                await record_filter_stats(db, pending)
+        except Exception as e:
+            logger.error(f"Failed to save filter stats: {str(e)}")
+            # Приращения не теряем: уйдут при следующем сбросе
+            for filter_id, row in pending.items():
+                counters = self._pending.setdefault(filter_id, [0, 0, 0, 0])
+                for index, value in enumerate(row):
+                    counters[index] += value
+
+
+filter_stats = FilterStats(settings.FILTER_STATS_FLUSH_INTERVAL)
+
+
+class SiblingGroup:
+    """Фильтры одного родителя в порядке проверки.
+
+    Порядок меняется, только если ни одно поддерево группы не может отклонить
+    тендер: тогда итог группы — «есть ли пропуск», и от порядка он не зависит.
+    """
+
+    def __init__(self, nodes: list["FilterNode"]):
+        self.nodes = nodes
+        self.reorderable = not any(node.can_reject for node in nodes)
+        self._evaluations = 0
+
+    def after_evaluation(self) -> None:
+        if not self.reorderable or len(self.nodes) < 2:
+            return
+        self._evaluations += 1
+        if self._evaluations % settings.FILTER_REORDER_EVERY == 0:
+            self.nodes.sort(key=lambda node: (filter_stats.rank(node.id), node.compiled.priority, node.id))
+
+
+class FilterNode:
+    def __init__(self, compiled: CompiledFilter, children: list["FilterNode"]):
+        self.compiled = compiled
+        self.id = compiled.id
+        self.children = SiblingGroup(children)
+        self.can_reject = compiled.success_action == ACTION_REJECT or any(child.can_reject for child in children)
+
+
+class FilterTree:
+    """Дерево активных фильтров одного типа.
+
+    Дочерние фильтры проверяются, только если совпал родитель. При совпадении
+    success_action 1 сразу пропускает тендер, 2 — сразу отклоняет, иначе
+    решают дочерние фильтры, а фильтр без дочерних пропускает тендер. Если в
+    группе никто не принял решения, проверяется следующий фильтр уровня выше.
+    Для плоского набора это прежнее «пропустить при первом совпадении».
+    """
+
+    def __init__(self, filters: list[CompiledFilter]):
+        self.size = len(filters)
+        by_parent: dict[int | None, list[CompiledFilter]] = {}
+        ids = {compiled.id for compiled in filters}
+        for compiled in filters:
+            parent_id = compiled.parent_id if compiled.parent_id in ids else None
+            if compiled.parent_id is not None and parent_id is None:
+                # Родитель неактивен или другого типа: ветку не проверяем
+                logger.warning(f"Filter {compiled.id} skipped: parent {compiled.parent_id} is not an active filter")
+                continue
+            by_parent.setdefault(parent_id, []).append(compiled)
+
+        visited = set()
+
+        def build(parent_id: int | None) -> list[FilterNode]:
+            nodes = []
+            for compiled in by_parent.get(parent_id, []):
+                if compiled.id in visited:
+                    continue
+                visited.add(compiled.id)
+                nodes.append(FilterNode(compiled, build(compiled.id)))
+            return nodes
+
+        # filters уже упорядочены по priority, поэтому и группы тоже
+        self.roots = SiblingGroup(build(None))
+
+    def _evaluate_group(self, group: SiblingGroup, tender_data: dict) -> int | None:
+        outcome = None
+        for node in group.nodes:
+            outcome = self._evaluate_node(node, tender_data)
+            if outcome is not None:
+                break
+        group.after_evaluation()
+        return outcome
+
+    def _evaluate_node(self, node: FilterNode, tender_data: dict) -> int | None:
+        started = time.perf_counter_ns()
+        matched = node.compiled.matches(tender_data)
+        outcome = None
+        if matched:
+            action = node.compiled.success_action
+            if action in (ACTION_PASS, ACTION_REJECT):
+                outcome = action
+            elif node.children.nodes:
+                outcome = self._evaluate_group(node.children, tender_data)
+            else:
+                outcome = ACTION_PASS
+        filter_stats.record(node.id, matched, outcome == ACTION_PASS, time.perf_counter_ns() - started)
+        return outcome
+
+    def evaluate(self, tender_data: dict) -> bool:
+        if not self.size:
+            return True
+        return self._evaluate_group(self.roots, tender_data) == ACTION_PASS
+
+    def _evaluate_group_batch(self, group: SiblingGroup, batch: TenderBatch, remaining: int) -> tuple[int, int]:
+        passed = rejected = 0
+        for node in group.nodes:
+            if not remaining:
+                break
+            matched = node.compiled.batch_predicate(batch) & remaining
+            if not matched:
+                continue
+            action = node.compiled.success_action
+            if action == ACTION_PASS:
+                node_passed, node_rejected = matched, 0
+            elif action == ACTION_REJECT:
+                node_passed, node_rejected = 0, matched
+            elif node.children.nodes:
+                node_passed, node_rejected = self._evaluate_group_batch(node.children, batch, matched)
+            else:
+                node_passed, node_rejected = matched, 0
+            passed |= node_passed
+            rejected |= node_rejected
+            remaining &= ~(node_passed | node_rejected)
+        return passed, rejected
+
+    def evaluate_batch(self, batch: TenderBatch) -> int:
+        """Маска тендеров пакета, которые evaluate пропустил бы."""
+        if not self.size:
+            return batch.all
+        return self._evaluate_group_batch(self.roots, batch, batch.all)[0]
+
+
+# тип -> (список фильтров из кэша, дерево по нему)
+_trees: dict[str, tuple[list[CompiledFilter], FilterTree]] = {}
+
+
+async def get_filter_tree(db: AsyncSession, filter_type: str) -> FilterTree:
+    """Дерево перестраивается, только когда filter_cache отдаёт новый список фильтров."""
+    filters = await filter_cache.get(db, filter_type)
+    cached = _trees.get(filter_type)
+    if cached is None or cached[0] is not filters:
+        cached = _trees[filter_type] = (filters, FilterTree(filters))
+    return cached[1]
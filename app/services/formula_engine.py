@@ -0,0 +1,282 @@
+import ast
+import math
+import operator
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Iterable
+from app.core.logging_config import logger
+
+# Ограничения на формулу, чтобы пользовательский ввод не мог занять процесс надолго
+MAX_FORMULA_LENGTH = 1000
+MAX_FORMULA_DEPTH = 32
+MAX_POWER = 64
+MAX_INT_BITS = 4096
+MAX_STRING_LENGTH = 10_000
+MAX_ROUND_DIGITS = 32
+
+Evaluator = Callable[[dict], Any]
+
+
+class FormulaError(ValueError):
+    """Формула не разбирается или использует недопустимые конструкции."""
+
+
+def _days(value: datetime | date) -> float:
+    if isinstance(value, datetime):
+        now = datetime.now(value.tzinfo or timezone.utc)
+        return (value - now).total_seconds() / 86400
+    return float((value - date.today()).days)
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, str):
+        return float(value.replace(" ", "").replace(",", "."))
+    return float(value)
+
+
+def _round(value: Any, ndigits: Any = None) -> Any:
+    # Встроенный round с огромным ndigits считает 10**ndigits и надолго занимает процесс
+    if ndigits is None:
+        return round(value)
+    if not isinstance(ndigits, int) or isinstance(ndigits, bool) or abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ValueError(f"round() ndigits must be an integer from -{MAX_ROUND_DIGITS} to {MAX_ROUND_DIGITS}")
+    return round(value, ndigits)
+
+
+FUNCTIONS: dict[str, Callable] = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": _round,
+    "len": len,
+    "number": _number,
+    "lower": lambda value: value.lower(),
+    "upper": lambda value: value.upper(),
+    "contains": lambda value, part: part.lower() in value.lower(),
+    # Дни до даты (отрицательные — дата уже прошла) и дни с даты
+    "days_until": _days,
+    "days_since": lambda value: -_days(value),
+}
+
+
+def _power(base: Any, exponent: Any) -> Any:
+    if abs(exponent) > MAX_POWER:
+        raise ValueError(f"Exponent {exponent} is too large")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * abs(exponent) > MAX_INT_BITS:
+        raise ValueError("Result is too large")
+    return operator.pow(base, exponent)
+
+
+def _multiply(left: Any, right: Any) -> Any:
+    # Повторение строк и списков не нужно формулам и может раздуть память
+    if not isinstance(left, (int, float)) or not isinstance(right, (int, float)):
+        raise TypeError("Only numbers can be multiplied")
+    return left * right
+
+
+def _modulo(left: Any, right: Any) -> Any:
+    # Для строки % — это printf-форматирование: "%*d" % (10**8, 1) строит строку в сотни мегабайт
+    if not isinstance(left, (int, float, Decimal)) or not isinstance(right, (int, float, Decimal)):
+        raise FormulaError("Only numbers can be used with %")
+    return left % right
+
+
+def _add(left: Any, right: Any) -> Any:
+    result = left + right
+    if isinstance(result, str) and len(result) > MAX_STRING_LENGTH:
+        raise ValueError("String is too long")
+    return result
+
+
+BINARY_OPERATORS = {
+    ast.Add: _add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: _modulo,
+    ast.Pow: _power,
+}
+UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_}
+COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
+
+
+def _read(value: Any) -> Any:
+    # Цены приходят из БД как Decimal; в формулах считаем во float, чтобы 1.2 * price работало
+    return float(value) if isinstance(value, Decimal) else value
+
+
+class _Compiler:
+    def __init__(self, names: set[str]):
+        self.names = names
+
+    def compile(self, node: ast.AST, depth: int = 0) -> Evaluator:
+        if depth > MAX_FORMULA_DEPTH:
+            raise FormulaError("Formula is nested too deeply")
+        method = getattr(self, f"_{type(node).__name__}", None)
+        if method is None:
+            raise FormulaError(f"{type(node).__name__} is not allowed in formulas")
+        return method(node, depth + 1)
+
+    def _Expression(self, node: ast.Expression, depth: int) -> Evaluator:
+        return self.compile(node.body, depth)
+
+    def _Constant(self, node: ast.Constant, depth: int) -> Evaluator:
+        if not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise FormulaError(f"Constant {node.value!r} is not allowed")
+        value = node.value
+        return lambda data: value
+
+    def _Name(self, node: ast.Name, depth: int) -> Evaluator:
+        if node.id not in self.names:
+            raise FormulaError(f"Unknown name {node.id!r}")
+        name = node.id
+        return lambda data: _read(data.get(name))
+
+    def _Attribute(self, node: ast.Attribute, depth: int) -> Evaluator:
+        # organizer.inn — путь внутрь JSON-поля, как в условиях фильтров
+        keys = []
+        while isinstance(node, ast.Attribute):
+            if node.attr.startswith("_"):
+                raise FormulaError(f"Field {node.attr!r} is not allowed")
+            keys.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            raise FormulaError("Only field paths like organizer.inn are allowed")
+        root = self._Name(node, depth)
+        keys.reverse()
+
+        def get(data: dict) -> Any:
+            value = root(data)
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    return None
+                value = value[key]
+            return _read(value)
+        return get
+
+    def _BinOp(self, node: ast.BinOp, depth: int) -> Evaluator:
+        function = BINARY_OPERATORS.get(type(node.op))
+        if function is None:
+            raise FormulaError(f"Operator {type(node.op).__name__} is not allowed")
+        left, right = self.compile(node.left, depth), self.compile(node.right, depth)
+        return lambda data: function(left(data), right(data))
+
+    def _UnaryOp(self, node: ast.UnaryOp, depth: int) -> Evaluator:
+        function = UNARY_OPERATORS.get(type(node.op))
+        if function is None:
+            raise FormulaError(f"Operator {type(node.op).__name__} is not allowed")
+        operand = self.compile(node.operand, depth)
+        return lambda data: function(operand(data))
+
+    def _BoolOp(self, node: ast.BoolOp, depth: int) -> Evaluator:
+        values = tuple(self.compile(value, depth) for value in node.values)
+        if isinstance(node.op, ast.And):
+            def conjunction(data: dict) -> Any:
+                result = True
+                for value in values:
+                    result = value(data)
+                    if not result:
+                        return result
+                return result
+            return conjunction
+
+        def disjunction(data: dict) -> Any:
+            result = False
+            for value in values:
+                result = value(data)
+                if result:
+                    return result
+            return result
+        return disjunction
+
+    def _Compare(self, node: ast.Compare, depth: int) -> Evaluator:
+        functions = []
+        for op in node.ops:
+            function = COMPARE_OPERATORS.get(type(op))
+            if function is None:
+                raise FormulaError(f"Operator {type(op).__name__} is not allowed")
+            functions.append(function)
+        left = self.compile(node.left, depth)
+        comparators = tuple(zip(functions, (self.compile(item, depth) for item in node.comparators)))
+
+        def compare(data: dict) -> bool:
+            current = left(data)
+            for function, right in comparators:
+                value = right(data)
+                if not function(current, value):
+                    return False
+                current = value
+            return True
+        return compare
+
+    def _IfExp(self, node: ast.IfExp, depth: int) -> Evaluator:
+        test, body, orelse = (self.compile(item, depth) for item in (node.test, node.body, node.orelse))
+        return lambda data: body(data) if test(data) else orelse(data)
+
+    def _Tuple(self, node: ast.Tuple, depth: int) -> Evaluator:
+        # Только для "x in ('a', 'b')"
+        items = tuple(self.compile(item, depth) for item in node.elts)
+        return lambda data: tuple(item(data) for item in items)
+
+    _List = _Tuple
+
+    def _Call(self, node: ast.Call, depth: int) -> Evaluator:
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise FormulaError("Only calls like name(arg, ...) of built-in formula functions are allowed")
+        function = FUNCTIONS[node.func.id]
+        args = tuple(self.compile(arg, depth) for arg in node.args)
+        return lambda data: function(*(arg(data) for arg in args))
+
+
+@dataclass(frozen=True)
+class CompiledFormula:
+    source: str
+    evaluator: Evaluator
+
+    def evaluate(self, data: dict) -> Any:
+        """Значение формулы; None, если она не вычисляется на этих данных (нет поля, деление на 0...)."""
+        memo = getattr(data, "formula_values", None)
+        if memo is not None and self.source in memo:
+            return memo[self.source]
+        try:
+            value = self.evaluator(data)
+            if isinstance(value, float) and not math.isfinite(value):
+                value = None
+        except (TypeError, ValueError, ArithmeticError, AttributeError) as e:
+            logger.debug(f"Formula {self.source!r} failed: {str(e)}")
+            value = None
+        if memo is not None:
+            memo[self.source] = value
+        return value
+
+    def evaluate_batch(self, rows: Iterable[dict]) -> list[Any]:
+        return [self.evaluate(row) for row in rows]
+
+
+def compile_formula(source: str, names: Iterable[str]) -> CompiledFormula:
+    """Разбирает выражение в синтаксисе Python и компилирует его в замыкания.
+
+    Разрешены только арифметика, сравнения, and/or/not, x if c else y, поля
+    из names (с путями внутрь JSON через точку) и функции из FUNCTIONS; eval
+    и exec не используются. Поднимает FormulaError для всего остального.
+    """
+    if not isinstance(source, str) or not source.strip():
+        raise FormulaError("Formula is empty")
+    if len(source) > MAX_FORMULA_LENGTH:
+        raise FormulaError(f"Formula is longer than {MAX_FORMULA_LENGTH} characters")
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"Invalid formula syntax: {e.msg}") from e
+    return CompiledFormula(source=source, evaluator=_Compiler(set(names) - set(FUNCTIONS)).compile(tree))
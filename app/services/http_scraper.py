@@ -0,0 +1,82 @@
+import codecs
+import os
+from html.parser import HTMLParser
+from urllib.parse import unquote, urljoin, urlparse
+from app.schemas.tender_request import Document
+from app.services.http_sessions import get_http_session
+from app.core.config import settings
+from app.core.logging_config import logger
+
+PDF_EXTENSION = ".pdf"
+READ_CHUNK = 64 * 1024
+
+
+class DocumentLinkParser(HTMLParser):
+    """Собирает ссылки на PDF из HTML по мере поступления фрагментов страницы."""
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links: list[str] = []
+        self._seen: set[str] = set()
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href)
+            return
+        if tag != "a":
+            return
+        href = dict(attrs).get("href")
+        # То же условие, что и у браузерного скрапера: contains(@href, '.pdf')
+        if not href or PDF_EXTENSION not in href:
+            return
+        url = urljoin(self.base_url, href.strip())
+        if url not in self._seen:
+            self._seen.add(url)
+            self.links.append(url)
+
+
+def link_to_document(url: str, index: int) -> Document:
+    file_name = unquote(os.path.basename(urlparse(url).path)) or f"document_{index}.pdf"
+    return Document(file_name=file_name, url=url)
+
+
+async def find_document_links(page_url: str) -> list[Document]:
+    """Загружает страницу тендера обычным HTTP-запросом и возвращает ссылки на PDF.
+
+    Страница разбирается потоково и читается не дальше SCRAPE_HTTP_MAX_PAGE_SIZE
+    байт. Пустой список означает, что нужен браузер.
+    """
+    session = get_http_session("documents")
+    try:
+        async with session.get(page_url) as response:
+            if response.status != 200:
+                logger.info(f"HTTP scrape of {page_url} got HTTP {response.status}")
+                return []
+            if "html" not in response.content_type:
+                logger.info(f"HTTP scrape of {page_url} got {response.content_type}, not HTML")
+                return []
+
+            parser = DocumentLinkParser(str(response.url))
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+            read = 0
+            async for chunk in response.content.iter_chunked(READ_CHUNK):
+                parser.feed(decoder.decode(chunk))
+                read += len(chunk)
+                if read >= settings.SCRAPE_HTTP_MAX_PAGE_SIZE:
+                    logger.warning(f"HTTP scrape of {page_url} stopped after {read} bytes")
+                    break
+            else:
+                parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+    except LookupError as e:
+        logger.warning(f"HTTP scrape of {page_url} failed: unknown charset {str(e)}")
+        return []
+    except Exception as e:
+        logger.warning(f"HTTP scrape of {page_url} failed: {str(e)}")
+        return []
+
+    logger.info(f"HTTP scrape found {len(parser.links)} PDF links on {page_url}")
+    return [link_to_document(url, index) for index, url in enumerate(parser.links, 1)]
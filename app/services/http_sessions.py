@@ -0,0 +1,44 @@
+import aiohttp
+from app.core.logging_config import logger
+from app.core.config import settings
+
+# Долгоживущие сессии по одной на каждый внешний сервис: ai, bitrix, telegram, documents
+_sessions: dict[str, aiohttp.ClientSession] = {}
+
+
+def _create_session(name: str) -> aiohttp.ClientSession:
+    profile = settings.HTTP_SESSIONS[name]
+    connector = aiohttp.TCPConnector(
+        limit=profile["limit"],
+        limit_per_host=profile["limit_per_host"],
+        keepalive_timeout=profile["keepalive_timeout"],
+        ttl_dns_cache=profile["ttl_dns_cache"],
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=profile["total_timeout"] or None,
+        connect=profile["connect_timeout"] or None,
+        sock_read=profile["read_timeout"] or None,
+    )
+    logger.info(f"HTTP session '{name}' created: {profile}")
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def init_http_sessions() -> None:
+    """Создаёт сессии всех сервисов; вызывается из lifespan приложения и при старте воркера."""
+    for name in settings.HTTP_SESSIONS:
+        get_http_session(name)
+
+
+def get_http_session(name: str) -> aiohttp.ClientSession:
+    """Возвращает общую сессию сервиса, создавая её при первом обращении."""
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        session = _sessions[name] = _create_session(name)
+    return session
+
+
+async def close_http_sessions() -> None:
+    for name, session in list(_sessions.items()):
+        await session.close()
+        logger.info(f"HTTP session '{name}' closed")
+    _sessions.clear()
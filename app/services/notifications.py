@@ -1,7 +1,7 @@
-import aiohttp
 from app.core.logging_config import logger
 from app.models.tenders import Tender
 from app.core.config import settings  # Импортируем конфигурацию
+from app.services.http_sessions import get_http_session
 
 async def send_telegram_alert(tender: Tender, message: str) -> None:
     if not settings.TELEGRAM_BOT_TOKEN or not settings.TELEGRAM_CHAT_ID:
@@ -24,11 +24,11 @@ async def send_telegram_alert(tender: Tender, message: str) -> None:
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as response:
-                if response.status != 200:
-                    logger.error(f"Failed to send Telegram alert: HTTP {response.status}, {await response.text()}")
-                else:
-                    logger.info(f"Telegram alert sent for tender {tender.external_id}: {message}")
+        session = get_http_session("telegram")
+        async with session.post(url, json=payload) as response:
+            if response.status != 200:
+                logger.error(f"Failed to send Telegram alert: HTTP {response.status}, {await response.text()}")
+            else:
+                logger.info(f"Telegram alert sent for tender {tender.external_id}: {message}")
     except Exception as e:
         logger.error(f"Error sending Telegram alert for tender {tender.external_id}: {str(e)}")
\ No newline at end of file
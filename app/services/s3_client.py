@@ -0,0 +1,49 @@
+import asyncio
+from contextlib import AsyncExitStack
+import aiobotocore.session
+from aiobotocore.config import AioConfig
+from app.core.logging_config import logger
+from app.core.config import settings
+
+# Один S3-клиент на процесс: общий пул соединений, TLS и учётные данные
+_s3_client = None
+_exit_stack: AsyncExitStack | None = None
+_lock = asyncio.Lock()
+
+
+async def init_s3_client():
+    """Создаёт общий S3-клиент; вызывается из lifespan приложения и при старте воркера."""
+    global _s3_client, _exit_stack
+    async with _lock:
+        if _s3_client is not None:
+            return _s3_client
+        exit_stack = AsyncExitStack()
+        session = aiobotocore.session.get_session()
+        _s3_client = await exit_stack.enter_async_context(session.create_client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            aws_access_key_id=settings.S3_ACCESS_KEY,
+            aws_secret_access_key=settings.S3_SECRET_KEY,
+            region_name=settings.S3_REGION,
+            config=AioConfig(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS)
+        ))
+        _exit_stack = exit_stack
+        logger.info(f"S3 client created with pool size {settings.S3_MAX_POOL_CONNECTIONS}")
+        return _s3_client
+
+
+async def get_s3_client():
+    """Возвращает общий S3-клиент, создавая его при первом обращении."""
+    if _s3_client is None:
+        return await init_s3_client()
+    return _s3_client
+
+
+async def close_s3_client() -> None:
+    global _s3_client, _exit_stack
+    async with _lock:
+        if _exit_stack is not None:
+            await _exit_stack.aclose()
+            logger.info("S3 client closed")
+        _s3_client = None
+        _exit_stack = None
@@ -1,85 +1,332 @@
+import asyncio
+import aiofiles
 import aiohttp
-import aiobotocore.session
+import hashlib
+import mimetypes
+import os
 import re
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from botocore.exceptions import ClientError
 from app.core.logging_config import logger
 from app.core.config import settings
+from app.services.s3_client import get_s3_client
+from app.services.http_sessions import get_http_session
+from app.models.document_fetch_cache import DocumentFetchCache
 
+# Минимальный размер части multipart upload в S3 (кроме последней)
+MIN_PART_SIZE = 5 * 1024 * 1024
 
-async def upload_to_s3(url: str, file_name: str, tender_id: str) -> str | None:
 
-    logger.info(f"Starting upload for file {file_name} from {url} for tender {tender_id}")
+@dataclass
+class StoredDocument:
+    url: str
+    content_hash: str
+    size: int
+    mime_type: str | None
+    deduplicated: bool = False
+    not_modified: bool = False
+    # Валидаторы источника для условной перезагрузки
+    etag: str | None = None
+    last_modified: str | None = None
+    content_length: int | None = None
+
+    def cache_entry(self, source_url: str) -> dict:
+        return {
+            "url": source_url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_length": self.content_length,
+            "content_hash": self.content_hash,
+            "size": self.size,
+            "mime_type": self.mime_type,
+            "s3_url": self.url,
+        }
+
+
+class HashingStream:
+    """Считает sha256 содержимого по мере чтения потока."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    async def read(self, n: int) -> bytes:
+        chunk = await self.stream.read(n)
+        self.sha256.update(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+def blob_key(content_hash: str) -> str:
+    """Ключ S3, адресуемый содержимым: одинаковые файлы хранятся один раз."""
+    return f"blobs/{content_hash[:2]}/{content_hash}"
+
+
+def s3_url_for(s3_key: str) -> str:
+    return f"{settings.S3_ENDPOINT_URL}/{settings.S3_BUCKET_NAME}/{s3_key}"
+
+
+def s3_key_for(url: str) -> str | None:
+    """Ключ S3 для ссылки на наш бакет; None — файл хранится не у нас."""
+    prefix = s3_url_for("")
+    if not url.startswith(prefix) or len(url) == len(prefix):
+        return None
+    return url[len(prefix):]
+
+
+async def blob_exists(s3_client, s3_key: str) -> bool:
     try:
-        async with aiohttp.ClientSession() as session:
-
-            if "drive.google.com" in url:
-
-                file_id_match = re.search(r'file/d/([a-zA-Z0-9_-]+)/', url)
-                if not file_id_match:
-                    logger.error(f"Не удалось извлечь ID файла из Google Drive URL: {url}")
-                    return None
-
-                file_id = file_id_match.group(1)
-                download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-
-                async with session.get(download_url) as response:
-                    if response.status != 200:
-                        logger.error(f"Ошибка при скачивании с Google Drive {url}: HTTP {response.status}")
-                        return None
-
-                    #
-                    content_type = response.headers.get('Content-Type', '')
-                    if 'text/html' in content_type:
-                        html_content = await response.text()
-                        token_match = re.search(r'confirm=([0-9A-Za-z]+)', html_content)
-                        if token_match:
-                            confirm_token = token_match.group(1)
-                            download_url = f"https://drive.google.com/uc?export=download&id={file_id}&confirm={confirm_token}"
-                            async with session.get(download_url) as response:
-                                if response.status != 200:
-                                    logger.error(
-                                        f"Ошибка после подтверждения Google Drive {url}: HTTP {response.status}")
-                                    return None
-                                content = await response.read()
-                        else:
-                            logger.error(f"Не удалось найти confirmation token для Google Drive {url}")
-                            return None
-                    else:
-                        content = await response.read()
-            else:
-                # Обычный URL
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to download {url}: HTTP {response.status}")
-                        return None
-                    content = await response.read()
-
-            if content is None:
-                logger.error(f"Не удалось скачать содержимое файла из {url}")
-                return None
+        await s3_client.head_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+@asynccontextmanager
+async def open_download(session: aiohttp.ClientSession, url: str, headers: dict | None = None):
+    """Открывает ответ с телом файла, не читая его; отдаёт None, если скачать нельзя.
+
+    headers передаются только обычным URL; ответ 304 на условный запрос отдаётся как есть.
+    """
+    if "drive.google.com" in url:
+
+        file_id_match = re.search(r'file/d/([a-zA-Z0-9_-]+)/', url)
+        if not file_id_match:
+            logger.error(f"Не удалось извлечь ID файла из Google Drive URL: {url}")
+            yield None
+            return
+
+        file_id = file_id_match.group(1)
+        download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+
+        async with session.get(download_url) as response:
+            if response.status != 200:
+                logger.error(f"Ошибка при скачивании с Google Drive {url}: HTTP {response.status}")
+                yield None
+                return
+
+            # Большие файлы Google Drive отдаёт через страницу подтверждения
+            content_type = response.headers.get('Content-Type', '')
+            if 'text/html' not in content_type:
+                yield response
+                return
+
+            html_content = await response.text()
+            token_match = re.search(r'confirm=([0-9A-Za-z]+)', html_content)
+            if not token_match:
+                logger.error(f"Не удалось найти confirmation token для Google Drive {url}")
+                yield None
+                return
+
+        confirm_token = token_match.group(1)
+        download_url = f"https://drive.google.com/uc?export=download&id={file_id}&confirm={confirm_token}"
+        async with session.get(download_url) as response:
+            if response.status != 200:
+                logger.error(f"Ошибка после подтверждения Google Drive {url}: HTTP {response.status}")
+                yield None
+                return
+            yield response
+    else:
+        # Обычный URL
+        async with session.get(url, headers=headers) as response:
+            if response.status not in (200, 304):
+                logger.error(f"Failed to download {url}: HTTP {response.status}")
+                yield None
+                return
+            yield response
+
+
+async def read_part(stream, size: int) -> bytearray:
+    """Читает из потока ровно size байт или остаток до конца файла.
 
-        # Формируем ключ для S3
-        s3_key = f"tenders/{tender_id}/{file_name}"
-        session = aiobotocore.session.get_session()
-
-        # Создаём клиента S3
-        async with session.create_client(
-                "s3",
-                endpoint_url=settings.S3_ENDPOINT_URL,
-                aws_access_key_id=settings.S3_ACCESS_KEY,
-                aws_secret_access_key=settings.S3_SECRET_KEY,
-                region_name=settings.S3_REGION
-        ) as s3_client:
-            await s3_client.put_object(
+    Буфер выделяется один раз и не копируется: часть занимает в памяти свой размер, а не два.
+    """
+    buffer = bytearray(size)
+    filled = 0
+    with memoryview(buffer) as view:
+        while filled < size:
+            chunk = await stream.read(size - filled)
+            if not chunk:
+                break
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+    del buffer[filled:]
+    return buffer
+
+
+async def stream_to_s3(s3_client, stream, s3_key: str, first_part: bytes | bytearray | None = None,
+                       content_type: str | None = None) -> int:
+    """Передаёт поток в S3 частями фиксированного размера; возвращает число байт.
+
+    В памяти одновременно не больше S3_PART_SIZE * S3_MAX_PARTS_IN_FLIGHT байт: следующая
+    часть читается, только когда загружается не больше S3_MAX_PARTS_IN_FLIGHT - 1.
+    Файл меньше одной части загружается обычным put_object. first_part — уже
+    прочитанное начало потока.
+    """
+    part_size = max(settings.S3_PART_SIZE, MIN_PART_SIZE)
+    chunk = first_part if first_part is not None else await read_part(stream, part_size)
+    # Дальше часть живёт только в задаче загрузки и освобождается вместе с ней
+    first_part = None
+    extra = {"ContentType": content_type} if content_type else {}
+    if len(chunk) < part_size:
+        await s3_client.put_object(Bucket=settings.S3_BUCKET_NAME, Key=s3_key, Body=chunk, **extra)
+        return len(chunk)
+
+    upload = await s3_client.create_multipart_upload(Bucket=settings.S3_BUCKET_NAME, Key=s3_key, **extra)
+    upload_id = upload["UploadId"]
+
+    async def upload_part(part_number: int, body: bytes) -> dict:
+        response = await s3_client.upload_part(
+            Bucket=settings.S3_BUCKET_NAME, Key=s3_key, UploadId=upload_id, PartNumber=part_number, Body=body
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    parts = []
+    in_flight = set()
+    total = 0
+    part_number = 0
+    try:
+        while chunk:
+            part_number += 1
+            total += len(chunk)
+            in_flight.add(asyncio.create_task(upload_part(part_number, chunk)))
+            chunk = None
+            if len(in_flight) >= settings.S3_MAX_PARTS_IN_FLIGHT:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                parts.extend(task.result() for task in done)
+            chunk = await read_part(stream, part_size)
+        parts.extend(await asyncio.gather(*in_flight))
+        in_flight = set()
+
+        await s3_client.complete_multipart_upload(
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])}
+        )
+        return total
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        # Часть, загруженная уже после abort, осталась бы в S3: дожидаемся отмены
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        await s3_client.abort_multipart_upload(Bucket=settings.S3_BUCKET_NAME, Key=s3_key, UploadId=upload_id)
+        raise
+
+
+async def store_stream(s3_client, source, mime_type: str | None) -> tuple[str, str, int, bool]:
+    """Сохраняет поток в blob по sha256; возвращает (ключ, хеш, размер, был ли blob уже в S3)."""
+    stream = HashingStream(source)
+    part_size = max(settings.S3_PART_SIZE, MIN_PART_SIZE)
+    first_part = await read_part(stream, part_size)
+
+    if len(first_part) < part_size:
+        content_hash = stream.hexdigest()
+        s3_key = blob_key(content_hash)
+        deduplicated = await blob_exists(s3_client, s3_key)
+        if not deduplicated:
+            await stream_to_s3(s3_client, stream, s3_key, first_part, mime_type)
+        return s3_key, content_hash, len(first_part), deduplicated
+
+    # Передаём поток частями, не держа файл в памяти. Ссылку на первую часть отдаём
+    # stream_to_s3 целиком, иначе она занимала бы память до конца загрузки
+    staging_key = f"staging/{uuid.uuid4().hex}"
+    pending = [first_part]
+    del first_part
+    size = await stream_to_s3(s3_client, stream, staging_key, pending.pop(), mime_type)
+    content_hash = stream.hexdigest()
+    s3_key = blob_key(content_hash)
+    try:
+        deduplicated = await blob_exists(s3_client, s3_key)
+        if not deduplicated:
+            await s3_client.copy_object(
                 Bucket=settings.S3_BUCKET_NAME,
                 Key=s3_key,
-                Body=content
+                CopySource={"Bucket": settings.S3_BUCKET_NAME, "Key": staging_key}
             )
+    finally:
+        await s3_client.delete_object(Bucket=settings.S3_BUCKET_NAME, Key=staging_key)
+    return s3_key, content_hash, size, deduplicated
+
 
-        s3_url = f"{settings.S3_ENDPOINT_URL}/{settings.S3_BUCKET_NAME}/{s3_key}"
-        logger.info(f"Successfully uploaded {file_name} to Yandex S3: {s3_url}")
-        return s3_url
+async def upload_local_file(path: str, file_name: str, tender_id: str) -> StoredDocument | None:
+    """Сохраняет в S3 файл с локального диска (например, скачанный браузером)."""
+    logger.info(f"Starting upload for local file {path} for tender {tender_id}")
+    mime_type = mimetypes.guess_type(file_name)[0]
+    try:
+        s3_client = await get_s3_client()
+        async with aiofiles.open(path, "rb") as source:
+            s3_key, content_hash, size, deduplicated = await store_stream(s3_client, source, mime_type)
+        stored = StoredDocument(url=s3_url_for(s3_key), content_hash=content_hash, size=size,
+                                mime_type=mime_type, deduplicated=deduplicated)
+        logger.info(f"Stored {file_name} ({size} bytes) for tender {tender_id} as {s3_key}")
+        return stored
+    except Exception as e:
+        logger.error(f"Error uploading local file {path} for tender {tender_id}: {str(e)}")
+        return None
+
+
+async def upload_document(url: str, file_name: str, tender_id: str,
+                          cached: DocumentFetchCache | None = None) -> StoredDocument | None:
+    """Скачивает документ и сохраняет его в S3 под ключом по sha256 содержимого.
+
+    Хеш считается на лету. Небольшой файл целиком помещается в одну часть, поэтому
+    его хеш известен до записи и уже имеющийся blob не загружается вовсе. Большой
+    файл передаётся во временный ключ и копируется в blob, только если такого ещё нет.
+    Если для URL есть запись кэша, запрос делается условным, и на 304 возвращается
+    сохранённый ранее blob без скачивания.
+    """
+    logger.info(f"Starting upload for file {file_name} from {url} for tender {tender_id}")
+    headers = {}
+    if cached and cached.etag:
+        headers["If-None-Match"] = cached.etag
+    if cached and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
+    try:
+        s3_client = await get_s3_client()
+        async with open_download(get_http_session("documents"), url, headers) as response:
+            if response is None:
+                logger.error(f"Не удалось скачать содержимое файла из {url}")
+                return None
+
+            if response.status == 304 and cached:
+                logger.info(f"{file_name} for tender {tender_id} not modified at source, using {cached.s3_url}")
+                return StoredDocument(url=cached.s3_url, content_hash=cached.content_hash, size=cached.size,
+                                      mime_type=cached.mime_type, deduplicated=True, not_modified=True,
+                                      etag=cached.etag, last_modified=cached.last_modified,
+                                      content_length=cached.content_length)
+            if response.status != 200:
+                logger.error(f"Failed to download {url}: HTTP {response.status}")
+                return None
+
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            content_length = response.content_length
+            mime_type = response.content_type
+            s3_key, content_hash, size, deduplicated = await store_stream(s3_client, response.content, mime_type)
+
+        stored = StoredDocument(url=s3_url_for(s3_key), content_hash=content_hash, size=size,
+                                mime_type=mime_type, deduplicated=deduplicated, etag=etag,
+                                last_modified=last_modified, content_length=content_length)
+        if deduplicated:
+            logger.info(f"{file_name} for tender {tender_id} already stored as {s3_key}, upload skipped")
+        else:
+            logger.info(f"Successfully uploaded {file_name} ({size} bytes) to Yandex S3: {stored.url}")
+        return stored
     except Exception as e:
         logger.error(f"Error uploading {file_name} for tender {tender_id}: {str(e)}")
         return None
 
 
+async def upload_to_s3(url: str, file_name: str, tender_id: str) -> str | None:
+    if os.path.isfile(url):
+        stored = await upload_local_file(url, file_name, tender_id)
+    else:
+        stored = await upload_document(url, file_name, tender_id)
+    return stored.url if stored else None
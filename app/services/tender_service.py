@@ -7,16 +7,28 @@ from app.crud.errors import log_tender_error
 from app.services.checklist_validator import validate_tender, validate_documents
 from app.services.notifications import send_telegram_alert
 from app.core.logging_config import logger
-from app.services.s3_uploader import upload_to_s3
+from app.services.s3_uploader import upload_document, StoredDocument
 from app.services.selenium_scraper import scrape_documents
+from app.services.http_scraper import find_document_links
 from app.services.filter_service import apply_filters
-from app.services.ai_service import process_with_ai
+from app.services.ai_service import submit_to_ai, is_ai_accepted
+from app.services.ai_poller import ai_poller
+from app.services.ai_cache import ai_result_cache
 from app.services.bitrix_service import export_to_bitrix
 from app.services.tender_state_machine import TenderStateMachine
 from app.models.tenders import Tender
-from app.crud.documents import save_documents
+from app.crud.documents import save_documents, get_fetch_cache, save_fetch_cache
+from app.crud.scrape_stats import record_scrape
+from app.crud.ai_checks import get_latest_ai_check, finish_ai_check
+from app.models.document_fetch_cache import DocumentFetchCache
+from app.crud.tenders import tender_to_schema
 from app.db.database import AsyncSessionLocal as async_session
-import aiohttp
+from app.core.config import settings
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import asyncio
+import json
+import time
 from aiohttp.client_exceptions import ClientConnectorCertificateError, ClientError
 
 async def update_tender_state(db: AsyncSession, tender: Tender, state: str, tender_id: str):
@@ -26,11 +38,255 @@ async def update_tender_state(db: AsyncSession, tender: Tender, state: str, tend
     await db.commit()
     await db.refresh(tender)
 
-async def process_and_save_tender(tender_data: TenderRequest, type_name: str) -> Tender | None:
-    async with async_session() as db:
-        tender_id = tender_data.id
-        logger.info(f"Starting processing tender {tender_id} of type {type_name}, state: {tender_data.state}")
+async def validate_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    tender_id = db_tender.external_id
+    await sm.start_validating()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    errors = validate_tender(tender_data)
+    doc_errors = validate_documents(tender_data.docs)
+    if errors or doc_errors:
+        await sm.fail_validation()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        error_message = "; ".join(errors + doc_errors)
+        logger.error(f"Validation failed for tender {tender_id}: {error_message}")
+        await log_tender_error(db, tender_id, error_message)
+        await send_telegram_alert(db_tender, f"Ошибка валидации: {error_message}")
+
+# Общий и по-хостовый лимиты одновременных загрузок документов на процесс
+_fetch_slots: asyncio.Semaphore | None = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+def _document_slots(url: str) -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(settings.DOC_FETCH_CONCURRENCY)
+    host = urlparse(url).hostname or ""
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(settings.DOC_FETCH_PER_HOST)
+    return _host_slots[host], _fetch_slots
+
+async def fetch_document(doc: Document, tender_id: str,
+                         cached: DocumentFetchCache | None = None) -> tuple[Document, StoredDocument] | None:
+    """Загружает документ в S3 (условно, если URL уже скачивался); None, если не удалось."""
+    host_slot, fetch_slot = _document_slots(doc.url)
+    # Сначала слот хоста: медленный хост не занимает общие слоты, пока ждёт своей очереди
+    async with host_slot, fetch_slot:
+        logger.debug(f"Processing document {doc.file_name} with URL {doc.url}")
+        try:
+            # Отдельный HEAD не нужен: статус GET отвечает на тот же вопрос
+            stored = await upload_document(doc.url, doc.file_name, tender_id, cached)
+            if not stored:
+                logger.error(f"Failed to upload document {doc.file_name} from {doc.url}, attempting scraping")
+                return None
+            return Document(file_name=doc.file_name, url=stored.url), stored
+        except (ClientConnectorCertificateError, ClientError, Exception) as e:
+            logger.error(f"Failed to fetch document {doc.file_name} from {doc.url}: {str(e)}")
+            return None
+
+async def scrape_documents_http(tender_id: str, link: str) -> list[Document] | None:
+    """Быстрый путь: ссылки из HTML страницы, загрузка напрямую; None, если ничего не вышло."""
+    links = await find_document_links(link)
+    if not links:
+        return None
+    fetched = await asyncio.gather(*(fetch_document(doc, tender_id) for doc in links))
+    return [doc for doc, _ in filter(None, fetched)] or None
+
+async def scrape_stage_documents(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender) -> list[Document] | None:
+    """Скачивает документы через kontur_link, затем через etp_url; None и алерт, если не вышло.
+
+    Для каждой ссылки сначала пробуется разбор HTML без браузера, Selenium
+    запускается только если так документы не нашлись.
+    """
+    tender_id = db_tender.external_id
+    await sm.documents_not_found()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+
+    await sm.start_scraping()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    for source, link in (("kontur_link", db_tender.kontur_link), ("etp_url", db_tender.etp_url)):
+        if not link:
+            logger.info(f"No {source} for tender {tender_id}, skipping")
+            continue
+        logger.info(f"Attempting scraping via {source}: {link}")
+        path, browser_seconds = "http", 0.0
+        scraped_docs = await scrape_documents_http(tender_id, link)
+        if not scraped_docs:
+            started = time.monotonic()
+            original_kontur_link = db_tender.kontur_link
+            db_tender.kontur_link = link
+            scraped_docs = await scrape_documents(db_tender, db)
+            db_tender.kontur_link = original_kontur_link
+            browser_seconds = time.monotonic() - started
+            path = "browser" if scraped_docs else "failed"
+        await record_scrape(db, urlparse(link).hostname or "", path, browser_seconds)
+        if not scraped_docs:
+            logger.info(f"Scraping via {source} failed")
+            continue
+        if await save_documents(db, tender_id, scraped_docs, link):
+            await sm.finish_scraping()
+            await update_tender_state(db, db_tender, sm.state, tender_id)
+            logger.info(f"Scraping via {source} ({path}) successful, {len(scraped_docs)} documents saved for tender {tender_id}")
+            return scraped_docs
+        logger.error(f"Failed to save scraped documents from {source} for tender {tender_id}")
+        await sm.fail_scraping()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        await send_telegram_alert(db_tender, f"Не удалось сохранить документы, скачанные через {source}")
+        return None
+
+    logger.error(f"Scraping failed for tender {tender_id} using both kontur_link and etp_url")
+    await sm.fail_scraping()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    safe_message = f"Не удалось скачать документы через kontur_link ({db_tender.kontur_link}) и etp_url ({db_tender.etp_url})"
+    await send_telegram_alert(db_tender, safe_message)
+    return None
+
+async def fetch_documents_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    tender_id = db_tender.external_id
+    await sm.fetch_documents()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+
+    docs = []
+    seen_urls = set()
+    for doc in tender_data.docs:
+        if doc.url in seen_urls:
+            logger.warning(f"Skipping duplicate document URL: {doc.url}")
+            continue
+        seen_urls.add(doc.url)
+        docs.append(doc)
+
+    # Все документы тендера скачиваются параллельно в пределах лимитов
+    fetch_cache = await get_fetch_cache(db, [doc.url for doc in docs])
+    fetched = await asyncio.gather(*(fetch_document(doc, tender_id, fetch_cache.get(doc.url)) for doc in docs))
+    results = [(source, *result) for source, result in zip(docs, fetched) if result]
+    updated_docs = [doc for _, doc, _ in results]
+
+    if results:
+        # Один пакетный UPDATE на все загруженные документы
+        await db.execute(
+            text("UPDATE documents SET url = :new_url, content_hash = :content_hash, size = :size, mime_type = :mime_type "
+                 "WHERE tender_id = :tender_id AND file_name = :file_name"),
+            [
+                {"new_url": stored.url, "content_hash": stored.content_hash, "size": stored.size,
+                 "mime_type": stored.mime_type, "tender_id": tender_id, "file_name": doc.file_name}
+                for _, doc, stored in results
+            ]
+        )
+        await save_fetch_cache(
+            db, [stored.cache_entry(source.url) for source, _, stored in results if not stored.not_modified],
+            commit=False
+        )
+        await db.commit()
+
+    if len(updated_docs) < len(docs):
+        logger.warning(f"{len(docs) - len(updated_docs)} of {len(docs)} documents failed for tender {tender_id}")
+        scraped_docs = await scrape_stage_documents(db, sm, db_tender)
+        if scraped_docs is None:
+            return
+        updated_docs.extend(scraped_docs)
+
+    if updated_docs:
+        if sm.state == "FETCHING_DOCUMENTS":
+            await sm.save_documents()
+            await update_tender_state(db, db_tender, sm.state, tender_id)
+    else:
+        logger.error(f"No valid documents processed for tender {tender_id}")
+        await sm.documents_not_found()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        safe_message = f"Не удалось обработать документы для тендера {tender_id}"
+        await send_telegram_alert(db_tender, safe_message)
 
+async def filter_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    tender_id = db_tender.external_id
+    await sm.start_filtering()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    if not await apply_filters(db_tender, tender_id, db):
+        await sm.reject_after_filtering()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        logger.info(f"Tender {tender_id} rejected after filtering")
+
+async def ai_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    tender_id = db_tender.external_id
+    await sm.start_ai()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    # Только отправка: результат забирает ai_result_stage, когда он готов
+    if await submit_to_ai(db_tender, db) is None:
+        await sm.reject_after_ai()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        logger.info(f"Tender {tender_id} rejected: documents could not be sent to AI")
+
+async def ai_result_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    """Забирает результат AI; пока его нет, конвейер останавливается на AI_PROCESSING.
+
+    Когда результат придёт, callback или ai_poller поставят тендер в очередь снова.
+    """
+    tender_id = db_tender.external_id
+    ai_check = await get_latest_ai_check(db, tender_id)
+    if ai_check is None:
+        # Процесс упал между переходом в AI_PROCESSING и отправкой
+        ai_check = await submit_to_ai(db_tender, db)
+        if ai_check is None:
+            await sm.reject_after_ai()
+            await update_tender_state(db, db_tender, sm.state, tender_id)
+            logger.info(f"Tender {tender_id} rejected: documents could not be sent to AI")
+            return
+
+    if ai_check.ai_status == "PENDING":
+        waited = (datetime.now(timezone.utc) - ai_check.checked_at).total_seconds()
+        if waited < settings.AI_TASK_TIMEOUT:
+            ai_poller.watch(ai_check.task_id, tender_id, db_tender.type, settings.AI_TASK_TIMEOUT - waited)
+            logger.info(f"Tender {tender_id} waits for AI task {ai_check.task_id}")
+            return
+        logger.error(f"AI task {ai_check.task_id} for tender {tender_id} timed out")
+        await finish_ai_check(db, ai_check.task_id, "TIMEOUT", json.dumps("Task polling timed out"))
+        await db.refresh(ai_check)
+
+    if ai_check.content_hash and not ai_check.from_cache:
+        await ai_result_cache.put(db, ai_check.content_hash, ai_check.ai_status, ai_check.ai_response)
+    if not is_ai_accepted(ai_check):
+        await sm.reject_after_ai()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        logger.info(f"Tender {tender_id} rejected after AI processing")
+        return
+    await sm.prepare_export()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+
+async def export_stage(db: AsyncSession, sm: TenderStateMachine, db_tender: Tender, tender_data: TenderRequest):
+    tender_id = db_tender.external_id
+    if settings.BITRIX_BATCH_EXPORT:
+        # Лид создаст bitrix_exporter в воркере вместе с другими готовыми тендерами
+        logger.info(f"Tender {tender_id} waits for batch export to Bitrix")
+        return
+    await sm.start_exporting()
+    await update_tender_state(db, db_tender, sm.state, tender_id)
+    if await export_to_bitrix(db_tender, db):
+        await sm.complete()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        logger.info(f"Tender {tender_id} successfully completed")
+    else:
+        await sm.fail_export()
+        await update_tender_state(db, db_tender, sm.state, tender_id)
+        logger.error(f"Export failed for tender {tender_id}")
+        await send_telegram_alert(db_tender, "Ошибка экспорта в Bitrix")
+
+# Этап обработки, запускаемый из каждой контрольной точки TenderStateMachine
+PIPELINE_STAGES = {
+    "RECEIVED": validate_stage,
+    "VALIDATING": fetch_documents_stage,
+    "DOCUMENTS_SAVED": filter_stage,
+    "FILTERING": ai_stage,
+    "AI_PROCESSING": ai_result_stage,
+    "READY_FOR_EXPORT": export_stage,
+}
+
+async def process_and_save_tender(tender_id: str, type_name: str | None, tender_data: TenderRequest | None = None,
+                                  final_attempt: bool = True) -> Tender | None:
+    """Проводит тендер по конвейеру, начиная с контрольной точки его сохранённого состояния.
+
+    Без tender_data данные запроса восстанавливаются из базы. Если final_attempt=False,
+    ошибка не переводит тендер в ERROR: состояние остаётся на последней контрольной
+    точке, и повторная попытка продолжит с неё.
+    """
+    async with async_session() as db:
         result = await db.execute(
             select(Tender)
             .options(joinedload(Tender.docs), joinedload(Tender.lots))
@@ -40,157 +296,35 @@ async def process_and_save_tender(tender_data: TenderRequest, type_name: str) ->
         if not db_tender:
             logger.error(f"Tender {tender_id} not found in database")
             return None
+        logger.info(f"Starting processing tender {tender_id} of type {type_name}, state: {db_tender.state}")
 
         sm = TenderStateMachine(db_tender, tender_id)
+        if not sm.rewind_to_checkpoint():
+            logger.info(f"Tender {tender_id} is in final state {db_tender.state}, nothing to process")
+            return db_tender
+        if tender_data is None:
+            tender_data = await tender_to_schema(db_tender, db)
 
         try:
-            # Валидация
-            await sm.start_validating()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            errors = validate_tender(tender_data)
-            doc_errors = validate_documents(tender_data.docs)
-            if errors or doc_errors:
-                await sm.fail_validation()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                error_message = "; ".join(errors + doc_errors)
-                logger.error(f"Validation failed for tender {tender_id}: {error_message}")
-                await log_tender_error(db, tender_id, error_message)
-                await send_telegram_alert(db_tender, f"Ошибка валидации: {error_message}")
-                return None
-
-            # Загрузка документов
-            await sm.fetch_documents()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            updated_docs = []
-            seen_urls = set()
-
-            async with aiohttp.ClientSession() as session:
-                for doc in tender_data.docs:
-                    if doc.url in seen_urls:
-                        logger.warning(f"Skipping duplicate document URL: {doc.url}")
-                        continue
-                    seen_urls.add(doc.url)
-                    logger.debug(f"Processing document {doc.file_name} with URL {doc.url}")
-
-                    try:
-                        async with session.head(doc.url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=10)) as head_response:
-                            if head_response.status == 200:
-                                new_url = await upload_to_s3(doc.url, doc.file_name, tender_id)
-                                if new_url:
-                                    updated_docs.append(Document(file_name=doc.file_name, url=new_url))
-                                    logger.info(f"Successfully uploaded {doc.file_name} to S3: {new_url}")
-                                    # Обновляем URL в базе данных с использованием text()
-                                    await db.execute(
-                                        text("UPDATE documents SET url = :new_url WHERE tender_id = :tender_id AND file_name = :file_name"),
-                                        {"new_url": new_url, "tender_id": tender_id, "file_name": doc.file_name}
-                                    )
-                                    await db.commit()
-                                else:
-                                    logger.error(f"Failed to upload document {doc.file_name} from {doc.url}")
-                                    raise Exception("Upload failed despite accessible URL")
-                            else:
-                                logger.warning(f"Document URL {doc.url} returned status {head_response.status}, attempting scraping")
-                                raise Exception(f"HEAD request failed with status {head_response.status}")
-
-                    except (ClientConnectorCertificateError, ClientError, Exception) as e:
-                        logger.error(f"Failed to fetch document {doc.file_name} from {doc.url}: {str(e)}")
-                        await sm.documents_not_found()
-                        await update_tender_state(db, db_tender, sm.state, tender_id)
-
-                        await sm.start_scraping()
-                        await update_tender_state(db, db_tender, sm.state, tender_id)
-                        logger.info(f"Attempting scraping via kontur_link: {db_tender.kontur_link}")
-                        scraped_docs = await scrape_documents(db_tender, db)
-                        if scraped_docs:
-                            if await save_documents(db, tender_id, scraped_docs, db_tender.kontur_link):
-                                updated_docs.extend(scraped_docs)
-                                await sm.finish_scraping()
-                                await update_tender_state(db, db_tender, sm.state, tender_id)
-                                logger.info(f"Scraping via kontur_link successful, {len(scraped_docs)} documents saved for tender {tender_id}")
-                            else:
-                                logger.error(f"Failed to save scraped documents from kontur_link for tender {tender_id}")
-                                await sm.fail_scraping()
-                                await update_tender_state(db, db_tender, sm.state, tender_id)
-                                await send_telegram_alert(db_tender, "Не удалось сохранить документы, скачанные через kontur_link")
-                                return None
-                        else:
-                            logger.info(f"Scraping via kontur_link failed, attempting via etp_url: {db_tender.etp_url}")
-                            original_kontur_link = db_tender.kontur_link
-                            db_tender.kontur_link = db_tender.etp_url
-                            scraped_docs = await scrape_documents(db_tender, db)
-                            db_tender.kontur_link = original_kontur_link
-                            if scraped_docs:
-                                if await save_documents(db, tender_id, scraped_docs, db_tender.etp_url):
-                                    updated_docs.extend(scraped_docs)
-                                    await sm.finish_scraping()
-                                    await update_tender_state(db, db_tender, sm.state, tender_id)
-                                    logger.info(f"Scraping via etp_url successful, {len(scraped_docs)} documents saved for tender {tender_id}")
-                                else:
-                                    logger.error(f"Failed to save scraped documents from etp_url for tender {tender_id}")
-                                    await sm.fail_scraping()
-                                    await update_tender_state(db, db_tender, sm.state, tender_id)
-                                    await send_telegram_alert(db_tender, "Не удалось сохранить документы, скачанные через etp_url")
-                                    return None
-                            else:
-                                logger.error(f"Scraping failed for tender {tender_id} using both kontur_link and etp_url")
-                                await sm.fail_scraping()
-                                await update_tender_state(db, db_tender, sm.state, tender_id)
-                                safe_message = f"Не удалось скачать документы через kontur_link ({db_tender.kontur_link}) и etp_url ({db_tender.etp_url})"
-                                await send_telegram_alert(db_tender, safe_message)
-                                return None
-
-            if updated_docs:
-                await sm.save_documents()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-            else:
-                logger.error(f"No valid documents processed for tender {tender_id}")
-                await sm.documents_not_found()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                safe_message = f"Не удалось обработать документы для тендера {tender_id}"
-                await send_telegram_alert(db_tender, safe_message)
-                return None
-
-            # Фильтрация
-            await sm.start_filtering()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            if not await apply_filters(db_tender, tender_id, db):
-                await sm.reject_after_filtering()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                logger.info(f"Tender {tender_id} rejected after filtering")
-                return db_tender
-
-            # AI-обработка
-            await sm.start_ai()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            if not await process_with_ai(db_tender, db):
-                await sm.reject_after_ai()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                logger.info(f"Tender {tender_id} rejected after AI processing")
-                return db_tender
-
-            # Экспорт
-            await sm.prepare_export()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            await sm.start_exporting()
-            await update_tender_state(db, db_tender, sm.state, tender_id)
-            if await export_to_bitrix(db_tender, db):
-                await sm.complete()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                logger.info(f"Tender {tender_id} successfully completed")
-            else:
-                await sm.fail_export()
-                await update_tender_state(db, db_tender, sm.state, tender_id)
-                logger.error(f"Export failed for tender {tender_id}")
-                await send_telegram_alert(db_tender, "Ошибка экспорта в Bitrix")
-                return db_tender
+            while sm.state in PIPELINE_STAGES:
+                checkpoint = sm.state
+                await PIPELINE_STAGES[checkpoint](db, sm, db_tender, tender_data)
+                if sm.state == checkpoint:
+                    break
 
             logger.info(f"Tender {tender_id} processing finished, state: {db_tender.state}")
             return db_tender
 
         except Exception as e:
             logger.error(f"Error processing tender {tender_id}: {str(e)}")
+            # После rollback атрибуты db_tender истекают: состояние берём из машины
+            await db.rollback()
+            if not final_attempt:
+                logger.warning(f"Tender {tender_id} failed in state {sm.state}, "
+                               f"will resume from its last saved checkpoint")
+                raise
             await sm.encounter_error()
             await update_tender_state(db, db_tender, sm.state, tender_id)
             safe_message = f"Ошибка обработки тендера {tender_id}: {str(e)}"
             await send_telegram_alert(db_tender, safe_message)
-            raise
\ No newline at end of file
+            raise
@@ -23,6 +23,22 @@ class TenderStateMachine:
         "ERROR"
     ]
 
+    # Контрольные точки: с какого состояния возобновить обработку, прерванную в данном.
+    # Незавершённый этап повторяется целиком; финальных состояний здесь нет.
+    checkpoints = {
+        "RECEIVED": "RECEIVED",
+        "VALIDATING": "RECEIVED",
+        "FETCHING_DOCUMENTS": "VALIDATING",
+        "DOCUMENTS_NOT_FOUND": "VALIDATING",
+        "SCRAPING_DOCUMENTS": "VALIDATING",
+        "DOCUMENTS_SAVED": "DOCUMENTS_SAVED",
+        "FILTERING": "DOCUMENTS_SAVED",
+        # Отправленная задача AI не повторяется: этап AI_PROCESSING только забирает результат
+        "AI_PROCESSING": "AI_PROCESSING",
+        "READY_FOR_EXPORT": "READY_FOR_EXPORT",
+        "EXPORTING": "READY_FOR_EXPORT",
+    }
+
     def __init__(self, tender: Tender, tender_id: str):
         self.tender = tender
         self.tender_id = tender_id
@@ -52,6 +68,14 @@ class TenderStateMachine:
         self.machine.add_transition("fail_export", "EXPORTING", "EXPORT_FAILED")
         self.machine.add_transition("encounter_error", "*", "ERROR")
 
+    def rewind_to_checkpoint(self) -> str | None:
+        """Переводит машину в контрольную точку текущего состояния; None, если обработка завершена."""
+        checkpoint = self.checkpoints.get(self.state)
+        if checkpoint and checkpoint != self.state:
+            logger.info(f"Tender {self.tender_id} resumes from {checkpoint} (was {self.state})")
+            self.machine.set_state(checkpoint, model=self)
+        return checkpoint
+
     async def on_enter_RECEIVED(self, event):
         logger.info(f"Tender {self.tender_id} entered state RECEIVED")
 
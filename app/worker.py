@@ -0,0 +1,135 @@
+"""Воркер очереди обработки тендеров.
+
+Запуск: python -m app.worker [--concurrency N]. Можно запускать несколько процессов:
+задачи разбираются через SELECT ... FOR UPDATE SKIP LOCKED.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+from app.core.config import settings
+from app.core.logging_config import logger
+from app.crud.ai_checks import get_stuck_ai_tenders
+from app.crud.jobs import claim_jobs, complete_job, extend_job_lock, fail_job, enqueue_tender_jobs
+from app.db.database import AsyncSessionLocal
+from app.models.jobs import TenderJob
+from app.schemas.tender_request import TenderRequest
+from app.services.s3_client import init_s3_client, close_s3_client
+from app.services.http_sessions import init_http_sessions, close_http_sessions
+from app.services.browser_pool import browser_pool
+from app.services.ai_poller import ai_poller
+from app.services.bitrix_exporter import bitrix_exporter
+from app.services.filter_tree import filter_stats
+from app.services.tender_service import process_and_save_tender
+
+
+async def heartbeat(job: TenderJob, worker_id: str) -> None:
+    """Продлевает блокировку задачи, пока конвейер работает."""
+    while True:
+        await asyncio.sleep(settings.JOB_VISIBILITY_TIMEOUT / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                if not await extend_job_lock(db, job.id, worker_id):
+                    logger.warning(f"Lost lock on job {job.id} for tender {job.tender_id}")
+        except Exception as e:
+            logger.error(f"Failed to extend lock on job {job.id}: {str(e)}")
+
+
+async def run_job(job: TenderJob, worker_id: str) -> None:
+    logger.info(f"Worker {worker_id} took job {job.id} for tender {job.tender_id}, attempt {job.attempts}")
+    tender_data = TenderRequest(**job.payload) if job.payload else None
+    beat = asyncio.create_task(heartbeat(job, worker_id))
+    try:
+        await process_and_save_tender(job.tender_id, job.type, tender_data,
+                                      final_attempt=job.attempts >= job.max_attempts)
+    except Exception as e:
+        beat.cancel()
+        async with AsyncSessionLocal() as db:
+            await fail_job(db, job, str(e))
+        return
+    beat.cancel()
+    async with AsyncSessionLocal() as db:
+        await complete_job(db, job.id)
+    logger.info(f"Job {job.id} for tender {job.tender_id} done")
+
+
+async def slot(worker_id: str, stop: asyncio.Event) -> None:
+    """Один параллельный конвейер: берёт задачи по одной, пока не получен сигнал остановки."""
+    while not stop.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                jobs = await claim_jobs(db, worker_id, limit=1)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed to claim jobs: {str(e)}")
+            jobs = []
+        if not jobs:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(jobs[0], worker_id)
+
+
+async def ai_sweep(stop: asyncio.Event) -> None:
+    """Ставит в очередь тендеры, застрявшие в AI_PROCESSING: результат есть, а задачи нет,
+    или за PENDING-проверкой после перезапуска никто не следит."""
+    while not stop.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                stuck = await get_stuck_ai_tenders(db, settings.AI_SWEEP_AFTER)
+                if stuck:
+                    await enqueue_tender_jobs(db, [(None, type_name, tender_id) for tender_id, type_name in stuck])
+                    logger.warning(f"Re-enqueued {len(stuck)} tenders stuck in AI_PROCESSING")
+        except Exception as e:
+            logger.error(f"AI sweep failed: {str(e)}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.AI_SWEEP_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def bitrix_export(stop: asyncio.Event) -> None:
+    """Пакетный экспорт в Bitrix тендеров, которые конвейер оставил в READY_FOR_EXPORT."""
+    while not stop.is_set():
+        try:
+            await bitrix_exporter.tick()
+        except Exception as e:
+            logger.error(f"Bitrix batch export failed: {str(e)}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.BITRIX_BATCH_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(concurrency: int) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await init_s3_client()
+    await init_http_sessions()
+    logger.info(f"Worker {worker_id} started with {concurrency} concurrent pipelines")
+    try:
+        # Текущие задачи дорабатываются; незавершённые после остановки заберёт другой воркер
+        loops = [ai_sweep(stop)]
+        if settings.BITRIX_BATCH_EXPORT:
+            loops.append(bitrix_export(stop))
+        await asyncio.gather(*loops, *(slot(f"{worker_id}/{i}", stop) for i in range(concurrency)))
+    finally:
+        await filter_stats.flush(force=True)
+        await ai_poller.close()
+        await browser_pool.close()
+        await close_http_sessions()
+        await close_s3_client()
+    logger.info(f"Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tender pipeline worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,38 @@
+import os
+
+# app.core.config проверяет обязательные переменные при импорте; внешние сервисы в тестах — заглушки
+for name in ("BITRIX_WEBHOOK_URL", "KEPLER_API_TOKEN", "S3_ACCESS_KEY", "S3_SECRET_KEY",
+             "TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("LOG_FILE", os.devnull)
+
+import pytest_asyncio
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+# Все модели регистрируются сразу: мапперы связей настраиваются и в тестах без базы
+import app.models.tenders, app.models.documents, app.models.lots, app.models.jobs  # noqa: F401,E402
+import app.models.ai_checks, app.models.ai_result_cache  # noqa: F401,E402
+import app.models.filters, app.models.filter_stats  # noqa: F401,E402
+from app.models.base import Base  # noqa: E402
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    """Фабрика сессий над SQLite во временном файле со всеми таблицами приложения.
+
+    У каждой сессии своё соединение, как с пулом в приложении: с общим соединением
+    rollback одной сессии откатывал бы незакоммиченные изменения другой.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'kepler.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine)
+    await engine.dispose()
@@ -0,0 +1,140 @@
+import json
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy import select
+from app.api.v1 import routes
+from app.api.v1.endpoints import ai
+from app.core.config import settings
+from app.db.database import get_db
+from app.models.ai_checks import AICheck
+from app.models.jobs import TenderJob
+from app.models.tenders import Tender
+
+TOKEN = "callback-secret"
+
+
+@pytest_asyncio.fixture
+async def client(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "AI_CALLBACK_TOKEN", TOKEN)
+    async with session_factory() as session:
+        session.add(Tender(external_id="T1", title="Тендер", type="44", state="AI_PROCESSING"))
+        session.add(AICheck(tender_id="T1", ai_status="PENDING", task_id="task-1"))
+        await session.commit()
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    app.dependency_overrides[get_db] = override_get_db
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://kepler") as client:
+        yield client
+
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    """Вызовы enqueue_tender_jobs из callback: на SQLite уникальный индекс очереди не частичный
+    и сам гасит повторную вставку, поэтому повторы проверяем по вызовам."""
+    calls = []
+    enqueue = ai.enqueue_tender_jobs
+
+    async def record(db, tenders, *args, **kwargs):
+        calls.append(tenders)
+        await enqueue(db, tenders, *args, **kwargs)
+
+    monkeypatch.setattr(ai, "enqueue_tender_jobs", record)
+    return calls
+
+
+def callback(client, task_id="task-1", status="SUCCESS", result=None, token=TOKEN):
+    headers = {"X-AI-Callback-Token": token} if token is not None else {}
+    return client.post("/v1/ai/callback", json={"task_id": task_id, "status": status, "result": result},
+                       headers=headers)
+
+
+async def stored(session_factory, model, *where):
+    async with session_factory() as session:
+        return list((await session.scalars(select(model).where(*where))).all())
+
+
+@pytest.mark.asyncio
+async def test_callback_saves_result_and_enqueues_tender(client, session_factory, enqueued):
+    response = await callback(client, result={"score": 1})
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "success"}
+    [check] = await stored(session_factory, AICheck, AICheck.task_id == "task-1")
+    assert check.ai_status == "SUCCESS"
+    assert json.loads(check.ai_response) == {"score": 1}
+    assert enqueued == [[(None, "44", "T1")]]
+    assert len(await stored(session_factory, TenderJob, TenderJob.tender_id == "T1")) == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_callback_changes_nothing(client, session_factory, enqueued):
+    assert (await callback(client, result={"score": 1})).json() == {"status": "success"}
+
+    response = await callback(client, status="ERROR", result="late duplicate")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ignored"}
+    [check] = await stored(session_factory, AICheck, AICheck.task_id == "task-1")
+    assert check.ai_status == "SUCCESS"
+    assert json.loads(check.ai_response) == {"score": 1}
+    assert len(enqueued) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", ["wrong", "", None])
+async def test_callback_rejects_bad_token(client, session_factory, enqueued, token):
+    response = await callback(client, token=token)
+
+    assert response.status_code == 401
+    [check] = await stored(session_factory, AICheck, AICheck.task_id == "task-1")
+    assert check.ai_status == "PENDING"
+    assert enqueued == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", ["", None])
+async def test_callback_is_rejected_without_configured_token(client, session_factory, enqueued, monkeypatch,
+                                                             token):
+    monkeypatch.setattr(settings, "AI_CALLBACK_TOKEN", None)
+
+    response = await callback(client, token=token)
+
+    assert response.status_code == 401
+    [check] = await stored(session_factory, AICheck, AICheck.task_id == "task-1")
+    assert check.ai_status == "PENDING"
+    assert enqueued == []
+
+
+def test_callback_url_requires_token(monkeypatch):
+    monkeypatch.setattr(settings, "AI_CALLBACK_URL", "https://kepler.example/v1/ai/callback")
+    monkeypatch.setattr(settings, "AI_CALLBACK_TOKEN", None)
+    with pytest.raises(ValueError, match="AI_CALLBACK_TOKEN"):
+        settings.validate()
+
+    monkeypatch.setattr(settings, "AI_CALLBACK_TOKEN", TOKEN)
+    settings.validate()
+
+
+@pytest.mark.asyncio
+async def test_callback_for_unknown_task_is_404(client, enqueued):
+    response = await callback(client, task_id="task-unknown")
+
+    assert response.status_code == 404
+    assert enqueued == []
+
+
+@pytest.mark.asyncio
+async def test_callback_ignores_non_terminal_status(client, session_factory, enqueued):
+    response = await callback(client, status="PROCESSING")
+
+    assert response.json() == {"status": "ignored"}
+    [check] = await stored(session_factory, AICheck, AICheck.task_id == "task-1")
+    assert check.ai_status == "PENDING"
+    assert enqueued == []
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import socket
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.crud.ai_checks import finish_ai_check
+from app.models.ai_checks import AICheck
+from app.models.jobs import TenderJob
+from app.models.tenders import Tender
+from app.services.ai_poller import AIPoller
+from app.services.http_sessions import close_http_sessions
+
+
+class StubAI:
+    """AI-сервис с /task_status: статусы задач задаёт тест, запросы записываются."""
+
+    def __init__(self):
+        self.statuses: dict[str, list[dict]] = {}
+        self.requests: list[str] = []
+
+    async def task_status(self, request: web.Request) -> web.Response:
+        task_id = request.match_info["task_id"]
+        self.requests.append(task_id)
+        statuses = self.statuses.get(task_id)
+        if statuses is None:
+            return web.json_response({"detail": "not found"}, status=404)
+        # Последний статус повторяется на все следующие запросы
+        return web.json_response(statuses.pop(0) if len(statuses) > 1 else statuses[0])
+
+
+@pytest_asyncio.fixture
+async def stub_ai(monkeypatch):
+    stub = StubAI()
+    app = web.Application()
+    app.router.add_get("/task_status/{task_id}", stub.task_status)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    monkeypatch.setattr(settings, "AI_API_BASE_URL", f"http://127.0.0.1:{sock.getsockname()[1]}")
+    monkeypatch.setattr(settings, "AI_CALLBACK_URL", None)
+    yield stub
+    await close_http_sessions()
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def db(session_factory, monkeypatch):
+    monkeypatch.setattr("app.services.ai_poller.AsyncSessionLocal", session_factory)
+    async with session_factory() as session:
+        session.add(Tender(external_id="T1", title="Тендер", type="44", state="AI_PROCESSING"))
+        session.add_all([AICheck(tender_id="T1", ai_status="PENDING", task_id=f"task-{i}") for i in range(5)])
+        await session.commit()
+    return session_factory
+
+
+async def ai_check(db, task_id: str) -> AICheck:
+    async with db() as session:
+        return await session.scalar(select(AICheck).where(AICheck.task_id == task_id))
+
+
+async def job_count(db) -> int:
+    async with db() as session:
+        return await session.scalar(select(func.count()).select_from(TenderJob))
+
+
+@pytest.mark.asyncio
+async def test_poller_saves_result_and_enqueues_tender(stub_ai, db):
+    stub_ai.statuses["task-0"] = [{"status": "PROCESSING"}, {"status": "SUCCESS", "result": {"score": 1}}]
+    poller = AIPoller(min_interval=0.01, max_interval=0.05, backoff=2, batch_size=10)
+    try:
+        result = await asyncio.wait_for(poller.watch("task-0", "T1", "44"), timeout=5)
+    finally:
+        await poller.close()
+
+    assert result == {"status": "SUCCESS", "result": {"score": 1}}
+    assert stub_ai.requests == ["task-0", "task-0"]
+    check = await ai_check(db, "task-0")
+    assert check.ai_status == "SUCCESS"
+    assert json.loads(check.ai_response) == {"score": 1}
+    assert await job_count(db) == 1
+
+
+@pytest.mark.asyncio
+async def test_poller_backs_off_up_to_max_interval(stub_ai, db):
+    stub_ai.statuses["task-0"] = [{"status": "PROCESSING"}]
+    poller = AIPoller(min_interval=1, max_interval=8, backoff=2, batch_size=10)
+    try:
+        poller.watch("task-0", "T1", "44")
+        entry = poller._pending["task-0"]
+        intervals = []
+        for _ in range(4):
+            await poller._check("task-0")
+            intervals.append(entry.interval)
+        next_check = entry.next_check - asyncio.get_running_loop().time()
+    finally:
+        await poller.close()
+
+    assert intervals == [2, 4, 8, 8]
+    assert 7 < next_check <= 8
+    assert stub_ai.requests == ["task-0"] * 4
+    assert (await ai_check(db, "task-0")).ai_status == "PENDING"
+
+
+@pytest.mark.asyncio
+async def test_poller_checks_at_most_batch_size_tasks_per_tick(stub_ai, db):
+    for i in range(5):
+        stub_ai.statuses[f"task-{i}"] = [{"status": "PROCESSING"}]
+    poller = AIPoller(min_interval=60, max_interval=120, backoff=2, batch_size=2)
+    try:
+        for i in range(5):
+            poller.watch(f"task-{i}", "T1", "44")
+        await asyncio.sleep(0.05)
+        assert stub_ai.requests == []
+        now = asyncio.get_running_loop().time()
+        for i, entry in enumerate(poller._pending.values()):
+            entry.next_check = now - 10 + i
+        await poller._tick()
+        first = list(stub_ai.requests)
+        await poller._tick()
+    finally:
+        await poller.close()
+
+    # Сначала задачи с самым ранним сроком проверки, не больше batch_size за проход
+    assert sorted(first) == ["task-0", "task-1"]
+    assert sorted(stub_ai.requests[2:]) == ["task-2", "task-3"]
+
+
+@pytest.mark.asyncio
+async def test_poller_picks_up_result_written_by_callback(stub_ai, db, monkeypatch):
+    monkeypatch.setattr(settings, "AI_CALLBACK_URL", "http://kepler/v1/ai/callback")
+    stub_ai.statuses["task-0"] = [{"status": "PROCESSING"}]
+    poller = AIPoller(min_interval=0.01, max_interval=60, backoff=2, batch_size=10)
+    try:
+        future = poller.watch("task-0", "T1", "44")
+        await asyncio.sleep(0.05)
+        assert not future.done()
+        async with db() as session:
+            assert await finish_ai_check(session, "task-0", "REJECTED", json.dumps({"reason": "ИНН"}))
+        result = await asyncio.wait_for(future, timeout=5)
+    finally:
+        await poller.close()
+
+    assert result == {"status": "REJECTED", "result": {"reason": "ИНН"}}
+    # При настроенном callback удалённый опрос идёт с max_interval и здесь не успел начаться
+    assert stub_ai.requests == []
+    # Задачу тендера ставит в очередь callback, поллер её не дублирует
+    assert await job_count(db) == 0
+
+
+@pytest.mark.asyncio
+async def test_poller_times_out_pending_task(stub_ai, db):
+    stub_ai.statuses["task-0"] = [{"status": "PROCESSING"}]
+    poller = AIPoller(min_interval=0.01, max_interval=0.02, backoff=2, batch_size=10)
+    try:
+        result = await asyncio.wait_for(poller.watch("task-0", "T1", "44", timeout=0.1), timeout=5)
+    finally:
+        await poller.close()
+
+    assert result["status"] == "TIMEOUT"
+    assert stub_ai.requests
+    assert (await ai_check(db, "task-0")).ai_status == "TIMEOUT"
+    assert await job_count(db) == 1
+    assert poller.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_poller_treats_unknown_task_as_error(stub_ai, db):
+    poller = AIPoller(min_interval=0.01, max_interval=0.02, backoff=2, batch_size=10)
+    try:
+        result = await asyncio.wait_for(poller.watch("task-0", "T1", "44"), timeout=5)
+    finally:
+        await poller.close()
+
+    assert result == {"status": "ERROR", "result": "Task not found"}
+    assert (await ai_check(db, "task-0")).ai_status == "ERROR"
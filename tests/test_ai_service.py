@@ -0,0 +1,112 @@
+import os
+from contextlib import AsyncExitStack
+import pytest
+from app.core.config import settings
+from app.models.documents import Document
+from app.services import ai_service
+from app.services.ai_service import document_urls, load_documents, local_path, open_document, s3_key_for, \
+    select_ai_documents
+
+
+@pytest.fixture(autouse=True)
+def storage(monkeypatch):
+    monkeypatch.setattr(settings, "S3_ENDPOINT_URL", "https://storage.yandexcloud.net")
+    monkeypatch.setattr(settings, "S3_BUCKET_NAME", "kepler")
+    monkeypatch.setattr(settings, "AI_LOCAL_SPOOL_DIR", None)
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / "tender.pdf").write_bytes(b"%PDF spool")
+    (tmp_path / "secret.txt").write_bytes(b"secret")
+    monkeypatch.setattr(settings, "AI_LOCAL_SPOOL_DIR", str(spool))
+    return spool
+
+
+def doc(url: str, file_name: str = "x.txt", **fields) -> Document:
+    return Document(tender_id="T1", file_name=file_name, url=url, **fields)
+
+
+@pytest.mark.parametrize("url", ["/etc/passwd", "file:///etc/passwd"])
+def test_local_files_are_not_read_without_spool(url):
+    assert local_path(url) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url", ["/etc/passwd", "file:///etc/passwd", "ftp://example.org/x.txt"])
+async def test_documents_outside_spool_are_not_read_as_files(url):
+    async with AsyncExitStack() as stack:
+        with pytest.raises(ValueError):
+            await open_document(url, stack)
+        assert await load_documents([doc(url)], stack) == []
+
+
+def test_local_path_is_confined_to_spool(spool, tmp_path):
+    os.symlink(tmp_path / "secret.txt", spool / "link.txt")
+
+    assert local_path(str(spool / "tender.pdf")) == str(spool / "tender.pdf")
+    assert local_path((spool / "tender.pdf").as_uri()) == str(spool / "tender.pdf")
+    assert local_path(str(tmp_path / "secret.txt")) is None
+    assert local_path(f"{spool}/../secret.txt") is None
+    assert local_path(f"file://{spool}/%2E%2E/secret.txt") is None
+    assert local_path(str(spool / "link.txt")) is None
+    assert local_path(str(spool)) is None
+    assert local_path(f"{spool}-other/tender.pdf") is None
+    assert local_path(f"file://evil.example{spool}/tender.pdf") is None
+
+
+@pytest.mark.asyncio
+async def test_load_documents_reads_from_spool(spool, tmp_path):
+    spooled = doc(str(spool / "tender.pdf"), "tender.pdf")
+
+    async with AsyncExitStack() as stack:
+        assert await load_documents([spooled, doc(str(tmp_path / "secret.txt"))], stack) == [(spooled, b"%PDF spool")]
+
+
+@pytest.mark.asyncio
+async def test_load_documents_streams_hashed_documents_and_skips_oversized(spool, monkeypatch):
+    hashed = doc(str(spool / "tender.pdf"), "tender.pdf", content_hash="abc")
+
+    async with AsyncExitStack() as stack:
+        [(loaded, chunks)] = await load_documents([hashed], stack, stream=True)
+        assert loaded is hashed
+        assert b"".join([chunk async for chunk in chunks]) == b"%PDF spool"
+
+        monkeypatch.setattr(settings, "AI_MAX_DOCUMENT_SIZE", 4)
+        assert await load_documents([hashed], stack, stream=True) == []
+
+
+def test_s3_key_requires_own_bucket_prefix():
+    assert s3_key_for("https://storage.yandexcloud.net/kepler/blobs/ab/abc") == "blobs/ab/abc"
+    assert s3_key_for("https://evil.example/?storage.yandexcloud.net") is None
+    assert s3_key_for("https://storage.yandexcloud.net/other/blobs/ab/abc") is None
+    assert s3_key_for("https://storage.yandexcloud.net/kepler/") is None
+
+
+def test_select_ai_documents_takes_only_stored_documents(spool):
+    stored = doc("https://storage.yandexcloud.net/kepler/blobs/ab/abc", content_hash="abc")
+    spooled = doc(str(spool / "tender.pdf"), "tender.pdf")
+    # Скачать не удалось, осталась ссылка клиента; хеш остался от прошлого приёма тендера
+    not_stored = [doc("/etc/passwd"), doc("file:///etc/passwd"), doc("https://example.org/x.txt"),
+                  doc("https://example.org/y.txt", content_hash="abc")]
+
+    assert select_ai_documents([*not_stored, stored, spooled]) == [stored, spooled]
+
+
+@pytest.mark.asyncio
+async def test_document_urls_pass_only_stored_documents(spool, monkeypatch):
+    class StubS3:
+        async def generate_presigned_url(self, operation, Params, ExpiresIn):
+            return f"https://signed/{Params['Key']}"
+
+    async def get_s3_client():
+        return StubS3()
+
+    monkeypatch.setattr(ai_service, "get_s3_client", get_s3_client)
+    docs = [doc("file:///etc/passwd"), doc("https://storage.yandexcloud.net/kepler/blobs/ab/abc", "a.pdf"),
+            doc(str(spool / "tender.pdf"), "tender.pdf"), doc("https://example.org/x.txt")]
+
+    assert await document_urls(docs) == [("a.pdf", "https://signed/blobs/ab/abc"),
+                                         ("tender.pdf", (spool / "tender.pdf").as_uri())]
@@ -0,0 +1,228 @@
+import socket
+from urllib.parse import parse_qsl
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from sqlalchemy import select
+from app.core.config import settings
+from app.models.tenders import Tender
+from app.services.bitrix_exporter import BitrixBatchExporter
+from app.services.bitrix_fields import user_field_cache
+from app.services import bitrix_service
+from app.services.bitrix_service import USER_FIELD_VALUES, call_batch, http_build_query, upload_file_to_bitrix
+from app.services.http_sessions import close_http_sessions, get_http_session
+
+
+class StubBitrix:
+    """Webhook Bitrix24 с batch: ответ на команду задаёт тест, вызовы batch записываются."""
+
+    def __init__(self):
+        self.batches: list[dict[str, str]] = []
+        self.errors: set[str] = set()  # значения команд, на которые вернуть result_error
+        self.fail_calls: set[int] = set()  # номера вызовов batch, на которые ответить 503
+        self.uploads: list[tuple[str, bytes]] = []
+
+    async def batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.batches.append(body["cmd"])
+        if len(self.batches) - 1 in self.fail_calls:
+            return web.json_response({"error": "QUERY_LIMIT_EXCEEDED"}, status=503)
+        result, result_error = {}, {}
+        for key, command in body["cmd"].items():
+            if any(marker in command for marker in self.errors):
+                result_error[key] = {"error": "", "error_description": "Lead validation failed"}
+            else:
+                result[key] = 1000 + len(result)
+        # Пустой словарь PHP отдаёт как []
+        return web.json_response({"result": {"result": result or [], "result_error": result_error or []}})
+
+    async def disk_file_upload(self, request: web.Request) -> web.Response:
+        file = (await request.post())["file"]
+        self.uploads.append((file.filename, file.file.read()))
+        return web.json_response({"result": {"ID": str(len(self.uploads))}})
+
+    async def userfield_list(self, request: web.Request) -> web.Response:
+        fields = [{"ID": str(index), "FIELD_NAME": name, "LIST": [{"VALUE": value} for value in values]}
+                  for index, (name, values) in enumerate(USER_FIELD_VALUES.items())]
+        return web.json_response({"result": fields})
+
+
+@pytest_asyncio.fixture
+async def stub_bitrix(monkeypatch):
+    stub = StubBitrix()
+    app = web.Application()
+    app.router.add_post("/batch", stub.batch)
+    app.router.add_post("/crm.lead.userfield.list", stub.userfield_list)
+    app.router.add_post("/disk.file.upload", stub.disk_file_upload)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    monkeypatch.setattr(settings, "BITRIX_WEBHOOK_URL", f"http://127.0.0.1:{sock.getsockname()[1]}")
+    monkeypatch.setattr(user_field_cache, "_fields", None)
+    yield stub
+    await close_http_sessions()
+    await runner.cleanup()
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    sent = []
+
+    async def send_telegram_alert(tender, message):
+        sent.append(tender.external_id)
+
+    monkeypatch.setattr("app.services.bitrix_exporter.send_telegram_alert", send_telegram_alert)
+    return sent
+
+
+async def ready_tenders(session_factory, monkeypatch, count: int) -> list[str]:
+    monkeypatch.setattr("app.services.bitrix_exporter.AsyncSessionLocal", session_factory)
+    ids = [f"T{index:03}" for index in range(count)]
+    async with session_factory() as session:
+        session.add_all([
+            Tender(external_id=external_id, title=f"Тендер {external_id}", state="READY_FOR_EXPORT", type="44",
+                   initial_price=1000, currency="RUB",
+                   organizer={"shortName": "ООО Заказчик", "phone": f"+7 (495) 000-{external_id}",
+                              "email": f"{external_id}@example.org"})
+            for external_id in ids
+        ])
+        await session.commit()
+    return ids
+
+
+async def states(session_factory) -> dict[str, str]:
+    async with session_factory() as session:
+        return dict((await session.execute(select(Tender.external_id, Tender.state))).all())
+
+
+def lead_params(command: str) -> dict[str, str]:
+    method, query = command.split("?", 1)
+    assert method == "crm.lead.add"
+    return dict(parse_qsl(query))
+
+
+def batch_tender_ids(batch: dict[str, str]) -> list[str]:
+    return [lead_params(command)["fields[UF_CRM_1742609875440]"] for command in batch.values()]
+
+
+def test_http_build_query_encodes_nested_arrays_like_php():
+    query = http_build_query({
+        "fields": {
+            "TITLE": "Насос & задвижка",
+            "PHONE": [{"VALUE": "+7 (495) 000-00-00", "VALUE_TYPE": "WORK"}],
+            "EMAIL": [{"VALUE": "a@example.org", "VALUE_TYPE": "WORK"}, {"VALUE": "b@example.org"}],
+            "OPENED": True,
+            "COMMENTS": None,
+        }
+    })
+
+    assert query == (
+        "fields%5BTITLE%5D=%D0%9D%D0%B0%D1%81%D0%BE%D1%81+%26+%D0%B7%D0%B0%D0%B4%D0%B2%D0%B8%D0%B6%D0%BA%D0%B0"
+        "&fields%5BPHONE%5D%5B0%5D%5BVALUE%5D=%2B7+%28495%29+000-00-00"
+        "&fields%5BPHONE%5D%5B0%5D%5BVALUE_TYPE%5D=WORK"
+        "&fields%5BEMAIL%5D%5B0%5D%5BVALUE%5D=a%40example.org"
+        "&fields%5BEMAIL%5D%5B0%5D%5BVALUE_TYPE%5D=WORK"
+        "&fields%5BEMAIL%5D%5B1%5D%5BVALUE%5D=b%40example.org"
+        "&fields%5BOPENED%5D=1"
+    )
+
+
+@pytest.mark.asyncio
+async def test_call_batch_sends_at_most_50_commands_per_call(stub_bitrix):
+    commands = {f"lead_{index}": f"crm.lead.add?fields%5BTITLE%5D={index}" for index in range(120)}
+
+    results, errors = await call_batch(get_http_session("bitrix"), commands)
+
+    assert [len(batch) for batch in stub_bitrix.batches] == [50, 50, 20]
+    assert [key for batch in stub_bitrix.batches for key in batch] == list(commands)
+    assert set(results) == set(commands)
+    assert errors == {}
+
+
+@pytest.mark.asyncio
+async def test_flush_marks_tenders_with_result_error_as_export_failed(stub_bitrix, session_factory, monkeypatch,
+                                                                      alerts):
+    ids = await ready_tenders(session_factory, monkeypatch, 3)
+    stub_bitrix.errors = {"T001"}
+
+    decided = await BitrixBatchExporter(max_batch=10, max_latency=0).flush()
+
+    assert decided == 3
+    assert await states(session_factory) == {"T000": "COMPLETED", "T001": "EXPORT_FAILED", "T002": "COMPLETED"}
+    assert alerts == ["T001"]
+    [batch] = stub_bitrix.batches
+    assert sorted(batch_tender_ids(batch)) == ids
+    params = {p["fields[UF_CRM_1742609875440]"]: p for p in map(lead_params, batch.values())}
+    assert params["T000"]["fields[PHONE][0][VALUE]"] == "+7 (495) 000-T000"
+    assert params["T000"]["fields[PHONE][0][VALUE_TYPE]"] == "WORK"
+    assert params["T000"]["fields[EMAIL][0][VALUE]"] == "T000@example.org"
+
+
+@pytest.mark.asyncio
+async def test_flush_keeps_tenders_of_undelivered_batch_ready_for_export(stub_bitrix, session_factory, monkeypatch,
+                                                                         alerts):
+    ids = await ready_tenders(session_factory, monkeypatch, 120)
+    stub_bitrix.fail_calls = {1}
+
+    decided = await BitrixBatchExporter(max_batch=120, max_latency=0).flush()
+
+    assert [len(batch) for batch in stub_bitrix.batches] == [50, 50, 20]
+    assert decided == 70
+    undelivered = batch_tender_ids(stub_bitrix.batches[1])
+    expected = {external_id: "COMPLETED" for external_id in ids}
+    expected.update({external_id: "READY_FOR_EXPORT" for external_id in undelivered})
+    assert await states(session_factory) == expected
+    assert alerts == []
+
+    # Следующий сброс забирает оставшиеся тендеры
+    stub_bitrix.fail_calls = set()
+    assert await BitrixBatchExporter(max_batch=120, max_latency=0).flush() == 50
+    assert sorted(batch_tender_ids(stub_bitrix.batches[3])) == sorted(undelivered)
+    assert set((await states(session_factory)).values()) == {"COMPLETED"}
+
+
+class StubS3Body:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self) -> bytes:
+        return self.content
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url", [
+    "https://evil.example/storage.yandexcloud.net/kepler/blobs/ab/abc",
+    "https://storage.yandexcloud.net/other-bucket/blobs/ab/abc",
+])
+async def test_upload_file_to_bitrix_takes_only_own_bucket(stub_bitrix, monkeypatch, url):
+    monkeypatch.setattr(settings, "S3_ENDPOINT_URL", "https://storage.yandexcloud.net")
+    monkeypatch.setattr(settings, "S3_BUCKET_NAME", "kepler")
+    requested = []
+
+    class StubS3:
+        async def get_object(self, Bucket, Key):
+            requested.append((Bucket, Key))
+            return {"Body": StubS3Body(b"%PDF")}
+
+    async def get_s3_client():
+        return StubS3()
+
+    monkeypatch.setattr(bitrix_service, "get_s3_client", get_s3_client)
+    session = get_http_session("bitrix")
+
+    assert await upload_file_to_bitrix(session, url, "T1") is None
+    assert requested == []
+    assert stub_bitrix.uploads == []
+
+    own = "https://storage.yandexcloud.net/kepler/blobs/ab/abc"
+    assert await upload_file_to_bitrix(session, own, "T1", "tender.pdf") == "1"
+    assert requested == [("kepler", "blobs/ab/abc")]
+    assert stub_bitrix.uploads == [("tender.pdf", b"%PDF")]
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+import pytest
+from app.models.filters import Filter
+from app.services.filter_engine import TenderBatch, compile_filter, evaluate_condition
+from app.services.filter_service import check_filter
+
+TENDERS = [
+    {"title": "Поставка насосов Pump-300", "currency": "RUB", "initial_price": Decimal("500.00"),
+     "application_deadline": datetime(2024, 5, 1, tzinfo=timezone.utc), "lots_count": 2,
+     "organizer": {"inn": "7700000000", "okpo": 15, "smb": True, "contacts": {"email": "zakupki@mail.ru"},
+                   "phones": ["1"]}},
+    {"title": "Ремонт кровли", "currency": "USD", "initial_price": Decimal("1000.50"), "lots_count": 1,
+     "organizer": {"inn": "7800000000", "okpo": 5, "smb": False, "contacts": "нет"}},
+    {"title": "PUMP service", "currency": "RUB", "initial_price": Decimal("1.00"), "lots_count": 0,
+     "organizer": {"inn": 7700000000, "okpo": 10.5}},
+    {"title": "Зимнее содержание дорог", "currency": None, "initial_price": None, "lots_count": None,
+     "organizer": None},
+    {"title": "Mixed", "currency": "RUB", "initial_price": Decimal("1"), "lots_count": 3,
+     "organizer": {"inn": None, "smb": 1, "okpo": "15"}},
+    {"title": "Без полей"},
+    {"title": "PUMP service", "currency": "RUB", "initial_price": Decimal("1.0"), "lots_count": 0,
+     "organizer": {"inn": "7700000000", "okpo": float("nan")}},
+]
+
+CONDITIONS = [
+    {"field": "title", "op": "contains", "value": "pump"},
+    {"field": "title", "op": "=", "value": "PUMP service"},
+    {"field": "title", "op": "!=", "value": "PUMP service"},
+    {"field": "title", "op": ">", "value": "P"},
+    {"field": "currency", "op": "!=", "value": "RUB"},
+    {"field": "initial_price", "op": ">", "value": 1000},
+    {"field": "initial_price", "op": "<=", "value": 1000.5},
+    {"field": "initial_price", "op": "=", "value": 1},
+    {"field": "initial_price", "op": "=", "value": True},
+    {"field": "initial_price", "op": "=", "value": 1.0},
+    {"field": "initial_price", "op": "!=", "value": "1"},
+    {"field": "initial_price", "op": "<", "value": "1"},
+    {"field": "initial_price", "op": "contains", "value": "5"},
+    {"field": "application_deadline", "op": "!=", "value": "2024-05-01"},
+    {"field": "organizer.inn", "op": "=", "value": "7700000000"},
+    {"field": "organizer.inn", "op": "=", "value": 7700000000},
+    {"field": "organizer.okpo", "op": ">", "value": 10},
+    {"field": "organizer.okpo", "op": "!=", "value": 15},
+    {"field": "organizer.smb", "op": "=", "value": 1},
+    {"field": "organizer.contacts.email", "op": "contains", "value": "@MAIL"},
+    {"field": "organizer.phones.0", "op": "=", "value": "1"},
+    {"field": "organizer", "op": "=", "value": {"inn": 7700000000, "okpo": 10.5}},
+    {"field": "organizer.phones", "op": "=", "value": ["1"]},
+    {"field": "currency", "op": "!=", "value": ["USD"]},
+    {"field": "lots_count", "op": ">=", "value": 2},
+    {"field": "unknown", "op": "!=", "value": "x"},
+    {"field": "title.sub", "op": "=", "value": "x"},
+    {"field": "title", "op": "~", "value": "x"},
+    {"field": "title", "op": "=", "value": None},
+    {"field": "", "op": "=", "value": "x"},
+    {"AND": []},
+    {"OR": []},
+    {"AND": [{"field": "currency", "op": "=", "value": "RUB"},
+             {"OR": [{"field": "initial_price", "op": "<", "value": 100},
+                     {"field": "organizer.okpo", "op": "=", "value": 15}]}]},
+    {"OR": [{"field": "title", "op": "contains", "value": "pump"},
+            {"AND": [{"field": "organizer.smb", "op": "=", "value": False}]}]},
+]
+
+
+def make_filter(condition) -> Filter:
+    return Filter(id=1, title="Тест", type="44", calculation="condition", priority=1,
+                  condition=json.dumps(condition))
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_compiled_and_batch_predicates_match_evaluate_condition(condition):
+    compiled = compile_filter(make_filter(condition))
+    batch = TenderBatch(TENDERS)
+
+    expected = [evaluate_condition(condition, tender) for tender in TENDERS]
+
+    assert [compiled.matches(tender) for tender in TENDERS] == expected
+    assert batch.unpack(compiled.batch_predicate(batch)) == expected
+
+
+def test_shared_batch_keeps_results_of_every_filter():
+    # Маски листов кэшируются в пакете и переиспользуются другими фильтрами
+    batch = TenderBatch(TENDERS)
+    filters = [compile_filter(make_filter(condition)) for condition in CONDITIONS]
+
+    masks = [batch.unpack(compiled.batch_predicate(batch)) for compiled in filters]
+
+    assert masks == [[evaluate_condition(condition, tender) for tender in TENDERS] for condition in CONDITIONS]
+
+
+def test_empty_batch():
+    batch = TenderBatch([])
+
+    assert batch.unpack(compile_filter(make_filter(CONDITIONS[0])).batch_predicate(batch)) == []
+
+
+def test_check_filter_uses_compiled_filter():
+    condition = CONDITIONS[0]
+
+    assert [check_filter(make_filter(condition), tender) for tender in TENDERS] == \
+        [evaluate_condition(condition, tender) for tender in TENDERS]
+    assert check_filter(Filter(id=1, condition=None), TENDERS[0]) is True
+    assert check_filter(Filter(id=1, condition="{not json"), TENDERS[0]) is False
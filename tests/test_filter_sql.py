@@ -0,0 +1,182 @@
+import json
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload
+from app.core.config import settings
+from app.models.base import Base
+from app.models.filters import Filter
+from app.models.lots import Lot
+from app.models.tenders import Tender
+from app.services.filter_engine import evaluate_condition, tender_to_filter_dict
+from app.services.filter_service import iter_filter_matches
+from app.services.filter_sql import filter_to_sql
+
+TENDER_TYPE = "filter-sql-test"
+
+TENDERS = [
+    dict(external_id="T1", title="Поставка насосов Pump-300", currency="RUB", initial_price=Decimal("500.00"),
+         application_deadline=datetime(2024, 5, 1, tzinfo=timezone.utc),
+         organizer={"inn": "7700000000", "okpo": 15, "smb": True, "contacts": {"email": "zakupki@mail.ru"},
+                    "phones": ["1"]}),
+    dict(external_id="T2", title="Ремонт кровли", currency="USD", initial_price=Decimal("1000.50"),
+         organizer={"inn": "7800000000", "okpo": 5, "smb": False, "contacts": "нет"}),
+    dict(external_id="T3", title="PUMP service", currency="RUB", initial_price=Decimal("1.00"),
+         organizer={"inn": 7700000000, "okpo": 10.5}),
+    dict(external_id="T4", title="Зимнее содержание дорог", currency=None, initial_price=None, organizer=None),
+    dict(external_id="T5", title="Mixed", currency="RUB", initial_price=Decimal("250000.00"),
+         organizer={"inn": None, "smb": 1, "okpo": "15"}),
+]
+LOTS = {"T1": 2, "T2": 1, "T5": 3}
+
+# Условия, которые filter_to_sql переводит в SQL; результат обязан совпасть с evaluate_condition
+TRANSLATABLE = [
+    {"field": "title", "op": "contains", "value": "pump"},
+    {"field": "title", "op": "contains", "value": "насос"},
+    {"field": "title", "op": "=", "value": "Ремонт кровли"},
+    {"field": "title", "op": "!=", "value": "Ремонт кровли"},
+    {"field": "title", "op": ">", "value": "P"},
+    {"field": "title", "op": "<=", "value": "Зимнее"},
+    {"field": "currency", "op": "!=", "value": "RUB"},
+    {"field": "initial_price", "op": ">", "value": 1000},
+    {"field": "initial_price", "op": "<=", "value": 1000.5},
+    {"field": "initial_price", "op": "=", "value": 500},
+    {"field": "initial_price", "op": "!=", "value": 500},
+    {"field": "initial_price", "op": "=", "value": True},
+    {"field": "initial_price", "op": "=", "value": "500"},
+    {"field": "initial_price", "op": "!=", "value": "500"},
+    {"field": "initial_price", "op": "contains", "value": "5"},
+    {"field": "application_deadline", "op": "=", "value": "2024-05-01"},
+    {"field": "application_deadline", "op": "!=", "value": "2024-05-01"},
+    {"field": "organizer.inn", "op": "=", "value": "7700000000"},
+    {"field": "organizer.inn", "op": "!=", "value": "7700000000"},
+    {"field": "organizer.inn", "op": "=", "value": 7700000000},
+    {"field": "organizer.okpo", "op": ">", "value": 10},
+    {"field": "organizer.okpo", "op": ">=", "value": 10.5},
+    {"field": "organizer.smb", "op": "=", "value": True},
+    {"field": "organizer.smb", "op": "!=", "value": 1},
+    {"field": "organizer.contacts.email", "op": "contains", "value": "@MAIL"},
+    {"field": "organizer.phones.0", "op": "=", "value": "1"},
+    {"field": "organizer", "op": "!=", "value": "x"},
+    {"field": "lots_count", "op": ">=", "value": 2},
+    {"field": "lots_count", "op": "=", "value": 0},
+    {"field": "unknown", "op": "!=", "value": "x"},
+    {"field": "title.sub", "op": "=", "value": "x"},
+    {"field": "title", "op": "~", "value": "x"},
+    {"field": "title", "op": "=", "value": None},
+    {"AND": []},
+    {"OR": []},
+    {"AND": [{"field": "currency", "op": "=", "value": "RUB"},
+             {"OR": [{"field": "initial_price", "op": "<", "value": 100},
+                     {"field": "organizer.okpo", "op": "=", "value": 15}]}]},
+]
+
+# Условия, которые нельзя перевести в SQL точно: iter_filter_matches проверяет их в Python
+UNTRANSLATABLE = [
+    {"field": "currency", "op": "!=", "value": ["USD"]},
+    {"field": "organizer", "op": "=", "value": {"inn": "7700000000"}},
+    {"field": "organizer.okpo", "op": "<", "value": float("nan")},
+    {"AND": [{"field": "title", "op": "contains", "value": "pump"}, {"field": "currency", "op": "!=", "value": []}]},
+]
+
+
+def make_filter(condition=None, formula=None) -> Filter:
+    return Filter(id=1, title="Тест", type=TENDER_TYPE, calculation="condition", priority=1,
+                  condition=json.dumps(condition) if condition is not None else None, formula=formula)
+
+
+def add_tenders(session) -> None:
+    for row in TENDERS:
+        session.add(Tender(type=TENDER_TYPE, state="FILTERING", **row))
+        for number in range(LOTS.get(row["external_id"], 0)):
+            session.add(Lot(tender_id=row["external_id"], title=f"Лот {number + 1}"))
+
+
+async def python_matches(session, condition) -> list[str]:
+    """Тендеры, прошедшие условие по evaluate_condition, с загруженными лотами для lots_count."""
+    tenders = (await session.scalars(select(Tender).where(Tender.type == TENDER_TYPE)
+                                     .options(selectinload(Tender.lots)).order_by(Tender.external_id))).all()
+    return [tender.external_id for tender in tenders if evaluate_condition(condition, tender_to_filter_dict(tender))]
+
+
+@pytest_asyncio.fixture
+async def pg_session():
+    """Сессия над PostgreSQL из TEST_POSTGRES_URL; все изменения откатываются после теста."""
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_async_engine(url)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        await conn.run_sync(Base.metadata.create_all)
+        session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+        add_tenders(session)
+        await session.flush()
+        yield session
+        await session.close()
+        await transaction.rollback()
+    await engine.dispose()
+
+
+@pytest.mark.parametrize("condition", TRANSLATABLE)
+def test_condition_is_translated_for_postgresql(condition):
+    expression = filter_to_sql(make_filter(condition))
+
+    assert expression is not None
+    expression.compile(dialect=postgresql.dialect())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("condition", TRANSLATABLE)
+async def test_sql_matches_evaluate_condition(pg_session, condition):
+    expression = filter_to_sql(make_filter(condition))
+
+    found = (await pg_session.scalars(select(Tender.external_id).where(Tender.type == TENDER_TYPE, expression)
+                                      .order_by(Tender.external_id))).all()
+
+    assert list(found) == await python_matches(pg_session, condition)
+
+
+@pytest.mark.parametrize("condition", UNTRANSLATABLE + [{"AND": "title"}, {"field": ["title"], "op": "=", "value": "x"}])
+def test_untranslatable_condition_gives_none(condition):
+    assert filter_to_sql(make_filter(condition)) is None
+
+
+def test_filter_without_sql_translation():
+    assert filter_to_sql(make_filter({"field": "title", "op": "=", "value": "x"}, formula="lots_count")) is None
+    assert filter_to_sql(make_filter()) is not None
+    assert str(filter_to_sql(Filter(id=1, condition="{not json"))) == "false"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("condition", UNTRANSLATABLE)
+async def test_iter_filter_matches_falls_back_to_python(session_factory, monkeypatch, condition):
+    # Страница меньше числа тендеров: проверяем и переход по ключу external_id
+    monkeypatch.setattr(settings, "FILTER_MATCHES_PAGE_SIZE", 2)
+    async with session_factory() as session:
+        add_tenders(session)
+        await session.commit()
+
+    async with session_factory() as session:
+        found = [tender.external_id async for tender in iter_filter_matches(session, make_filter(condition))]
+
+        assert found == await python_matches(session, condition)
+
+
+@pytest.mark.asyncio
+async def test_iter_filter_matches_evaluates_formula_with_loaded_lots(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "FILTER_MATCHES_PAGE_SIZE", 2)
+    async with session_factory() as session:
+        add_tenders(session)
+        await session.commit()
+
+    async with session_factory() as session:
+        filter_obj = make_filter({"field": "currency", "op": "=", "value": "RUB"}, formula="lots_count >= 2")
+        found = [tender.external_id async for tender in iter_filter_matches(session, filter_obj, limit=5)]
+
+    assert found == ["T1", "T5"]
@@ -0,0 +1,81 @@
+import json
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from app.models.filter_stats import FilterStat
+from app.models.filters import Filter
+from app.models.tenders import Tender
+from app.services import filter_tree
+from app.services.filter_engine import filter_cache
+from app.services.filter_service import apply_filters
+from app.services.filter_tree import FilterStats, filter_stats
+
+
+@pytest_asyncio.fixture
+async def db(session_factory, monkeypatch):
+    monkeypatch.setattr(filter_tree, "AsyncSessionLocal", session_factory)
+    filter_cache.invalidate()
+    yield session_factory
+    filter_cache.invalidate()
+
+
+async def saved_stats(db) -> dict[int, tuple[int, int, int]]:
+    async with db() as session:
+        rows = (await session.scalars(select(FilterStat))).all()
+        return {row.filter_id: (row.evaluations, row.matches, row.passes) for row in rows}
+
+
+def failing_record(calls: list):
+    async def record_filter_stats(db, deltas, commit=True):
+        calls.append(dict(deltas))
+        raise RuntimeError("filter_stats is locked")
+    return record_filter_stats
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_stats_in_own_session(db):
+    stats = FilterStats(flush_interval=0)
+    stats.record(1, matched=True, passed=True, elapsed_ns=100)
+    stats.record(1, matched=False, passed=False, elapsed_ns=100)
+
+    await stats.flush()
+
+    assert await saved_stats(db) == {1: (2, 1, 1)}
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_increments_for_next_flush(db, monkeypatch):
+    stats = FilterStats(flush_interval=0)
+    calls = []
+    monkeypatch.setattr(filter_tree, "record_filter_stats", failing_record(calls))
+    stats.record(1, matched=True, passed=True, elapsed_ns=100)
+
+    await stats.flush()
+    stats.record(1, matched=True, passed=False, elapsed_ns=100)
+    monkeypatch.undo()
+    monkeypatch.setattr(filter_tree, "AsyncSessionLocal", db)
+    await stats.flush()
+
+    assert calls == [{1: [1, 1, 1, 100]}]
+    assert await saved_stats(db) == {1: (2, 2, 1)}
+
+
+@pytest.mark.asyncio
+async def test_failed_stats_flush_does_not_touch_pipeline_session(db, monkeypatch):
+    monkeypatch.setattr(filter_stats, "flush_interval", 0)
+    monkeypatch.setattr(filter_tree, "record_filter_stats", failing_record([]))
+    async with db() as session:
+        session.add(Filter(title="Насосы", type="stats-test", calculation="condition", priority=1, success_action=1,
+                           condition=json.dumps({"field": "title", "op": "contains", "value": "насос"})))
+        session.add(Tender(external_id="T1", title="Поставка насоса", type="stats-test", state="FILTERING"))
+        await session.commit()
+
+    async with db() as session:
+        tender = await session.scalar(select(Tender).where(Tender.external_id == "T1"))
+        tender.status = "filtered"
+
+        assert await apply_filters(tender, "T1", session) is True
+        # Сессия конвейера не откатана и не закоммичена: тендер читается без ленивой загрузки
+        assert tender.state == "FILTERING"
+        assert tender.status == "filtered"
+        assert session.in_transaction()
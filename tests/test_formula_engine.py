@@ -0,0 +1,42 @@
+import time
+import pytest
+from app.services.formula_engine import FormulaError, compile_formula
+
+
+def evaluate(source: str, **data):
+    return compile_formula(source, data).evaluate(data)
+
+
+def test_round_with_bounded_digits():
+    assert evaluate("round(price, 2)", price=1.23456) == 1.23
+    assert evaluate("round(price, -3)", price=123456) == 123000
+    assert evaluate("round(price)", price=2.6) == 3
+
+
+@pytest.mark.parametrize("source", ["round(1, -10**7)", "round(1, -10**9)", "round(1, 33)", "round(1, 0.5)"])
+def test_round_rejects_unbounded_digits(source):
+    started = time.perf_counter()
+    assert evaluate(source) is None
+    assert time.perf_counter() - started < 0.1
+
+
+def test_private_attributes_are_rejected():
+    with pytest.raises(FormulaError):
+        compile_formula("price.__class__", ["price"])
+
+
+def test_modulo_of_numbers():
+    assert evaluate("price % 1000", price=123456) == 456
+    assert evaluate("price % 2.5", price=7.5) == 0
+
+
+@pytest.mark.parametrize("source, data", [
+    ('"%*d" % (200000000, 1)', {}),
+    ('"%.*f" % (100000000, 1.0)', {}),
+    ("title % price", {"title": "%s", "price": 1}),
+    ("price % title", {"title": "%s", "price": 1}),
+])
+def test_modulo_rejects_string_formatting(source, data):
+    started = time.perf_counter()
+    assert evaluate(source, **data) is None
+    assert time.perf_counter() - started < 0.1
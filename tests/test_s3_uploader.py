@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import socket
+import tracemalloc
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from botocore.exceptions import ClientError
+from app.core.config import settings
+from app.models.document_fetch_cache import DocumentFetchCache
+from app.services import s3_uploader
+from app.services.http_sessions import close_http_sessions, get_http_session
+from app.services.s3_uploader import MIN_PART_SIZE, blob_key, s3_url_for, stream_to_s3, upload_document
+
+PART_SIZE = MIN_PART_SIZE
+PATTERN = bytes(range(256)) * 256
+
+
+class PatternStream:
+    """Источник size байт, который отдаёт данные кусками по 64 КБ и сам ничего не копит."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+
+    async def read(self, n: int) -> bytes:
+        n = min(n, len(PATTERN), self.size - self.position)
+        self.position += n
+        await asyncio.sleep(0)
+        return PATTERN[:n]
+
+
+def expected_part_hashes(size: int) -> list[str]:
+    hashes = []
+    for start in range(0, size, PART_SIZE):
+        digest = hashlib.sha256()
+        remaining = min(PART_SIZE, size - start)
+        while remaining:
+            piece = PATTERN[:min(remaining, len(PATTERN))]
+            digest.update(piece)
+            remaining -= len(piece)
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+class StubS3:
+    """Multipart API S3 в памяти: от частей хранит только sha256, чтобы не влиять на замер памяти.
+
+    objects — ключи записанных объектов; для multipart вместо хеша хранится "multipart".
+    """
+
+    def __init__(self, fail_on_part: int | None = None):
+        self.fail_on_part = fail_on_part
+        self.parts: dict[int, str] = {}
+        self.objects: dict[str, str] = {}
+        self.completed = None
+        self.aborted = []
+        self.deleted = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {"UploadId": "upload-1"}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if PartNumber == self.fail_on_part:
+                raise ConnectionError("upload failed")
+            self.parts[PartNumber] = hashlib.sha256(Body).hexdigest()
+            return {"ETag": f"etag-{PartNumber}"}
+        finally:
+            self.in_flight -= 1
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+        self.objects[Key] = "multipart"
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        self.parts[1] = self.objects[Key] = hashlib.sha256(Body).hexdigest()
+
+    async def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    async def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    async def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture(autouse=True)
+def part_settings(monkeypatch):
+    monkeypatch.setattr(settings, "S3_PART_SIZE", PART_SIZE)
+    monkeypatch.setattr(settings, "S3_MAX_PARTS_IN_FLIGHT", 2)
+
+
+@pytest.mark.asyncio
+async def test_stream_to_s3_memory_is_bounded_by_parts_in_flight():
+    size = PART_SIZE * 8 + 12345
+    s3 = StubS3()
+    stream = PatternStream(size)
+
+    tracemalloc.start()
+    try:
+        total = await stream_to_s3(s3, stream, "staging/test")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert total == size
+    assert [part["PartNumber"] for part in s3.completed] == list(range(1, 10))
+    assert [s3.parts[number] for number in range(1, 10)] == expected_part_hashes(size)
+    assert s3.max_in_flight <= settings.S3_MAX_PARTS_IN_FLIGHT
+    # Файл в 8 с лишним частей, а в памяти не больше S3_MAX_PARTS_IN_FLIGHT частей и мелочи на чтение
+    assert peak <= PART_SIZE * settings.S3_MAX_PARTS_IN_FLIGHT + 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_stream_to_s3_aborts_multipart_upload_on_failure():
+    s3 = StubS3(fail_on_part=3)
+
+    with pytest.raises(ConnectionError):
+        await stream_to_s3(s3, PatternStream(PART_SIZE * 6), "staging/test")
+
+    assert s3.aborted == ["upload-1"]
+    assert s3.completed is None
+    assert s3.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_to_s3_puts_small_file_in_one_request():
+    s3 = StubS3()
+
+    assert await stream_to_s3(s3, PatternStream(1000), "staging/test") == 1000
+    assert s3.parts == {1: expected_part_hashes(1000)[0]}
+    assert s3.completed is None
+
+
+class StubSource:
+    """Источник документов: обычные файлы с ETag и Google Drive со страницей подтверждения."""
+
+    def __init__(self):
+        self.files: dict[str, int] = {}  # имя -> размер, содержимое — PATTERN по кругу
+        self.requests: list[str] = []
+        self.confirm_token = "AbC123"
+
+    async def write_file(self, request: web.Request, size: int) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"ETag": f'"{size}"', "Content-Type": "application/pdf"})
+        response.content_length = size
+        await response.prepare(request)
+        for start in range(0, size, len(PATTERN)):
+            await response.write(PATTERN[:min(len(PATTERN), size - start)])
+        await response.write_eof()
+        return response
+
+    async def file(self, request: web.Request) -> web.StreamResponse:
+        self.requests.append(str(request.rel_url))
+        size = self.files[request.match_info["name"]]
+        if request.headers.get("If-None-Match") == f'"{size}"':
+            return web.Response(status=304)
+        return await self.write_file(request, size)
+
+    async def drive(self, request: web.Request) -> web.StreamResponse:
+        self.requests.append(str(request.rel_url))
+        name = request.query["id"]
+        if name.startswith("large") and request.query.get("confirm") != self.confirm_token:
+            page = f'<a href="/uc?export=download&amp;confirm={self.confirm_token}&amp;id={name}">Download</a>'
+            return web.Response(text=page if self.confirm_token else "quota exceeded", content_type="text/html")
+        return await self.write_file(request, self.files[name])
+
+
+class RedirectingSession:
+    """Сессия documents, у которой запросы к drive.google.com уходят на заглушку."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def get(self, url: str, **kwargs):
+        return get_http_session("documents").get(url.replace("https://drive.google.com", self.base_url), **kwargs)
+
+
+@pytest_asyncio.fixture
+async def source(monkeypatch):
+    stub = StubSource()
+    app = web.Application()
+    app.router.add_get("/files/{name}", stub.file)
+    app.router.add_get("/uc", stub.drive)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    stub.base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    monkeypatch.setattr(s3_uploader, "get_http_session", lambda name: RedirectingSession(stub.base_url))
+    yield stub
+    await close_http_sessions()
+    await runner.cleanup()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    stub = StubS3()
+
+    async def get_s3_client():
+        return stub
+
+    monkeypatch.setattr(s3_uploader, "get_s3_client", get_s3_client)
+    return stub
+
+
+def content_hash(size: int) -> str:
+    digest = hashlib.sha256()
+    for start in range(0, size, len(PATTERN)):
+        digest.update(PATTERN[:min(len(PATTERN), size - start)])
+    return digest.hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_upload_document_stores_small_file_under_content_hash(source, s3):
+    source.files["small.pdf"] = 100_000
+
+    stored = await upload_document(f"{source.base_url}/files/small.pdf", "small.pdf", "T1")
+
+    key = blob_key(content_hash(100_000))
+    assert stored.url == s3_url_for(key)
+    assert (stored.content_hash, stored.size, stored.deduplicated) == (content_hash(100_000), 100_000, False)
+    assert (stored.etag, stored.content_length, stored.mime_type) == ('"100000"', 100_000, "application/pdf")
+    assert s3.objects == {key: content_hash(100_000)}
+
+
+@pytest.mark.asyncio
+async def test_upload_document_skips_small_file_already_stored(source, s3):
+    source.files["small.pdf"] = 100_000
+    key = blob_key(content_hash(100_000))
+    s3.objects[key] = "stored earlier"
+
+    stored = await upload_document(f"{source.base_url}/files/small.pdf", "small.pdf", "T1")
+
+    assert stored.deduplicated is True
+    assert s3.objects == {key: "stored earlier"}
+
+
+@pytest.mark.asyncio
+async def test_upload_document_streams_large_file_through_staging(source, s3):
+    size = PART_SIZE * 4 + 777
+    source.files["large.pdf"] = size
+
+    tracemalloc.start()
+    try:
+        stored = await upload_document(f"{source.base_url}/files/large.pdf", "large.pdf", "T1")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    key = blob_key(content_hash(size))
+    assert (stored.url, stored.size, stored.deduplicated) == (s3_url_for(key), size, False)
+    assert [part["PartNumber"] for part in s3.completed] == [1, 2, 3, 4, 5]
+    [staging] = s3.deleted
+    assert staging.startswith("staging/")
+    assert s3.objects == {key: "multipart"}
+    # Скачивание, хеширование и загрузка частями держат в памяти части в полёте, а не файл
+    assert peak <= PART_SIZE * settings.S3_MAX_PARTS_IN_FLIGHT + 2 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_upload_document_returns_cached_blob_when_not_modified(source, s3):
+    source.files["small.pdf"] = 100_000
+    url = f"{source.base_url}/files/small.pdf"
+    cached = DocumentFetchCache(url=url, etag='"100000"', content_hash="abc", size=100_000,
+                                mime_type="application/pdf", s3_url=s3_url_for(blob_key("abc")))
+
+    stored = await upload_document(url, "small.pdf", "T1", cached)
+
+    assert stored.not_modified is True
+    assert (stored.url, stored.content_hash) == (cached.s3_url, "abc")
+    assert s3.objects == {}
+
+
+@pytest.mark.asyncio
+async def test_upload_document_downloads_small_google_drive_file_directly(source, s3):
+    source.files["small1"] = 1000
+
+    stored = await upload_document("https://drive.google.com/file/d/small1/view", "doc.pdf", "T1")
+
+    assert stored.content_hash == content_hash(1000)
+    assert source.requests == ["/uc?export=download&id=small1"]
+
+
+@pytest.mark.asyncio
+async def test_upload_document_follows_google_drive_confirmation(source, s3):
+    size = PART_SIZE + 5000
+    source.files["large1"] = size
+
+    stored = await upload_document("https://drive.google.com/file/d/large1/view?usp=sharing", "doc.pdf", "T1")
+
+    assert (stored.content_hash, stored.size) == (content_hash(size), size)
+    assert source.requests == ["/uc?export=download&id=large1", "/uc?export=download&id=large1&confirm=AbC123"]
+    assert s3.objects == {blob_key(content_hash(size)): "multipart"}
+
+
+@pytest.mark.asyncio
+async def test_upload_document_fails_without_google_drive_confirmation_token(source, s3):
+    source.files["large1"] = PART_SIZE + 5000
+    source.confirm_token = ""
+
+    assert await upload_document("https://drive.google.com/file/d/large1/view", "doc.pdf", "T1") is None
+    assert source.requests == ["/uc?export=download&id=large1"]
+    assert s3.objects == {}
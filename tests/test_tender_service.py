@@ -0,0 +1,65 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from app.models.tenders import Tender
+from app.services import tender_service
+from app.services.tender_service import PIPELINE_STAGES, process_and_save_tender, update_tender_state
+
+
+@pytest_asyncio.fixture
+async def db(session_factory, monkeypatch):
+    monkeypatch.setattr(tender_service, "async_session", session_factory)
+    async with session_factory() as session:
+        session.add(Tender(external_id="T1", title="Тендер", type="44", state="DOCUMENTS_SAVED",
+                           organizer={"inn": "7700000000"}))
+        await session.commit()
+    return session_factory
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    sent = []
+
+    async def send_telegram_alert(tender, message):
+        sent.append((tender.external_id, tender.state, message))
+
+    monkeypatch.setattr(tender_service, "send_telegram_alert", send_telegram_alert)
+    return sent
+
+
+@pytest.fixture
+def failing_filter_stage(monkeypatch):
+    """Этап фильтрации, который сохраняет FILTERING и падает посреди работы."""
+
+    async def stage(db, sm, db_tender, tender_data):
+        await sm.start_filtering()
+        await update_tender_state(db, db_tender, sm.state, db_tender.external_id)
+        db_tender.status = "half-done"
+        raise RuntimeError("filter service unavailable")
+
+    monkeypatch.setitem(PIPELINE_STAGES, "DOCUMENTS_SAVED", stage)
+
+
+async def tender_row(db) -> Tender:
+    async with db() as session:
+        return await session.scalar(select(Tender).where(Tender.external_id == "T1"))
+
+
+@pytest.mark.asyncio
+async def test_retryable_failure_reraises_original_error_and_keeps_checkpoint(db, alerts, failing_filter_stage):
+    with pytest.raises(RuntimeError, match="filter service unavailable"):
+        await process_and_save_tender("T1", "44", final_attempt=False)
+
+    tender = await tender_row(db)
+    assert tender.state == "FILTERING"
+    assert tender.status != "half-done"
+    assert alerts == []
+
+
+@pytest.mark.asyncio
+async def test_final_failure_moves_tender_to_error(db, alerts, failing_filter_stage):
+    with pytest.raises(RuntimeError, match="filter service unavailable"):
+        await process_and_save_tender("T1", "44", final_attempt=True)
+
+    assert (await tender_row(db)).state == "ERROR"
+    assert alerts == [("T1", "ERROR", "Ошибка обработки тендера T1: filter service unavailable")]